@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """Token buckets per (client, route), kept in a bounded LRU.
+    
+    Each bucket is just [tokens, last_refill]; refills are computed lazily
+    when the bucket is next used. When `max_buckets` is reached the least
+    recently used bucket is evicted; an evicted client simply starts again
+    with a full bucket, so eviction can only ever be lenient.
+    """
+    
+    def __init__(self, rate, burst, route_limits=None, max_buckets=10000,
+                 clock=time.monotonic):
+        self.default_limit = (rate, burst)
+        self.route_limits = route_limits or {}
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+    
+    def acquire(self, client, route):
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        rate, burst = self.route_limits.get(route, self.default_limit)
+        key = (client, route)
+        now = self.clock()
+        
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0
+            self.limited += 1
+            return (1 - bucket[0]) / rate
+    
+    def get_counters(self):
+        """Get limiter counters"""
+        return {
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'evicted': self.evicted,
+            'buckets': len(self._buckets)
+        }
+
+
+class LoadShedder:
+    """Rejects requests up front once their expected queueing delay is too long.
+    
+    The wait is estimated as the requests already in flight in this
+    process times a moving average of service time, which catches
+    backlogs in threaded workers. With `trust_request_start`, the time
+    since a front proxy stamped X-Request-Start is also taken into
+    account, and the longer of the two wins. Only enable it when the
+    proxy overwrites any X-Request-Start the client sent: otherwise a
+    client could claim a wait of its choosing.
+    """
+    
+    def __init__(self, budget, smoothing=0.1, trust_request_start=False, clock=time.monotonic,
+                 wall_clock=time.time):
+        self.budget = budget
+        self.smoothing = smoothing
+        self.trust_request_start = trust_request_start
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.service_time = 0.0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        
+        self.admitted = 0
+        self.shed = 0
+    
+    def estimate_wait(self, request_start=None):
+        """Seconds this request has waited, or is expected to wait, before service"""
+        estimate = self.in_flight * self.service_time
+        if request_start is not None and self.trust_request_start:
+            return max(estimate, self.wall_clock() - request_start)
+        return estimate
+    
+    def admit(self, request_start=None):
+        """Start a request; returns 0 if admitted, else a Retry-After in seconds"""
+        wait = self.estimate_wait(request_start)
+        with self._lock:
+            if wait > self.budget:
+                self.shed += 1
+                return max(1, math.ceil(wait))
+            self.in_flight += 1
+            self.admitted += 1
+        return 0
+    
+    def finish(self, duration):
+        """End an admitted request and fold its duration into the average"""
+        with self._lock:
+            self.in_flight -= 1
+            self.service_time += self.smoothing * (duration - self.service_time)
+    
+    def get_counters(self):
+        """Get shedder counters"""
+        return {
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'in_flight': self.in_flight,
+            'service_time_seconds': round(self.service_time, 6)
+        }
+
+
+def parse_request_start(header):
+    """Parse an X-Request-Start header ("t=<epoch>" in s, ms or us) into seconds"""
+    if not header:
+        return None
+    try:
+        value = float(header.removeprefix('t='))
+    except ValueError:
+        return None
+    # Proxies disagree on units; scale ms and us down to a plausible epoch
+    while value > 1e11:
+        value /= 1e3
+    return value
+
+
+def parse_route_limits(spec):
+    """Parse '/route=rate:burst,...' into a dict of per-route limits"""
+    limits = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        route, _, limit = item.partition('=')
+        rate, _, burst = limit.partition(':')
+        try:
+            rate, burst = float(rate), float(burst or rate)
+        except ValueError:
+            rate = 0
+        if rate > 0 and burst >= 1:
+            limits[route.strip()] = (rate, burst)
+        else:
+            print(f"Ignoring invalid rate limit: {item}")
+    return limits
@@ -0,0 +1,111 @@
+import gzip
+import mimetypes
+import os
+import re
+from .compression import COMPRESSIBLE
+from .responses import body_digest
+
+
+# static/ sits next to the app package both in the repo and in the image
+DEFAULT_STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     'static')
+
+# Fingerprinted URLs change with their content, so caches may keep them
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# /static/... references inside HTML attributes or CSS url()
+STATIC_REFERENCE = re.compile(r'''(?<=["'(])/static/([^"')?#\s]+)''')
+
+
+class Asset:
+    """One static file, held in memory with its gzipped variant"""
+    
+    __slots__ = ('body', 'gzip_body', 'etag', 'mimetype', 'cache_control')
+    
+    def __init__(self, body, mimetype, cache_control):
+        self.body = body
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = f'{body_digest(body):016x}'
+        self.gzip_body = None
+        if COMPRESSIBLE.match(mimetype):
+            # mtime=0 keeps the output, and so its ETag, stable across restarts
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+    
+    def immutable(self):
+        """Copy of this asset, sharing its bodies, that caches can keep forever"""
+        copy = object.__new__(Asset)
+        for slot in self.__slots__:
+            setattr(copy, slot, getattr(self, slot))
+        copy.cache_control = IMMUTABLE
+        return copy
+    
+    def variant(self, accepts_gzip):
+        """Get the (body, etag, content encoding) to send"""
+        if accepts_gzip and self.gzip_body is not None:
+            # Each encoding is a different representation, so it gets its own ETag
+            return self.gzip_body, self.etag + '-gz', 'gzip'
+        return self.body, self.etag, None
+
+
+class AssetBundle:
+    """Every file under a static folder, loaded, fingerprinted and compressed once.
+    
+    Files other than HTML are also published under a fingerprinted name
+    (style.css -> style.<hash>.css) that can be cached forever, since a
+    change to the file changes its URL. References to them in HTML pages
+    are rewritten to those URLs; the pages themselves keep their names
+    and are revalidated with their ETag. Requests are then answered from
+    memory without touching the filesystem.
+    """
+    
+    def __init__(self, folder=DEFAULT_STATIC_FOLDER, url_prefix='/static/'):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.assets = {}
+        self.urls = {}
+        
+        files = {}
+        if folder and os.path.isdir(folder):
+            for directory, _, names in os.walk(folder):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    with open(path, 'rb') as f:
+                        files[os.path.relpath(path, folder).replace(os.sep, '/')] = f.read()
+        
+        pages = []
+        for name, body in sorted(files.items()):
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if mimetype == 'text/html':
+                pages.append((name, body))
+                continue
+            asset = self.assets[name] = Asset(body, mimetype, 'no-cache')
+            stem, extension = os.path.splitext(name)
+            fingerprinted = f'{stem}.{asset.etag[:10]}{extension}'
+            self.assets[fingerprinted] = asset.immutable()
+            self.urls[name] = url_prefix + fingerprinted
+        
+        for name, body in pages:
+            self.assets[name] = Asset(self.rewrite(body), 'text/html', 'no-cache')
+    
+    def rewrite(self, page):
+        """Point /static/ references in a page at the fingerprinted URLs"""
+        def fingerprinted(match):
+            return self.urls.get(match.group(1), match.group(0))
+        return STATIC_REFERENCE.sub(fingerprinted, page.decode('utf-8')).encode('utf-8')
+    
+    def get(self, name):
+        """Get an asset by its path under the folder, or None"""
+        return self.assets.get(name)
+    
+    def url(self, name):
+        """Get the fingerprinted URL of an asset"""
+        return self.urls.get(name, self.url_prefix + name)
+    
+    def nbytes(self):
+        """Bytes held by asset bodies and their compressed variants"""
+        # Fingerprinted copies share their bodies with the original
+        unique = {id(asset.body): asset for asset in self.assets.values()}
+        return sum(len(asset.body) + len(asset.gzip_body or b'') for asset in unique.values())
@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+import zlib
+
+
+# Text-like types worth compressing; images, fonts and archives already are
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|x-ndjson|xml)|image/svg)')
+
+# zlib wbits for each content coding: gzip framing, or the zlib format
+# that HTTP calls "deflate"
+ENCODINGS = {'gzip': 31, 'deflate': 15}
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing responses the client accepts compressed.
+    
+    Responses are skipped when they are already encoded, not a text-like
+    type, marked no-transform, bodiless, or declare a Content-Length below
+    `min_size`. Responses without a Content-Length are streams, and are
+    compressed chunk by chunk as the app yields them, so nothing is ever
+    held in memory beyond zlib's own window. Bytes in and out and the CPU
+    time spent compressing are counted for /metrics.
+    """
+    
+    def __init__(self, app, min_size=1024, level=6):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self._lock = threading.Lock()
+        
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+    
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+        
+        chosen = []
+        
+        def compressing_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                chosen.append(encoding)
+                headers = _compressed_headers(headers, encoding)
+            return start_response(status, headers, exc_info)
+        
+        result = self.app(environ, compressing_start_response)
+        if not chosen:
+            with self._lock:
+                self.skipped += 1
+            return result
+        return self._compress(result, encoding)
+    
+    def _should_compress(self, status, headers):
+        """Decide from the status line and headers whether to compress"""
+        code = int(status[:3])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        fields = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in fields or 'no-transform' in fields.get('cache-control', ''):
+            return False
+        if not COMPRESSIBLE.match(fields.get('content-type', '')):
+            return False
+        length = fields.get('content-length')
+        return length is None or int(length) >= self.min_size
+    
+    def _compress(self, result, encoding):
+        """Compress an app's body iterable as it is consumed"""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, ENCODINGS[encoding])
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in result:
+                started = time.thread_time()
+                data = compressor.compress(chunk)
+                cpu += time.thread_time() - started
+                bytes_in += len(chunk)
+                if data:
+                    bytes_out += len(data)
+                    yield data
+            
+            started = time.thread_time()
+            data = compressor.flush()
+            cpu += time.thread_time() - started
+            bytes_out += len(data)
+            yield data
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            with self._lock:
+                self.compressed += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+                self.cpu_seconds += cpu
+    
+    def get_counters(self):
+        """Get compression counters and the overall compression ratio"""
+        return {
+            'compressed': self.compressed,
+            'skipped': self.skipped,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else None,
+            'cpu_seconds': round(self.cpu_seconds, 6)
+        }
+
+
+def choose_encoding(accept_encoding):
+    """Pick gzip or deflate from an Accept-Encoding header, or None"""
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+    
+    for coding in ENCODINGS:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def _compressed_headers(headers, encoding):
+    """Rewrite response headers for the compressed representation"""
+    rewritten = []
+    vary = None
+    for name, value in headers:
+        lower = name.lower()
+        if lower == 'content-length':
+            continue
+        if lower == 'etag' and not value.startswith('W/'):
+            # Same content, different bytes: only a weak match still holds
+            value = 'W/' + value
+        if lower == 'vary':
+            vary = value
+            continue
+        rewritten.append((name, value))
+    
+    vary_values = [v.strip() for v in vary.split(',')] if vary else []
+    if 'accept-encoding' not in (v.lower() for v in vary_values):
+        vary_values.append('Accept-Encoding')
+    rewritten.append(('Vary', ', '.join(vary_values)))
+    rewritten.append(('Content-Encoding', encoding))
+    return rewritten
@@ -0,0 +1,126 @@
+import json
+import mmap
+import os
+from array import array
+
+
+REQUIRED_FIELDS = ('id', 'text', 'author', 'category')
+STRING_FIELDS = ('text', 'author', 'category')
+
+
+class MappedCorpus:
+    """Read-only quote corpus backed by a memory-mapped JSONL file.
+    
+    Only the byte offset and length of each line are kept in memory.
+    Quotes are decoded from the mapping when they are accessed, so forked
+    workers share the file's pages through the OS page cache.
+    
+    The file must never be modified in place while it is mapped: reading
+    a page that a truncation removed kills the process with SIGBUS. Write
+    a new corpus next to it and os.replace() it over the old path, as
+    write_corpus() does; the mapping keeps the old file alive until it is
+    closed.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._starts = array('Q')
+        self._lengths = array('I')
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._mmap = None
+        
+        if self._mmap is not None:
+            try:
+                self._build_offsets()
+            except ValueError:
+                self.close()
+                raise
+    
+    def _build_offsets(self):
+        """Scan the mapping once and record where every record lives"""
+        data = self._mmap
+        size = len(data)
+        start = 0
+        line_number = 0
+        
+        while start < size:
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = size
+            line_number += 1
+            
+            line = data[start:end]
+            if line.strip():
+                self._validate(line, line_number)
+                self._starts.append(start)
+                self._lengths.append(end - start)
+            start = end + 1
+    
+    def _validate(self, line, line_number):
+        """Reject records that the rest of the app cannot serve"""
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{self.path}:{line_number}: invalid JSON ({e})")
+        
+        if not isinstance(record, dict):
+            raise ValueError(f"{self.path}:{line_number}: expected a JSON object")
+        missing = [field for field in REQUIRED_FIELDS if field not in record]
+        if missing:
+            raise ValueError(f"{self.path}:{line_number}: missing fields {', '.join(missing)}")
+        if not isinstance(record['id'], int) or isinstance(record['id'], bool):
+            raise ValueError(f"{self.path}:{line_number}: id must be an integer")
+        wrong = [field for field in STRING_FIELDS if not isinstance(record[field], str)]
+        if wrong:
+            raise ValueError(f"{self.path}:{line_number}: {', '.join(wrong)} must be strings")
+    
+    def modified_in_place(self):
+        """Check whether the mapped file itself was rewritten since it was opened"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        current = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return current[:2] == self.identity[:2] and current != self.identity
+    
+    def raw(self, position):
+        """Get the encoded JSON bytes for the quote at a position"""
+        start = self._starts[position]
+        return self._mmap[start:start + self._lengths[position]]
+    
+    def __len__(self):
+        return len(self._starts)
+    
+    def __getitem__(self, position):
+        return json.loads(self.raw(position))
+    
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+    
+    def close(self):
+        """Release the mapping and the underlying file"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def write_corpus(path, quotes):
+    """Write quotes to a JSONL corpus file, replacing any existing one atomically"""
+    path = os.fspath(path)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for quote in quotes:
+            f.write(json.dumps(quote, ensure_ascii=False))
+            f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
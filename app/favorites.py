@@ -0,0 +1,153 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+
+
+# Favorites added without a client id share this bucket
+ANONYMOUS = ''
+
+CLIENT_ID_PATTERN = re.compile(r'[A-Za-z0-9._:-]{1,64}')
+
+# Quote ids are split into 16-bit chunks, roaring-bitmap style
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+# Past this many entries an 8 KiB bitmap is smaller than a sorted array
+ARRAY_LIMIT = CHUNK_BYTES // 2
+
+
+def valid_client_id(client_id):
+    """Check that a client id is safe to store and log"""
+    return bool(CLIENT_ID_PATTERN.fullmatch(client_id))
+
+
+class QuoteBitmap:
+    """Compressed set of quote ids.
+    
+    Ids are grouped by their high 16 bits. A sparse chunk is a sorted
+    array of 2-byte low halves; once it passes ARRAY_LIMIT entries it is
+    converted to a fixed 8 KiB bitmap. A client with a handful of
+    favorites costs a few bytes per id instead of a set entry per id.
+    """
+    
+    __slots__ = ('_chunks',)
+    
+    def __init__(self, quote_ids=()):
+        self._chunks = {}
+        for quote_id in quote_ids:
+            self.add(quote_id)
+    
+    def add(self, quote_id):
+        """Add an id; returns False if it was already present"""
+        high, low = quote_id >> CHUNK_BITS, quote_id & CHUNK_MASK
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            self._chunks[high] = array('H', [low])
+            return True
+        
+        if isinstance(chunk, array):
+            index = bisect_left(chunk, low)
+            if index < len(chunk) and chunk[index] == low:
+                return False
+            if len(chunk) < ARRAY_LIMIT:
+                chunk.insert(index, low)
+                return True
+            chunk = self._chunks[high] = _to_bitmap(chunk)
+        
+        mask = 1 << (low & 7)
+        if chunk[low >> 3] & mask:
+            return False
+        chunk[low >> 3] |= mask
+        return True
+    
+    def __contains__(self, quote_id):
+        chunk = self._chunks.get(quote_id >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = quote_id & CHUNK_MASK
+        if isinstance(chunk, array):
+            index = bisect_left(chunk, low)
+            return index < len(chunk) and chunk[index] == low
+        return bool(chunk[low >> 3] & 1 << (low & 7))
+    
+    def __len__(self):
+        return sum(len(chunk) if isinstance(chunk, array)
+                   else int.from_bytes(chunk, 'little').bit_count()
+                   for chunk in self._chunks.values())
+    
+    def __iter__(self):
+        for high in sorted(self._chunks):
+            chunk = self._chunks[high]
+            base = high << CHUNK_BITS
+            if isinstance(chunk, array):
+                for low in chunk:
+                    yield base | low
+            else:
+                for index, byte in enumerate(chunk):
+                    if byte:
+                        yield from (base | index << 3 | bit for bit in range(8) if byte >> bit & 1)
+    
+    def nbytes(self):
+        """Bytes used by the chunk payloads"""
+        return sum(chunk.itemsize * len(chunk) if isinstance(chunk, array) else len(chunk)
+                   for chunk in self._chunks.values())
+
+
+def _to_bitmap(values):
+    """Convert a sorted array chunk into a dense bitmap chunk"""
+    bitmap = bytearray(CHUNK_BYTES)
+    for low in values:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return bitmap
+
+
+class ClientFavorites:
+    """Favorites for every client, one QuoteBitmap each.
+    
+    A per-quote count of how many clients favorited it is kept up to date
+    on every add, so popularity lookups are a dict read and top-K is a
+    single pass over the favorited quotes rather than over all clients.
+    """
+    
+    def __init__(self):
+        self._clients = {}
+        self.counts = defaultdict(int)
+        # Favorites added across every client, for history rollups
+        self.total = 0
+    
+    def add(self, client_id, quote_id):
+        """Add a favorite for a client; returns False if it already existed"""
+        bitmap = self._clients.get(client_id)
+        if bitmap is None:
+            bitmap = self._clients[client_id] = QuoteBitmap()
+        if not bitmap.add(quote_id):
+            return False
+        self.counts[quote_id] += 1
+        self.total += 1
+        return True
+    
+    def get(self, client_id):
+        """Get one client's favorite quote ids in ascending order"""
+        bitmap = self._clients.get(client_id)
+        return list(bitmap) if bitmap is not None else []
+    
+    def count(self, quote_id):
+        """Get how many clients favorited a quote"""
+        return self.counts.get(quote_id, 0)
+    
+    def quote_ids(self):
+        """Get every quote id favorited by at least one client"""
+        return sorted(self.counts)
+    
+    def top(self, limit):
+        """Get the most favorited (quote_id, clients) pairs, lowest id first on ties"""
+        return nlargest(limit, self.counts.items(), key=lambda item: (item[1], -item[0]))
+    
+    def client_count(self):
+        """Get the number of clients with at least one favorite"""
+        return len(self._clients)
+    
+    def __len__(self):
+        return len(self.counts)
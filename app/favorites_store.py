@@ -0,0 +1,363 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from .favorites import ANONYMOUS, ClientFavorites
+
+
+LOG_NAME = 'favorites.log'
+SNAPSHOT_NAME = 'favorites.snapshot'
+SNAPSHOT_HEADER = '# favorites snapshot v2\n'
+
+# Log records: "+<quote_id>[\t<client_id>]" adds a favorite, "!" clears them all.
+# Snapshot lines are "<quote_id>[\t<client_id>]"; no client id means anonymous.
+ADD = '+'
+CLEAR = '!'
+
+# Every open log and follower, so a forked child can reset their per-process state
+_LOGS = weakref.WeakSet()
+
+
+class FavoritesLog:
+    """Durable favorites: a snapshot file plus an append-only log.
+    
+    Requests only queue a record in memory. A background writer appends
+    everything queued since its last pass with one write() and one fsync()
+    (group commit), so POST /api/favorite never waits on the disk. Once the
+    log grows past `compact_threshold` records, or `compact_interval`
+    seconds pass, the snapshot and log are folded into a new snapshot and
+    the log is truncated. Recovery reads the snapshot and replays the log.
+    
+    Workers may share a directory: appends use O_APPEND under a shared
+    lock and compaction rebuilds the snapshot from disk under an exclusive
+    lock, so no worker's records are lost.
+    """
+    
+    def __init__(self, directory, commit_interval=0.05, compact_threshold=10000,
+                 compact_interval=300.0):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        
+        os.makedirs(directory, exist_ok=True)
+        self._fd = self._open_log()
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        # flock belongs to the open file description, which every thread of
+        # this process shares, so threads also exclude each other in-process
+        self._flock_guard = threading.Lock()
+        self._pid = None
+        self._log_records = 0
+        self._log_end = 0
+        self._unsynced = 0
+        self._last_compaction = time.monotonic()
+        
+        self.commits = 0
+        self.committed = 0
+        self.compactions = 0
+        
+        atexit.register(self.flush)
+        _LOGS.add(self)
+    
+    def _open_log(self):
+        return os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    
+    def _after_fork(self):
+        """Reset per-process state in a forked child, before any of its threads run"""
+        # The child shares the parent's open file description and with it
+        # the parent's flock, so it needs its own; locks held by parent
+        # threads at fork time would never be released in the child
+        os.close(self._fd)
+        self._fd = self._open_log()
+        self._write_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._flock_guard = threading.Lock()
+    
+    @contextmanager
+    def _file_lock(self, mode):
+        with self._flock_guard:
+            fcntl.flock(self._fd, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def recover(self):
+        """Rebuild {client_id: set of quote ids} from the snapshot and the log tail"""
+        with self._file_lock(fcntl.LOCK_EX):
+            favorites = self._read_state(repair=True)
+        return favorites
+    
+    def _read_state(self, repair=False):
+        """Snapshot plus log replay; the caller holds the file lock"""
+        favorites = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                for line in f:
+                    if line.strip() and not line.startswith('#'):
+                        _add_record(favorites, line.rstrip('\n'))
+        
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if repair and complete < len(data):
+            # Drop a record torn by a crash so new appends start on a clean line
+            os.truncate(self.log_path, complete)
+        
+        records = 0
+        for line in data[:complete].decode('utf-8').splitlines():
+            if line == CLEAR:
+                favorites.clear()
+            elif line.startswith(ADD):
+                _add_record(favorites, line[1:])
+            records += 1
+        self._log_records = records
+        self._log_end = complete
+        return favorites
+    
+    def append_add(self, quote_id, client_id=ANONYMOUS):
+        """Queue a favorite for the next group commit"""
+        self._enqueue(f'{ADD}{_format_record(quote_id, client_id)}\n')
+    
+    def append_clear(self):
+        """Queue removal of every favorite"""
+        self._enqueue(f'{CLEAR}\n')
+    
+    def write_through(self, record):
+        """Append a record right away, leaving the fsync to the next group commit.
+        
+        Other workers see it as soon as this returns. The caller holds the
+        exclusive file lock.
+        """
+        os.write(self._fd, record.encode('utf-8'))
+        self._log_records += 1
+        self._unsynced += 1
+        self._ensure_writer()
+        self._wake.set()
+    
+    def _enqueue(self, record):
+        self._pending.append(record)
+        self._ensure_writer()
+        self._wake.set()
+    
+    def _ensure_writer(self):
+        """Start the writer thread, once per process (threads do not survive fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._writer_lock:
+            if self._pid != pid:
+                threading.Thread(target=self._run, name='favorites-writer', daemon=True).start()
+                self._pid = pid
+    
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Let concurrent requests pile up so one fsync covers them all
+            time.sleep(self.commit_interval)
+            self._wake.clear()
+            self.flush()
+    
+    def flush(self):
+        """Write and fsync everything queued, compacting if due"""
+        with self._write_lock:
+            records = []
+            while self._pending:
+                try:
+                    records.append(self._pending.popleft())
+                except IndexError:
+                    break
+            
+            if records or self._unsynced:
+                with self._file_lock(fcntl.LOCK_SH):
+                    if records:
+                        os.write(self._fd, ''.join(records).encode('utf-8'))
+                    os.fsync(self._fd)
+                    written, self._unsynced = self._unsynced, 0
+                self.commits += 1
+                self.committed += len(records) + written
+                self._log_records += len(records)
+            
+            if self._compaction_due():
+                self._compact()
+    
+    def _compaction_due(self):
+        if self._log_records >= self.compact_threshold:
+            return True
+        elapsed = time.monotonic() - self._last_compaction
+        return self._log_records > 0 and elapsed >= self.compact_interval
+    
+    def compact(self):
+        """Fold the log into a fresh snapshot now"""
+        with self._write_lock:
+            self._compact()
+    
+    def _compact(self):
+        with self._file_lock(fcntl.LOCK_EX):
+            favorites = self._read_state()
+            temp_path = self.snapshot_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                f.write(SNAPSHOT_HEADER)
+                f.writelines(f'{_format_record(quote_id, client_id)}\n'
+                             for client_id, quote_ids in sorted(favorites.items())
+                             for quote_id in sorted(quote_ids))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            os.truncate(self.log_path, 0)
+            os.fsync(self._fd)
+        
+        self._log_records = 0
+        self._last_compaction = time.monotonic()
+        self.compactions += 1
+    
+    def get_counters(self):
+        """Get write-behind and compaction counters"""
+        return {
+            'pending': len(self._pending),
+            'commits': self.commits,
+            'committed': self.committed,
+            'log_records': self._log_records,
+            'compactions': self.compactions
+        }
+
+
+class SharedFavorites:
+    """Per-client favorites kept in step with every worker sharing a FavoritesLog.
+    
+    Each worker holds the favorites in memory and, before answering,
+    replays whatever other workers appended to the log since it last
+    looked: usually nothing, at the cost of a stat under the shared file
+    lock. Adds check and write under the exclusive lock, so a favorite
+    added twice through different workers is only counted once. When a
+    compaction has replaced the snapshot the state is rebuilt from disk.
+    Without a log the favorites are simply kept in memory.
+    
+    Quotes whose client count changed are remembered until take_changes(),
+    so a worker can bring its own derived state (sampler weights) in line.
+    """
+    
+    def __init__(self, log=None):
+        self.log = log
+        self._favorites = ClientFavorites()
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._snapshot = None
+        self._changed = set()
+        
+        self.rebuilds = 0
+        _LOGS.add(self)
+        if log is not None:
+            with self.current(exclusive=True):
+                pass
+    
+    def _after_fork(self):
+        """Replace a lock a parent thread may have held at fork time"""
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def current(self, exclusive=False):
+        """Hold the favorites up to date with every worker's records"""
+        with self._lock:
+            if self.log is None:
+                yield self._favorites
+                return
+            with self.log._file_lock(fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH):
+                self._catch_up(repair=exclusive)
+                yield self._favorites
+    
+    def _catch_up(self, repair=False):
+        """Apply new log records, or rebuild after a compaction; needs the file lock"""
+        log = self.log
+        snapshot = _file_identity(log.snapshot_path)
+        size = os.fstat(log._fd).st_size
+        if snapshot != self._snapshot or size < self._offset:
+            favorites = ClientFavorites()
+            for client_id, quote_ids in log._read_state(repair=repair).items():
+                for quote_id in sorted(quote_ids):
+                    favorites.add(client_id, quote_id)
+            self._changed.update(self._favorites.counts, favorites.counts)
+            self._favorites = favorites
+            self._offset = log._log_end
+            self._snapshot = snapshot
+            self.rebuilds += 1
+            return
+        if size == self._offset:
+            return
+        
+        with open(log.log_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].decode('utf-8').splitlines():
+            if line == CLEAR:
+                self._changed.update(self._favorites.counts)
+                self._favorites = ClientFavorites()
+            elif line.startswith(ADD):
+                quote_id, _, client_id = line[1:].partition('\t')
+                if self._favorites.add(client_id, int(quote_id)):
+                    self._changed.add(int(quote_id))
+        self._offset += complete
+    
+    def add(self, client_id, quote_id):
+        """Add a favorite for a client; returns False if any worker already had it"""
+        with self.current(exclusive=True) as favorites:
+            if not favorites.add(client_id, quote_id):
+                return False
+            self._changed.add(quote_id)
+            if self.log is not None:
+                record = f'{ADD}{_format_record(quote_id, client_id)}\n'
+                self.log.write_through(record)
+                self._offset += len(record.encode('utf-8'))
+        return True
+    
+    def clear(self):
+        """Remove every client's favorites"""
+        with self.current(exclusive=True):
+            self._changed.update(self._favorites.counts)
+            self._favorites = ClientFavorites()
+            if self.log is not None:
+                self.log.write_through(f'{CLEAR}\n')
+                self._offset += len(CLEAR) + 1
+    
+    def take_changes(self):
+        """Get {quote_id: clients} for quotes whose count changed since the last call"""
+        with self.current() as favorites:
+            changed, self._changed = self._changed, set()
+            return {quote_id: favorites.count(quote_id) for quote_id in changed}
+
+
+def _file_identity(path):
+    """Identify one version of a file that is replaced rather than rewritten"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _reset_logs_after_fork():
+    for log in list(_LOGS):
+        log._after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_logs_after_fork)
+
+
+def _format_record(quote_id, client_id):
+    return f'{quote_id}\t{client_id}' if client_id else str(quote_id)
+
+
+def _add_record(favorites, record):
+    """Apply one "<quote_id>[\t<client_id>]" record"""
+    quote_id, _, client_id = record.partition('\t')
+    favorites.setdefault(client_id, set()).add(int(quote_id))
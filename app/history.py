@@ -0,0 +1,235 @@
+import fcntl
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+
+MAGIC = b'QHIST001'
+
+# start, width, fetches, favorites, fetches running total, favorites running total
+RECORD = struct.Struct('<qqqqqq')
+
+# (age in seconds, bucket width): buckets older than the age are merged
+# into buckets of the coarser width
+DOWNSAMPLE = ((86400, 3600), (30 * 86400, 86400))
+
+# Named granularities accepted by /api/stats/history, in seconds
+GRANULARITIES = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+
+class StatsHistory:
+    """Usage totals per time bucket, kept in a compact append-only file.
+    
+    Every `resolution` seconds roll_up() appends one fixed-size record
+    with the fetches and favorites added during the bucket that just
+    ended. The running totals are stored alongside, and each delta is
+    taken against the last record in the file rather than anything held
+    in memory, under a file lock. Several workers reading the same shared
+    counters can therefore all roll up: the first writes the bucket and
+    the rest find it already there. A running total that went down means
+    the counters were reset or the process restarted, so all of it counts
+    as new.
+    
+    compact() downsamples old buckets (minutes older than a day into
+    hours, hours older than 30 days into days), which bounds the file
+    without losing any totals.
+    """
+    
+    def __init__(self, path, totals, resolution=60, clock=time.time):
+        self.path = path
+        self.totals = totals
+        self.resolution = resolution
+        self.clock = clock
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Compaction replaces the data file, so the lock lives beside it
+        self._lock_path = path + '.lock'
+        self._lock_fd = None
+        self._lock_pid = None
+        self._thread = None
+        self._compacted_at = 0
+        
+        self.rollups = 0
+        self.compactions = 0
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the history file lock"""
+        if self._lock_pid != os.getpid():
+            # A forked child must not share its parent's open file description
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+            self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+    
+    def roll_up(self, now=None):
+        """Append the bucket that ended most recently; returns False if already written"""
+        now = self.clock() if now is None else now
+        start = int(now // self.resolution) * self.resolution - self.resolution
+        totals = self.totals()
+        
+        with self._locked():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                end, last = _prepare(fd)
+                if last is not None and last[0] >= start:
+                    return False
+                previous_fetches, previous_favorites = last[4:] if last else (0, 0)
+                os.pwrite(fd, RECORD.pack(
+                    start, self.resolution,
+                    _delta(totals['fetches'], previous_fetches),
+                    _delta(totals['favorites'], previous_favorites),
+                    totals['fetches'], totals['favorites']
+                ), end)
+            finally:
+                os.close(fd)
+        
+        self.rollups += 1
+        if now - self._compacted_at >= DOWNSAMPLE[0][1]:
+            self.compact(now)
+        return True
+    
+    def compact(self, now=None):
+        """Merge old buckets into coarser ones; returns how many records were removed"""
+        now = self.clock() if now is None else now
+        self._compacted_at = now
+        
+        with self._locked():
+            records = self._read()
+            merged = {}
+            for start, width, fetches, favorites, fetches_total, favorites_total in records:
+                width = _downsampled_width(now - start, width)
+                key = (start // width * width, width)
+                bucket = merged.get(key)
+                if bucket is None:
+                    merged[key] = [key[0], width, fetches, favorites, fetches_total, favorites_total]
+                else:
+                    bucket[2] += fetches
+                    bucket[3] += favorites
+                    bucket[4:] = fetches_total, favorites_total
+            
+            if len(merged) == len(records):
+                return 0
+            temporary = self.path + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(MAGIC)
+                for bucket in sorted(merged.values()):
+                    f.write(RECORD.pack(*bucket))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        
+        self.compactions += 1
+        return len(records) - len(merged)
+    
+    def query(self, start, end, granularity=None):
+        """Get fetches and favorites per bucket for buckets overlapping [start, end).
+        
+        Buckets are `granularity` seconds wide (the rollup resolution by
+        default); ranges that have already been downsampled further are
+        reported at their stored width.
+        """
+        granularity = granularity or self.resolution
+        buckets = {}
+        for record_start, width, fetches, favorites, _, _ in self._read():
+            if record_start + width <= start or record_start >= end:
+                continue
+            step = max(granularity, width)
+            key = (record_start // step * step, step)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {'start': key[0], 'end': key[0] + step,
+                                         'fetches': 0, 'favorites': 0}
+            bucket['fetches'] += fetches
+            bucket['favorites'] += favorites
+        return sorted(buckets.values(), key=lambda bucket: bucket['start'])
+    
+    def _read(self):
+        """Read every complete record"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if not data.startswith(MAGIC):
+            return []
+        end = len(data) - (len(data) - len(MAGIC)) % RECORD.size
+        return list(RECORD.iter_unpack(data[len(MAGIC):end]))
+    
+    def start(self):
+        """Roll up just after every bucket boundary in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='stats-history', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.resolution - self.clock() % self.resolution + 0.1)
+            try:
+                self.roll_up()
+            except OSError as e:
+                print(f"Stats history rollup failed: {e}")
+    
+    def get_status(self):
+        """Get history file and rollup counters"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return {
+            'path': self.path,
+            'resolution_seconds': self.resolution,
+            'records': max(0, size - len(MAGIC)) // RECORD.size,
+            'rollups': self.rollups,
+            'compactions': self.compactions
+        }
+
+
+def _prepare(fd):
+    """Initialise or repair the file; returns the append offset and last record"""
+    size = os.fstat(fd).st_size
+    if os.pread(fd, len(MAGIC), 0) != MAGIC:
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, MAGIC, 0)
+        return len(MAGIC), None
+    
+    # Drop a record torn by a crash mid-write so appends stay aligned
+    end = size - (size - len(MAGIC)) % RECORD.size
+    if end != size:
+        os.ftruncate(fd, end)
+    if end == len(MAGIC):
+        return end, None
+    return end, RECORD.unpack(os.pread(fd, RECORD.size, end - RECORD.size))
+
+
+def _delta(total, previous):
+    """Events since the previous running total, treating a drop as a reset"""
+    return total - previous if total >= previous else total
+
+
+def _downsampled_width(age, width):
+    """Bucket width for a record of the given age"""
+    for min_age, coarse_width in DOWNSAMPLE:
+        if age >= min_age:
+            width = max(width, coarse_width)
+    return width
+
+
+def parse_granularity(value):
+    """Parse '1m'/'1h'/... or a number of seconds; raises ValueError"""
+    if value in GRANULARITIES:
+        return GRANULARITIES[value]
+    seconds = int(value)
+    if seconds < 1:
+        raise ValueError(value)
+    return seconds
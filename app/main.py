@@ -1,189 +1,714 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import hmac
 import os
-import logging
-from flask import Flask, jsonify, request, send_from_directory
-from .models import QuoteManager
-from .stats import StatsTracker
-
-# Application Insights monitoring
-try:
-    from opencensus.ext.azure.log_exporter import AzureLogHandler
-    from opencensus.ext.azure.trace_exporter import AzureExporter
-    from opencensus.ext.flask.flask_middleware import FlaskMiddleware
-    MONITORING_AVAILABLE = True
-except ImportError:
-    MONITORING_AVAILABLE = False
-
-# Determine static folder path based on environment
-if os.path.exists('/app/static'):
-    static_folder = '/app/static'
-    static_url_path = '/static'
-else:
-    static_folder = '../static'
-    static_url_path = '/static'
-
-app = Flask(__name__, 
-            static_folder=static_folder,
-            static_url_path=static_url_path)
-
-quote_manager = QuoteManager()
-stats_tracker = StatsTracker()
-
-# Configure Application Insights monitoring
-connection_string = os.getenv('APPLICATIONINSIGHTS_CONNECTION_STRING')
-if connection_string and MONITORING_AVAILABLE:
-    # Add Flask middleware for automatic request tracking
-    middleware = FlaskMiddleware(
-        app,
-        exporter=AzureExporter(connection_string=connection_string)
-    )
-    
-    # Configure logging to Azure
-    logger = logging.getLogger(__name__)
-    logger.addHandler(AzureLogHandler(connection_string=connection_string))
-    logger.setLevel(logging.INFO)
-    
-    def log_event(name, properties=None):
-        """Log custom events to Application Insights"""
-        logger.info(name, extra={'custom_dimensions': properties or {}})
-    
-    print("Application Insights monitoring enabled")
-else:
-    # Fallback logging for local development
-    def log_event(name, properties=None):
-        """Fallback logging when Application Insights not available"""
-        print(f"LOG: {name} - {properties}")
-    
-    if not connection_string:
-        print("Application Insights not configured (no connection string)")
-
-
-@app.route('/')
+import math
+from flask import Blueprint, Flask, current_app, g, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from .admission import parse_request_start
+from .assets import DEFAULT_STATIC_FOLDER
+from .compression import CompressionMiddleware
+from .favorites import ANONYMOUS, valid_client_id
+from .history import parse_granularity
+from .models import WEIGHT_MODES
+from .search import SEARCH_FIELDS
+from .services import Services
+
+# Time spent importing Flask and the app modules, reported by /health
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+MAX_SEARCH_PAGE_SIZE = 50
+MAX_TOP_FAVORITES = 100
+# Most buckets one /api/stats/history response may hold
+MAX_HISTORY_BUCKETS = 1440
+
+# Probes and metrics scrapes are never rate limited or shed
+ADMISSION_EXEMPT_ROUTES = ('/health', '/metrics')
+
+# Services of the default app that can be imported from this module
+DEFAULT_APP_SERVICES = ('quote_manager', 'stats_tracker', 'telemetry', 'request_metrics',
+                        'corpus_reloader', 'rate_limiter', 'load_shedder', 'stats_history',
+                        'shuffle_bags')
+
+api = Blueprint('api', __name__)
+
+
+def create_app(config=None):
+    """Build the Flask app and its services.
+    
+    `config` overrides environment variables of the same name. Nothing is
+    built at import time: gunicorn either calls this in every worker or,
+    with preload_app, once in the master before forking (see
+    gunicorn.conf.py), in which case DEFER_WORKER_START postpones the
+    per-process threads and signal handlers until after the fork.
+    """
+    settings = dict(os.environ)
+    settings.update(config or {})
+    
+    app = Flask(__name__, static_folder=DEFAULT_STATIC_FOLDER, static_url_path='/static')
+    services = Services(settings, app)
+    app.extensions['quote_generator'] = services
+    app.register_blueprint(api)
+    # Keep Flask's /static/<filename> rule but answer it from the in-memory bundle
+    app.view_functions['static'] = serve_static
+    
+    # Behind N trusted proxies, take the client address (which rate limits
+    # are keyed on) and scheme from their X-Forwarded-* headers
+    proxy_hops = int(settings.get('TRUST_PROXY_HOPS', '0'))
+    if proxy_hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=proxy_hops)
+    
+    # gzip/deflate for large and streamed responses; static assets arrive precompressed
+    if settings.get('COMPRESSION', 'true').lower() != 'false':
+        services.compression = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=int(settings.get('COMPRESSION_MIN_SIZE', '1024')),
+            level=int(settings.get('COMPRESSION_LEVEL', '6'))
+        )
+        app.wsgi_app = services.compression
+    
+    if not settings.get('DEFER_WORKER_START'):
+        services.start_worker()
+    
+    report = services.startup.report(IMPORT_SECONDS)
+    print(f"Startup: imports {IMPORT_SECONDS:.3f}s, "
+          + ', '.join(f'{name} {seconds:.3f}s' for name, seconds in report['phases'].items()))
+    return app
+
+
+def __getattr__(name):
+    """Build the default app on first access, so `app.main:app` still works.
+    
+    The default app's services stay reachable as module attributes too,
+    e.g. `from app.main import stats_tracker`.
+    """
+    if name != 'app' and name not in DEFAULT_APP_SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    app = globals().get('app')
+    if app is None:
+        app = globals()['app'] = create_app()
+    if name == 'app':
+        return app
+    return getattr(app.extensions['quote_generator'], name)
+
+
+def get_services():
+    """Services of the app handling the current request"""
+    return current_app.extensions['quote_generator']
+
+
+@api.before_app_request
+def start_request_timer():
+    """Start timing the request and count it as in flight"""
+    services = get_services()
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = services.request_metrics.start(g.metrics_route)
+
+
+@api.before_app_request
+def admit_request():
+    """Fast-fail requests over their rate limit or stuck behind a backlog"""
+    services = get_services()
+    route = g.metrics_route
+    if route in ADMISSION_EXEMPT_ROUTES:
+        return None
+    
+    if services.rate_limiter:
+        retry_after = services.rate_limiter.acquire(request.remote_addr, route)
+        if retry_after:
+            return rejected(429, 'Too many requests', retry_after)
+    
+    if services.load_shedder:
+        request_start = parse_request_start(request.headers.get('X-Request-Start'))
+        retry_after = services.load_shedder.admit(request_start)
+        if retry_after:
+            services.log_event('request_shed', {'route': route})
+            return rejected(503, 'Server overloaded, retry later', retry_after)
+        g.admitted_at = services.load_shedder.clock()
+    return None
+
+
+@api.before_app_request
+def start_request_profile():
+    """Profile a sampled fraction of requests, and any sent with X-Profile: <admin token>"""
+    services = get_services()
+    forced = admin_token_matches(request.headers.get('X-Profile'))
+    if services.request_profiler.should_profile(forced):
+        g.profile = services.request_profiler.start()
+        g.profile_started = time.perf_counter()
+
+
+@api.after_app_request
+def finish_request_profile(response):
+    """Keep the request's profile and tell the client where to fetch it"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        capture_id = get_services().request_profiler.finish(
+            profile, request.method, request.path, response.status_code,
+            time.perf_counter() - g.profile_started
+        )
+        response.headers['X-Profile-Id'] = str(capture_id)
+    return response
+
+
+@api.teardown_app_request
+def release_admission(exc):
+    """Feed the service time of admitted requests back to the load shedder"""
+    if 'admitted_at' in g:
+        load_shedder = get_services().load_shedder
+        load_shedder.finish(load_shedder.clock() - g.admitted_at)
+
+
+def rejected(status, message, retry_after):
+    """Error response telling the client when to retry"""
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+@api.after_app_request
+def record_request_metrics(response):
+    """Record the request latency by route, method and status"""
+    if 'metrics_started' in g:
+        get_services().request_metrics.finish(g.metrics_route, request.method,
+                                              response.status_code, g.metrics_started)
+    return response
+
+
+def cached_json(body, etag, cache_control=None):
+    """Serve a pre-encoded JSON body, answering 304 when the ETag matches"""
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def record_fetch(quote):
+    """Count a served quote in the stats and in its popularity weight"""
+    services = get_services()
+    # The corpus spelling, not the URL's, so case variants share one counter
+    services.stats_tracker.record_quote_fetch(quote['category'], quote['id'], quote['author'])
+    services.quote_manager.set_popularity('fetches', quote['id'],
+                                          services.stats_tracker.quote_fetch_count(quote['id']))
+
+
+def request_client_id():
+    """Client id from the X-Client-Id header or ?client_id=; None if malformed"""
+    client_id = request.headers.get('X-Client-Id') or request.args.get('client_id')
+    if client_id is None:
+        return ANONYMOUS
+    return client_id if valid_client_id(client_id) else None
+
+
+def invalid_client_id():
+    """Error response for a malformed client id"""
+    return jsonify({'error': 'client id must be 1-64 letters, digits or ._:-'}), 400
+
+
+def no_repeat_requested():
+    """Whether the caller asked for ?no_repeat=true"""
+    return request.args.get('no_repeat', '').lower() in ('1', 'true')
+
+
+def draw_entry(services, category, weighted):
+    """Draw a quote entry, from the caller's no-repeat shuffle if requested"""
+    if no_repeat_requested():
+        # Anonymous callers get one shuffle per address
+        client = request_client_id() or request.remote_addr
+        return services.quote_manager.get_shuffled_entry(services.shuffle_bags, client, category)
+    if weighted == 'favorites':
+        # Pick up favorites other workers added since this one last drew
+        for quote_id, count in services.stats_tracker.favorite_updates().items():
+            services.quote_manager.set_popularity('favorites', quote_id, count)
+    return services.quote_manager.get_random_entry(category, weighted)
+
+
+def invalid_draw_options(weighted):
+    """Error response for bad weighted/no_repeat/client id options, or None"""
+    if weighted is not None and weighted not in WEIGHT_MODES:
+        return invalid_weighted_mode()
+    if no_repeat_requested():
+        if weighted is not None:
+            return jsonify({'error': 'weighted and no_repeat cannot be combined'}), 400
+        if request_client_id() is None:
+            return invalid_client_id()
+    return None
+
+
+def invalid_weighted_mode():
+    """Error response for an unknown ?weighted= value"""
+    return jsonify({'error': f"weighted must be one of: {', '.join(WEIGHT_MODES)}"}), 400
+
+
+def serve_asset(name):
+    """Serve an in-memory static asset, gzipped if accepted, 304 if the ETag matches"""
+    asset = get_services().assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    body, etag, encoding = asset.variant(request.accept_encodings['gzip'] > 0)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def serve_static(filename):
+    """Serve a file under static/, by its plain or fingerprinted name"""
+    return serve_asset(filename)
+
+
+@api.route('/')
 def index():
     """Serve the main HTML page"""
-    return app.send_static_file('index.html')
+    return serve_asset('index.html')
 
 
-@app.route('/api/quote', methods=['GET'])
+@api.route('/api/quote', methods=['GET'])
 def get_random_quote():
     """Get a random quote from any category"""
+    services = get_services()
+    weighted = request.args.get('weighted') or None
+    invalid = invalid_draw_options(weighted)
+    if invalid:
+        return invalid
+    
     try:
-        quote = quote_manager.get_random_quote()
-        stats_tracker.record_quote_fetch(quote['category'])
+        entry = draw_entry(services, None, weighted)
+        quote = entry.quote
+        record_fetch(quote)
         
         # Log quote fetch event
-        log_event('quote_fetched', {
+        services.log_event('quote_fetched', {
             'category': quote['category'],
             'quote_id': quote['id'],
             'author': quote['author']
         })
         
-        return jsonify(quote)
+        return cached_json(entry.body, entry.etag)
     except Exception as e:
-        log_event('quote_fetch_error', {'error': str(e)})
+        services.log_event('quote_fetch_error', {'error': str(e)})
         return jsonify({'error': 'Failed to fetch quote'}), 500
 
 
-@app.route('/api/quote/category/<category>', methods=['GET'])
+@api.route('/api/quote/category/<category>', methods=['GET'])
 def get_quote_by_category(category):
     """Get a random quote from a specific category"""
+    services = get_services()
+    weighted = request.args.get('weighted') or None
+    invalid = invalid_draw_options(weighted)
+    if invalid:
+        return invalid
+    
     try:
-        quote = quote_manager.get_quote_by_category(category)
-        if quote:
-            stats_tracker.record_quote_fetch(category)
+        entry = draw_entry(services, category, weighted)
+        if entry:
+            quote = entry.quote
+            record_fetch(quote)
             
             # Log category-specific quote fetch
-            log_event('quote_fetched_by_category', {
+            services.log_event('quote_fetched_by_category', {
                 'category': category,
                 'quote_id': quote['id']
             })
             
-            return jsonify(quote)
+            return cached_json(entry.body, entry.etag)
         else:
-            log_event('quote_category_not_found', {'category': category})
+            services.log_event('quote_category_not_found', {'category': category})
             return jsonify({'error': f'No quotes found for category: {category}'}), 404
     except Exception as e:
-        log_event('quote_fetch_error', {'error': str(e), 'category': category})
+        services.log_event('quote_fetch_error', {'error': str(e), 'category': category})
         return jsonify({'error': 'Failed to fetch quote'}), 500
 
 
-@app.route('/api/categories', methods=['GET'])
+@api.route('/api/quotes', methods=['GET'])
+def get_quotes_batch():
+    """Get several random quotes in one response"""
+    services = get_services()
+    category = request.args.get('category')
+    unique = request.args.get('unique', 'true').lower() != 'false'
+    
+    try:
+        count = int(request.args.get('count', '10'))
+    except ValueError:
+        count = 0
+    if not 1 <= count <= services.max_batch_size:
+        return jsonify({'error': f'count must be between 1 and {services.max_batch_size}'}), 400
+    
+    try:
+        entries = services.quote_manager.sample_entries(count, category, unique)
+        if entries is None:
+            services.log_event('quote_category_not_found', {'category': category})
+            return jsonify({'error': f'No quotes found for category: {category}'}), 404
+        
+        for entry in entries:
+            record_fetch(entry.quote)
+        services.log_event('quotes_batch_fetched', {'count': len(entries), 'category': category})
+        
+        # Splice the cached bodies together instead of re-encoding them
+        quotes = b','.join(entry.body.rstrip(b'\n') for entry in entries)
+        body = b'{"count":%d,"quotes":[%s]}\n' % (len(entries), quotes)
+        return current_app.response_class(body, mimetype='application/json')
+    except Exception as e:
+        services.log_event('quote_fetch_error', {'error': str(e), 'category': category})
+        return jsonify({'error': 'Failed to fetch quotes'}), 500
+
+
+@api.route('/api/quotes/export', methods=['GET'])
+def export_quotes():
+    """Stream the corpus as newline-delimited JSON"""
+    services = get_services()
+    category = request.args.get('category')
+    if category is not None and not services.quote_manager.has_category(category):
+        return jsonify({'error': f'No quotes found for category: {category}'}), 404
+    
+    services.log_event('quotes_exported', {'category': category})
+    return current_app.response_class(services.quote_manager.iter_bodies(category),
+                                      mimetype='application/x-ndjson')
+
+
+@api.route('/api/search', methods=['GET'])
+def search_quotes():
+    """Search quote text and authors"""
+    services = get_services()
+    query = request.args.get('q', '').strip()
+    field = request.args.get('field') or None
+    
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    if field is not None and field not in SEARCH_FIELDS:
+        return jsonify({'error': f"field must be one of: {', '.join(SEARCH_FIELDS)}"}), 400
+    
+    try:
+        page = max(1, int(request.args.get('page', '1')))
+        per_page = min(MAX_SEARCH_PAGE_SIZE, max(1, int(request.args.get('per_page', '10'))))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    
+    try:
+        total, matches = services.quote_manager.search(query, field, (page - 1) * per_page,
+                                                       per_page)
+        services.log_event('quotes_searched', {'query': query, 'field': field, 'total': total})
+        return jsonify({
+            'query': query,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'results': [dict(quote, score=round(score, 4)) for quote, score in matches]
+        })
+    except Exception as e:
+        services.log_event('search_error', {'error': str(e), 'query': query})
+        return jsonify({'error': 'Failed to search quotes'}), 500
+
+
+@api.route('/api/categories', methods=['GET'])
 def get_categories():
     """Get all available quote categories"""
+    services = get_services()
     try:
-        categories = quote_manager.get_categories()
-        log_event('categories_requested', {'count': len(categories)})
-        return jsonify({'categories': categories})
+        body, etag = services.quote_manager.get_categories_response()
+        services.log_event('categories_requested',
+                           {'count': len(services.quote_manager.get_categories())})
+        # Let browsers keep the list and revalidate it with If-None-Match
+        return cached_json(body, etag, cache_control='no-cache')
     except Exception as e:
-        log_event('categories_error', {'error': str(e)})
+        services.log_event('categories_error', {'error': str(e)})
         return jsonify({'error': 'Failed to fetch categories'}), 500
 
 
-@app.route('/api/stats', methods=['GET'])
+@api.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get usage statistics"""
+    services = get_services()
     try:
-        stats = stats_tracker.get_stats()
-        log_event('stats_requested', {
+        stats = services.stats_tracker.get_stats()
+        services.log_event('stats_requested', {
             'total_fetches': stats['total_quotes_fetched'],
             'total_favorites': stats['total_favorites']
         })
         return jsonify(stats)
     except Exception as e:
-        log_event('stats_error', {'error': str(e)})
+        services.log_event('stats_error', {'error': str(e)})
         return jsonify({'error': 'Failed to fetch stats'}), 500
 
 
-@app.route('/api/favorite', methods=['POST'])
+@api.route('/api/stats/history', methods=['GET'])
+def get_stats_history():
+    """Get fetches and favorites per time bucket from the on-disk rollups"""
+    services = get_services()
+    if services.stats_history is None:
+        return jsonify({'error': 'Stats history is not enabled'}), 404
+    
+    try:
+        end = float(request.args.get('to') or time.time())
+        start = float(request.args.get('from') or end - 3600)
+        granularity = parse_granularity(request.args.get('granularity')
+                                        or services.stats_history.resolution)
+    except ValueError:
+        return jsonify({'error': 'from and to must be timestamps and granularity '
+                                 'one of 1m, 5m, 1h, 1d or a number of seconds'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    if (end - start) / granularity > MAX_HISTORY_BUCKETS:
+        return jsonify({'error': f'At most {MAX_HISTORY_BUCKETS} buckets per request; '
+                                 'use a coarser granularity'}), 400
+    
+    try:
+        buckets = services.stats_history.query(start, end, granularity)
+        services.log_event('stats_history_requested', {'from': start, 'to': end,
+                                                       'granularity': granularity})
+        return jsonify({'from': start, 'to': end, 'granularity': granularity,
+                        'buckets': buckets})
+    except Exception as e:
+        services.log_event('stats_error', {'error': str(e)})
+        return jsonify({'error': 'Failed to fetch stats history'}), 500
+
+
+@api.route('/api/favorite', methods=['POST'])
 def add_favorite():
     """Mark a quote as favorite"""
+    services = get_services()
     data = request.get_json()
     
     if not data or 'quote_id' not in data:
         return jsonify({'error': 'quote_id is required'}), 400
     
+    client_id = request_client_id()
+    if client_id is None:
+        return invalid_client_id()
+    
     quote_id = data['quote_id']
-    success = stats_tracker.add_favorite(quote_id)
+    success = services.stats_tracker.add_favorite(quote_id, client_id)
     
     if success:
-        log_event('favorite_added', {'quote_id': quote_id})
+        services.quote_manager.set_popularity('favorites', quote_id,
+                                              services.stats_tracker.favorite_count(quote_id))
+        services.log_event('favorite_added', {'quote_id': quote_id, 'client_id': client_id})
         return jsonify({'message': 'Quote added to favorites', 'quote_id': quote_id})
     else:
-        log_event('favorite_add_failed', {'quote_id': quote_id})
+        services.log_event('favorite_add_failed', {'quote_id': quote_id})
         return jsonify({'error': 'Invalid quote_id'}), 400
 
 
-@app.route('/api/favorites', methods=['GET'])
+@api.route('/api/favorites', methods=['GET'])
 def get_favorites():
-    """Get all favorite quote IDs"""
+    """Get the calling client's favorite quote IDs"""
+    services = get_services()
+    client_id = request_client_id()
+    if client_id is None:
+        return invalid_client_id()
+    
     try:
-        favorites = stats_tracker.get_favorites()
-        log_event('favorites_requested', {'count': len(favorites)})
+        favorites = services.stats_tracker.get_favorites(client_id)
+        services.log_event('favorites_requested', {'count': len(favorites), 'client_id': client_id})
         return jsonify({'favorites': favorites, 'count': len(favorites)})
     except Exception as e:
-        log_event('favorites_error', {'error': str(e)})
+        services.log_event('favorites_error', {'error': str(e)})
+        return jsonify({'error': 'Failed to fetch favorites'}), 500
+
+
+@api.route('/api/favorites/top', methods=['GET'])
+def get_top_favorites():
+    """Get the quotes favorited by the most clients"""
+    services = get_services()
+    try:
+        limit = min(MAX_TOP_FAVORITES, max(1, int(request.args.get('limit', '10'))))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    try:
+        top = services.stats_tracker.top_favorites(limit)
+        services.log_event('top_favorites_requested', {'limit': limit})
+        return jsonify({
+            'top': [{'quote_id': quote_id, 'clients': clients} for quote_id, clients in top],
+            'count': len(top)
+        })
+    except Exception as e:
+        services.log_event('favorites_error', {'error': str(e)})
         return jsonify({'error': 'Failed to fetch favorites'}), 500
 
 
-@app.route('/health', methods=['GET'])
+def admin_token_matches(supplied):
+    """Whether a supplied value is the configured ADMIN_TOKEN"""
+    token = get_services().settings.get('ADMIN_TOKEN')
+    if not token or not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def admin_denied():
+    """Error response for admin routes, or None if the bearer token is valid"""
+    if not get_services().settings.get('ADMIN_TOKEN'):
+        return jsonify({'error': 'Not found'}), 404
+    if not admin_token_matches(request.headers.get('Authorization', '').removeprefix('Bearer ')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+
+@api.route('/admin/reload', methods=['POST'])
+def reload_corpus():
+    """Reload the quote corpus; requires the ADMIN_TOKEN bearer token"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    services = get_services()
+    # Runs on the admin's request only; user requests keep reading the old snapshot
+    success = services.corpus_reloader.reload()
+    status = services.corpus_reloader.get_status()
+    services.log_event('corpus_reloaded' if success else 'corpus_reload_failed', status)
+    return jsonify(status), 200 if success else 500
+
+
+@api.route('/admin/profile', methods=['GET'])
+def get_profile_status():
+    """List request profiles, stack sampler state and span timings"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    services = get_services()
+    profiler = services.request_profiler
+    return jsonify({
+        'requests': {
+            'sample_rate': profiler.sample_rate,
+            'captured': profiler.captured,
+            'captures': profiler.list()
+        },
+        'sampler': services.stack_sampler.get_status(),
+        'spans': services.spans.summary() if services.spans else None
+    })
+
+
+@api.route('/admin/profile/requests/<int:capture_id>', methods=['GET'])
+def get_request_profile(capture_id):
+    """Get one request's cProfile report as text"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    report = get_services().request_profiler.report(capture_id)
+    if report is None:
+        return jsonify({'error': f'No profile with id {capture_id}'}), 404
+    return current_app.response_class(report, mimetype='text/plain')
+
+
+@api.route('/admin/profile/sampler', methods=['POST'])
+def control_stack_sampler():
+    """Start (?action=start&duration=<seconds>) or stop the stack sampler"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    services = get_services()
+    action = request.args.get('action', 'start')
+    if action == 'start':
+        try:
+            duration = float(request.args.get('duration', '30'))
+        except ValueError:
+            return jsonify({'error': 'duration must be a number of seconds'}), 400
+        if not services.stack_sampler.start(duration if duration > 0 else None):
+            return jsonify({'error': 'Sampler already running'}), 409
+    elif action == 'stop':
+        services.stack_sampler.stop()
+    else:
+        return jsonify({'error': 'action must be start or stop'}), 400
+    
+    services.log_event('stack_sampler_' + action, {})
+    return jsonify(services.stack_sampler.get_status())
+
+
+@api.route('/admin/profile/flamegraph', methods=['GET'])
+def get_flamegraph():
+    """Download the sampled stacks in collapsed format for flamegraph tools"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    return current_app.response_class(get_services().stack_sampler.collapsed(),
+                                      mimetype='text/plain')
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose request latency and app counters in Prometheus text format"""
+    services = get_services()
+    stats = services.stats_tracker.get_stats()
+    counters = services.telemetry.get_counters()
+    corpus = services.corpus_reloader.get_status()
+    admission = services.admission_counters()
+    limiter = admission['rate_limiter'] or {'limited': 0, 'buckets': 0}
+    shedder = admission['load_shedder'] or {'shed': 0}
+    startup = services.startup.report(IMPORT_SECONDS)
+    compression = services.compression.get_counters() if services.compression else {
+        'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+    body = services.request_metrics.render({
+        'quotes_fetched_total': ('counter', 'Quotes served.', stats['total_quotes_fetched']),
+        'favorites_total': ('gauge', 'Quotes marked as favorite.', stats['total_favorites']),
+        'telemetry_events_flushed_total': ('counter', 'Telemetry events exported.', counters['flushed']),
+        'telemetry_events_dropped_total': ('counter', 'Telemetry events dropped on a full queue.', counters['dropped']),
+        'telemetry_events_queued': ('gauge', 'Telemetry events waiting for export.', counters['queued']),
+        'corpus_generation': ('gauge', 'Generation of the published corpus snapshot.', corpus['generation']),
+        'corpus_reloads_total': ('counter', 'Successful corpus reloads.', corpus['reloads']),
+        'corpus_reload_failures_total': ('counter', 'Failed corpus reloads.', corpus['failures']),
+        'corpus_reload_duration_seconds': ('gauge', 'Duration of the last corpus reload.',
+                                           corpus['last_duration_seconds'] or 0.0),
+        'requests_rate_limited_total': ('counter', 'Requests rejected with 429.', limiter['limited']),
+        'rate_limiter_buckets': ('gauge', 'Client buckets held by the rate limiter.', limiter['buckets']),
+        'requests_shed_total': ('counter', 'Requests rejected with 503 by load shedding.', shedder['shed']),
+        'compression_bytes_in_total': ('counter', 'Response bytes before compression.',
+                                       compression['bytes_in']),
+        'compression_bytes_out_total': ('counter', 'Response bytes after compression.',
+                                        compression['bytes_out']),
+        'compression_cpu_seconds_total': ('counter', 'CPU time spent compressing responses.',
+                                          compression['cpu_seconds']),
+        'app_import_seconds': ('gauge', 'Time spent importing the app modules.', startup['import_seconds']),
+        'app_startup_seconds': ('gauge', 'Time spent building the app services.', startup['total_seconds'])
+    })
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
+    services = get_services()
     try:
-        log_event('health_check', {
+        services.log_event('health_check', {
             'status': 'healthy',
-            'monitoring_enabled': connection_string is not None
+            'monitoring_enabled': services.connection_string is not None
         })
         return jsonify({
             'status': 'healthy', 
             'service': 'quote-generator',
-            'monitoring': 'enabled' if connection_string else 'disabled'
+            'monitoring': 'enabled' if services.connection_string else 'disabled',
+            'telemetry': services.telemetry.get_counters(),
+            'corpus': services.corpus_reloader.get_status(),
+            'admission': services.admission_counters(),
+            'shuffle_bags': services.shuffle_bags.get_counters(),
+            'compression': services.compression.get_counters() if services.compression else None,
+            'stats_history': services.stats_history.get_status() if services.stats_history else None,
+            'startup': services.startup.report(IMPORT_SECONDS)
         })
     except Exception as e:
-        log_event('health_check_failed', {'error': str(e)})
+        services.log_event('health_check_failed', {'error': str(e)})
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
 
-
 if __name__ == '__main__':
     # Only for local development
     debug_mode = os.getenv('FLASK_ENV', 'production') == 'development'
-    app.run(debug=debug_mode, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=debug_mode, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+from array import array
+
+
+SUB_BUCKETS = 4
+MIN_EXPONENT = -13  # frexp exponent of the first octave: [61 us, 122 us)
+MAX_EXPONENT = 6    # last octave ends at 64 s
+OCTAVES = MAX_EXPONENT - MIN_EXPONENT + 1
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Any other method is labelled 'other' so clients cannot mint new series
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'))
+
+
+def _upper_bounds():
+    """Upper edge of every bucket: underflow, log-linear buckets, overflow"""
+    bounds = [math.ldexp(1.0, MIN_EXPONENT - 1)]
+    for octave in range(OCTAVES):
+        base = math.ldexp(1.0, MIN_EXPONENT + octave - 1)
+        bounds.extend(base * (1 + (k + 1) / SUB_BUCKETS) for k in range(SUB_BUCKETS))
+    bounds.append(math.inf)
+    return bounds
+
+
+UPPER_BOUNDS = _upper_bounds()
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram: each octave is split into four buckets.
+    
+    Recording is a frexp() call and one array increment, and quantiles are
+    accurate to within a quarter of an octave.
+    """
+    
+    def __init__(self):
+        self.counts = array('Q', [0]) * len(UPPER_BOUNDS)
+        self.count = 0
+        self.sum = 0.0
+    
+    @staticmethod
+    def bucket_index(seconds):
+        """Bucket that a duration falls into"""
+        mantissa, exponent = math.frexp(seconds)
+        if seconds <= 0 or exponent < MIN_EXPONENT:
+            return 0
+        if exponent > MAX_EXPONENT:
+            return len(UPPER_BOUNDS) - 1
+        return 1 + (exponent - MIN_EXPONENT) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    
+    def record(self, seconds):
+        """Record one duration"""
+        self.counts[self.bucket_index(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+    
+    def snapshot(self):
+        """Copy of this histogram, safe to read while the original records"""
+        copy = LatencyHistogram()
+        copy.counts = array('Q', self.counts)
+        copy.count = self.count
+        copy.sum = self.sum
+        return copy
+    
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(UPPER_BOUNDS[index], UPPER_BOUNDS[-2])
+        return UPPER_BOUNDS[-2]
+    
+    def cumulative_buckets(self):
+        """(le, cumulative count) at every octave boundary, ending with +Inf"""
+        buckets = []
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if index % SUB_BUCKETS == 0 or index == len(self.counts) - 1:
+                buckets.append((UPPER_BOUNDS[index], seen))
+        return buckets
+
+
+class RequestMetrics:
+    """Per-route latency histograms and in-flight gauges for the Flask app.
+    
+    Request threads update the gauges and histograms under one lock, held
+    only for the few increments of each start and finish.
+    """
+    
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.histograms = {}
+        self.in_flight = {}
+        self._lock = threading.Lock()
+    
+    def start(self, route):
+        """Mark a request as started; returns the token for finish()"""
+        with self._lock:
+            self.in_flight[route] = self.in_flight.get(route, 0) + 1
+        return self.clock()
+    
+    def finish(self, route, method, status, started):
+        """Record a finished request"""
+        elapsed = self.clock() - started
+        if method not in HTTP_METHODS:
+            method = 'other'
+        key = (route, method, status)
+        with self._lock:
+            self.in_flight[route] -= 1
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(elapsed)
+    
+    def quantiles(self, route, method='GET', status=200):
+        """p50/p90/p99 in seconds for one route, or None if unseen"""
+        histogram = self.histograms.get((route, method, status))
+        if histogram is None:
+            return None
+        return {f'p{int(q * 100)}': histogram.quantile(q) for q in QUANTILES}
+    
+    def render(self, extra=None):
+        """Render all metrics in the Prometheus text exposition format.
+        
+        `extra` maps metric names to (type, help, value) for simple
+        counters and gauges owned by other components.
+        """
+        with self._lock:
+            histograms = sorted((key, histogram.snapshot())
+                                for key, histogram in self.histograms.items())
+            in_flight = sorted(self.in_flight.items())
+        
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route, method and status.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (route, method, status), histogram in histograms:
+            labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+            for le, count in histogram.cumulative_buckets():
+                bound = '+Inf' if le == math.inf else repr(le)
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum!r}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+        
+        lines.append('# HELP http_request_duration_quantile_seconds Estimated latency quantiles.')
+        lines.append('# TYPE http_request_duration_quantile_seconds gauge')
+        for (route, method, status), histogram in histograms:
+            labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+            for q in QUANTILES:
+                value = histogram.quantile(q)
+                lines.append(f'http_request_duration_quantile_seconds{{{labels},quantile="{q}"}} {value!r}')
+        
+        lines.append('# HELP http_requests_in_flight Requests currently being handled.')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        for route, value in in_flight:
+            lines.append(f'http_requests_in_flight{{route="{_escape(route)}"}} {value}')
+        
+        for name, (metric_type, description, value) in (extra or {}).items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+        
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
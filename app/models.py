@@ -1,61 +1,303 @@
 import random
+from array import array
+from collections import namedtuple
+from heapq import merge
+from .corpus import MappedCorpus
+from .quote_table import QuoteTable
+from .responses import JsonBodyCache
+from .sampling import WeightedSampler
+from .search import SearchIndex
+
+
+# A quote together with its ready-to-send JSON body
+QuoteEntry = namedtuple('QuoteEntry', ['quote', 'body', 'etag'])
+
+# Popularity signals that weighted random selection can follow
+WEIGHT_MODES = ('fetches', 'favorites')
+
+DEFAULT_QUOTES = [
+    # Motivational Quotes
+    {"id": 1, "text": "The only way to do great work is to love what you do.", "author": "Steve Jobs", "category": "motivational"},
+    {"id": 2, "text": "Success is not final, failure is not fatal: it is the courage to continue that counts.", "author": "Winston Churchill", "category": "motivational"},
+    {"id": 3, "text": "Believe you can and you're halfway there.", "author": "Theodore Roosevelt", "category": "motivational"},
+    {"id": 4, "text": "Don't watch the clock; do what it does. Keep going.", "author": "Sam Levenson", "category": "motivational"},
+    {"id": 5, "text": "The future belongs to those who believe in the beauty of their dreams.", "author": "Eleanor Roosevelt", "category": "motivational"},
+    {"id": 6, "text": "It does not matter how slowly you go as long as you do not stop.", "author": "Confucius", "category": "motivational"},
+    {"id": 7, "text": "Everything you've ever wanted is on the other side of fear.", "author": "George Addair", "category": "motivational"},
+    
+    # Wisdom Quotes
+    {"id": 8, "text": "The only true wisdom is in knowing you know nothing.", "author": "Socrates", "category": "wisdom"},
+    {"id": 9, "text": "In the middle of difficulty lies opportunity.", "author": "Albert Einstein", "category": "wisdom"},
+    {"id": 10, "text": "Life is what happens when you're busy making other plans.", "author": "John Lennon", "category": "wisdom"},
+    {"id": 11, "text": "The journey of a thousand miles begins with one step.", "author": "Lao Tzu", "category": "wisdom"},
+    {"id": 12, "text": "Be yourself; everyone else is already taken.", "author": "Oscar Wilde", "category": "wisdom"},
+    {"id": 13, "text": "Yesterday is history, tomorrow is a mystery, but today is a gift.", "author": "Eleanor Roosevelt", "category": "wisdom"},
+    {"id": 14, "text": "The best time to plant a tree was 20 years ago. The second best time is now.", "author": "Chinese Proverb", "category": "wisdom"},
+    
+    # Humor Quotes
+    {"id": 15, "text": "I'm not superstitious, but I am a little stitious.", "author": "Michael Scott", "category": "humor"},
+    {"id": 16, "text": "I told my wife she was drawing her eyebrows too high. She looked surprised.", "author": "Anonymous", "category": "humor"},
+    {"id": 17, "text": "The problem with troubleshooting is that trouble shoots back.", "author": "Anonymous", "category": "humor"},
+    {"id": 18, "text": "I'm not arguing, I'm just explaining why I'm right.", "author": "Anonymous", "category": "humor"},
+    {"id": 19, "text": "I used to think I was indecisive, but now I'm not so sure.", "author": "Anonymous", "category": "humor"},
+    {"id": 20, "text": "Why do programmers prefer dark mode? Because light attracts bugs!", "author": "Anonymous", "category": "humor"},
+]
+
+
+class CorpusSnapshot:
+    """One version of the corpus together with everything derived from it.
+    
+    A snapshot is fully built before it is published and is never
+    rebuilt in place; only the popularity weights in its samplers change.
+    """
+    
+    def __init__(self, quotes, generation):
+        self.quotes = quotes
+        self.generation = generation
+        self.index = QuoteIndex(quotes)
+        self.responses = JsonBodyCache(quotes, self.index.categories)
+        self.search = SearchIndex(quotes)
+        self.samplers = {mode: WeightedSampler(self.index) for mode in WEIGHT_MODES}
+    
+    def set_popularity(self, mode, quote_id, count):
+        """Update the popularity count that weighted draws use for a quote"""
+        position = self.index.by_id.get(quote_id)
+        if position is not None:
+            self.samplers[mode].set_count(position, count)
 
 
 class QuoteManager:
-    """Manages the quote database and retrieval"""
-    
-    def __init__(self):
-        self.quotes = [
-            # Motivational Quotes
-            {"id": 1, "text": "The only way to do great work is to love what you do.", "author": "Steve Jobs", "category": "motivational"},
-            {"id": 2, "text": "Success is not final, failure is not fatal: it is the courage to continue that counts.", "author": "Winston Churchill", "category": "motivational"},
-            {"id": 3, "text": "Believe you can and you're halfway there.", "author": "Theodore Roosevelt", "category": "motivational"},
-            {"id": 4, "text": "Don't watch the clock; do what it does. Keep going.", "author": "Sam Levenson", "category": "motivational"},
-            {"id": 5, "text": "The future belongs to those who believe in the beauty of their dreams.", "author": "Eleanor Roosevelt", "category": "motivational"},
-            {"id": 6, "text": "It does not matter how slowly you go as long as you do not stop.", "author": "Confucius", "category": "motivational"},
-            {"id": 7, "text": "Everything you've ever wanted is on the other side of fear.", "author": "George Addair", "category": "motivational"},
-            
-            # Wisdom Quotes
-            {"id": 8, "text": "The only true wisdom is in knowing you know nothing.", "author": "Socrates", "category": "wisdom"},
-            {"id": 9, "text": "In the middle of difficulty lies opportunity.", "author": "Albert Einstein", "category": "wisdom"},
-            {"id": 10, "text": "Life is what happens when you're busy making other plans.", "author": "John Lennon", "category": "wisdom"},
-            {"id": 11, "text": "The journey of a thousand miles begins with one step.", "author": "Lao Tzu", "category": "wisdom"},
-            {"id": 12, "text": "Be yourself; everyone else is already taken.", "author": "Oscar Wilde", "category": "wisdom"},
-            {"id": 13, "text": "Yesterday is history, tomorrow is a mystery, but today is a gift.", "author": "Eleanor Roosevelt", "category": "wisdom"},
-            {"id": 14, "text": "The best time to plant a tree was 20 years ago. The second best time is now.", "author": "Chinese Proverb", "category": "wisdom"},
-            
-            # Humor Quotes
-            {"id": 15, "text": "I'm not superstitious, but I am a little stitious.", "author": "Michael Scott", "category": "humor"},
-            {"id": 16, "text": "I told my wife she was drawing her eyebrows too high. She looked surprised.", "author": "Anonymous", "category": "humor"},
-            {"id": 17, "text": "The problem with troubleshooting is that trouble shoots back.", "author": "Anonymous", "category": "humor"},
-            {"id": 18, "text": "I'm not arguing, I'm just explaining why I'm right.", "author": "Anonymous", "category": "humor"},
-            {"id": 19, "text": "I used to think I was indecisive, but now I'm not so sure.", "author": "Anonymous", "category": "humor"},
-            {"id": 20, "text": "Why do programmers prefer dark mode? Because light attracts bugs!", "author": "Anonymous", "category": "humor"},
-        ]
+    """Manages the quote database and retrieval.
+    
+    All corpus state lives in a CorpusSnapshot. Every method reads
+    `self._snapshot` once and works on that object, so replacing the
+    attribute is an atomic publish: in-flight calls finish on the old
+    corpus, new calls see the new one, and readers never take a lock.
+    """
+    
+    def __init__(self, corpus_path=None):
+        self.corpus_path = corpus_path
+        self._snapshot = None
+        self.load_corpus(corpus_path)
+    
+    @property
+    def quotes(self):
+        return self._snapshot.quotes
+    
+    @property
+    def generation(self):
+        return self._snapshot.generation
+    
+    def load_corpus(self, corpus_path=None, popularity=None):
+        """Build a new snapshot off to the side and publish it in one step.
+        
+        `popularity` is an optional callable returning {mode: {quote_id:
+        count}}; it is read after the build so the new snapshot's weights
+        start from the latest counts.
+        """
+        if corpus_path:
+            # Large corpora stay on disk and are decoded per request
+            quotes = MappedCorpus(corpus_path)
+        else:
+            # In-memory quotes are stored column-wise, not as one dict each
+            quotes = QuoteTable(DEFAULT_QUOTES)
+        previous = self._snapshot
+        try:
+            snapshot = CorpusSnapshot(quotes, previous.generation + 1 if previous else 1)
+        except Exception:
+            if corpus_path:
+                quotes.close()
+            raise
+        
+        if popularity is not None:
+            self._apply_popularity(snapshot, popularity())
+        
+        # The previous corpus is not closed: in-flight requests may still
+        # hold it, and its mapping is released once they drop it
+        self._snapshot = snapshot
+        self.corpus_path = corpus_path
+        return snapshot
     
     def get_random_quote(self):
         """Get a random quote from all categories"""
-        return random.choice(self.quotes)
+        return random.choice(self._snapshot.quotes)
     
     def get_quote_by_category(self, category):
         """Get a random quote from a specific category"""
-        category_quotes = [q for q in self.quotes if q['category'].lower() == category.lower()]
-        if category_quotes:
-            return random.choice(category_quotes)
-        return None
+        entry = self.get_random_entry(category)
+        return entry.quote if entry else None
+    
+    def get_random_entry(self, category=None, weighted=None):
+        """Get a random quote with its pre-encoded JSON body and ETag.
+        
+        `weighted` names a popularity signal from WEIGHT_MODES; quotes are
+        then drawn in proportion to 1 + their count for that signal.
+        """
+        snapshot = self._snapshot
+        if weighted:
+            return self._weighted_entry(snapshot, category, snapshot.samplers[weighted])
+        
+        if category is None:
+            position = random.randrange(len(snapshot.quotes))
+        else:
+            positions = snapshot.index.by_category.get(category.lower())
+            if not positions:
+                return None
+            position = random.choice(positions)
+        return self._entry(snapshot, position)
+    
+    def get_shuffled_entry(self, bags, client, category=None):
+        """Get a client's next quote from its no-repeat shuffle of the corpus or a category.
+        
+        `bags` holds each client's position in its permutation; see ShuffleBags.
+        """
+        snapshot = self._snapshot
+        pool = self._category_pool(snapshot, category)
+        if not pool:
+            return None
+        index = bags.next_index(client, category.lower() if category else None, len(pool),
+                                snapshot.generation)
+        return self._entry(snapshot, pool[index])
+    
+    def _weighted_entry(self, snapshot, category, sampler):
+        code = None
+        if category is not None:
+            code = snapshot.index.category_code_by_key.get(category.lower())
+            if code is None:
+                return None
+        return self._entry(snapshot, sampler.sample(code))
+    
+    def set_popularity(self, mode, quote_id, count):
+        """Update the popularity count that weighted draws use for a quote"""
+        self._snapshot.set_popularity(mode, quote_id, count)
+    
+    def seed_popularity(self, counts):
+        """Set the weights of every quote in {mode: {quote_id: count}}"""
+        self._apply_popularity(self._snapshot, counts)
+    
+    @staticmethod
+    def _apply_popularity(snapshot, counts):
+        for mode, mode_counts in counts.items():
+            for quote_id, count in mode_counts.items():
+                snapshot.set_popularity(mode, quote_id, count)
+    
+    def sample_entries(self, count, category=None, unique=True):
+        """Get several random quotes in one call.
+        
+        With `unique` the quotes are drawn without replacement, so at most
+        the whole pool is returned. Returns None for an unknown category.
+        """
+        snapshot = self._snapshot
+        pool = self._category_pool(snapshot, category)
+        if pool is None:
+            return None
+        
+        if unique:
+            positions = random.sample(pool, min(count, len(pool)))
+        else:
+            positions = random.choices(pool, k=count) if pool else []
+        return [self._entry(snapshot, position) for position in positions]
+    
+    def iter_bodies(self, category=None):
+        """Yield the encoded JSON line of every quote, for streaming exports"""
+        snapshot = self._snapshot
+        responses = snapshot.responses
+        for position in self._category_pool(snapshot, category) or ():
+            yield responses.quote_body(position)
+    
+    @staticmethod
+    def _category_pool(snapshot, category):
+        """Positions to draw from: the whole corpus or one category"""
+        if category is None:
+            return range(len(snapshot.quotes))
+        return snapshot.index.by_category.get(category.lower())
+    
+    @staticmethod
+    def _entry(snapshot, position):
+        responses = snapshot.responses
+        return QuoteEntry(snapshot.quotes[position], responses.quote_body(position),
+                          responses.quote_etag(position))
     
     def get_quote_by_id(self, quote_id):
         """Get a specific quote by ID"""
-        for quote in self.quotes:
-            if quote['id'] == quote_id:
-                return quote
-        return None
+        snapshot = self._snapshot
+        position = snapshot.index.by_id.get(quote_id)
+        if position is None:
+            return None
+        return snapshot.quotes[position]
     
     def get_categories(self):
         """Get all unique categories"""
-        categories = list(set(q['category'] for q in self.quotes))
-        return sorted(categories)
+        return list(self._snapshot.index.categories)
+    
+    def has_category(self, category):
+        """Check whether any quote belongs to a category"""
+        return category.lower() in self._snapshot.index.by_category
+    
+    def get_categories_response(self):
+        """Get the pre-encoded categories body and its ETag"""
+        responses = self._snapshot.responses
+        return responses.categories_body, responses.categories_etag
+    
+    def search(self, query, field=None, offset=0, limit=10):
+        """Full-text search; returns the match count and a page of (quote, score)"""
+        snapshot = self._snapshot
+        total, page = snapshot.search.search(query, field, offset, limit)
+        return total, [(snapshot.quotes[position], score) for position, score in page]
     
     def get_quotes_by_author(self, author):
         """Get all quotes by a specific author"""
-        return [q for q in self.quotes if author.lower() in q['author'].lower()]
\ No newline at end of file
+        snapshot = self._snapshot
+        positions = snapshot.index.author_positions(author)
+        return [snapshot.quotes[p] for p in positions]
+
+
+class QuoteIndex:
+    """Lookup tables built once over a quote list.
+    
+    Everything is stored as positions into the quote list so the same
+    index works for any sequence of quotes.
+    """
+    
+    def __init__(self, quotes):
+        self.by_id = {}
+        self.by_category = {}
+        self.by_author = {}
+        # Per position: small-int category code and offset within that category
+        self.category_codes = array('H')
+        self.category_offsets = array('I')
+        self.category_code_by_key = {}
+        display_categories = set()
+        
+        for position, quote in enumerate(quotes):
+            # First occurrence wins, matching the old linear scan
+            self.by_id.setdefault(quote['id'], position)
+            
+            category = quote['category']
+            key = category.lower()
+            if key not in self.by_category:
+                self.category_code_by_key[key] = len(self.by_category)
+                self.by_category[key] = array('I')
+            self.category_codes.append(self.category_code_by_key[key])
+            self.category_offsets.append(len(self.by_category[key]))
+            self.by_category[key].append(position)
+            display_categories.add(category)
+            
+            author = quote['author'].lower()
+            if author not in self.by_author:
+                self.by_author[author] = array('I')
+            self.by_author[author].append(position)
+        
+        self.categories = tuple(sorted(display_categories))
+        self.positions_by_code = list(self.by_category.values())
+    
+    def author_positions(self, author):
+        """Positions of quotes whose author contains the given text"""
+        needle = author.lower()
+        
+        # Substring matching only needs a scan over distinct authors
+        matches = [positions for name, positions in self.by_author.items()
+                   if needle in name]
+        if len(matches) == 1:
+            return list(matches[0])
+        return list(merge(*matches))
@@ -0,0 +1,273 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask.json.provider import DefaultJSONProvider
+
+
+class SpanTimer:
+    """Calls, total and worst-case wall time per named span"""
+    
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._spans = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block"""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - started)
+    
+    def wrap(self, name, function):
+        """Return `function` timed as a span on every call"""
+        clock = self.clock
+        
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, clock() - started)
+        return timed
+    
+    def record(self, name, seconds):
+        """Add one timing to a span"""
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = [0, 0.0, 0.0]
+            span[0] += 1
+            span[1] += seconds
+            if seconds > span[2]:
+                span[2] = seconds
+    
+    def summary(self):
+        """Get every span's counters, slowest total first"""
+        with self._lock:
+            spans = sorted(self._spans.items(), key=lambda item: -item[1][1])
+        return {name: {'calls': calls,
+                       'total_seconds': round(total, 6),
+                       'mean_seconds': round(total / calls, 9),
+                       'max_seconds': round(worst, 6)}
+                for name, (calls, total, worst) in spans}
+    
+    def reset(self):
+        """Forget all timings"""
+        with self._lock:
+            self._spans = {}
+
+
+class TimedProxy:
+    """Stands in for a service object, timing each public method call.
+    
+    Spans are named '<prefix>.<method>'. Only used when span timing is
+    enabled, so the default configuration pays nothing for it.
+    """
+    
+    def __init__(self, target, prefix, spans):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_prefix', prefix)
+        object.__setattr__(self, '_spans', spans)
+    
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if callable(value) and not name.startswith('_'):
+            return self._spans.wrap(f'{self._prefix}.{name}', value)
+        return value
+    
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that times every serialization as a span"""
+    
+    spans = None
+    
+    def dumps(self, obj, **kwargs):
+        started = self.spans.clock()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            self.spans.record('json.dumps', self.spans.clock() - started)
+
+
+class StackSampler:
+    """Counts collapsed stacks of every thread, sampled on a timer.
+    
+    Sampling reads sys._current_frames() from a background thread, so the
+    profiled threads run untouched: the cost is one walk of each stack
+    per interval, independent of how many calls they make. Output is the
+    collapsed format read by flamegraph.pl and speedscope, one
+    'thread;outer;...;inner count' line per distinct stack.
+    """
+    
+    def __init__(self, interval=0.005, max_stacks=10000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.counts = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = None
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, duration=None):
+        """Start a fresh sampling session; returns False if one is running"""
+        if self.running:
+            return False
+        self.counts = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        deadline = time.monotonic() + duration if duration else None
+        self._thread = threading.Thread(target=self._run, args=(deadline,),
+                                        name='stack-sampler', daemon=True)
+        self._thread.start()
+        return True
+    
+    def stop(self):
+        """Stop sampling and keep the collected stacks"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def _run(self, deadline):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self.sample(exclude=own)
+    
+    def sample(self, exclude=None):
+        """Record the current stack of every thread"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            key = ';'.join(reversed(stack))
+            
+            if key in self.counts:
+                self.counts[key] += 1
+            elif len(self.counts) < self.max_stacks:
+                self.counts[key] = 1
+            else:
+                self.dropped += 1
+        self.samples += 1
+    
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (f'{code.co_name} '
+                                          f'({os.path.basename(code.co_filename)}:'
+                                          f'{code.co_firstlineno})')
+        return label
+    
+    def collapsed(self):
+        """Get the collapsed-stack text, most sampled stacks first"""
+        counts = sorted(self.counts.items(), key=lambda item: -item[1])
+        return ''.join(f'{stack} {count}\n' for stack, count in counts)
+    
+    def get_status(self):
+        """Get sampler state and counters"""
+        return {
+            'running': self.running,
+            'interval_seconds': self.interval,
+            'started_at': self.started_at,
+            'samples': self.samples,
+            'stacks': len(self.counts),
+            'dropped': self.dropped
+        }
+
+
+class RequestProfiler:
+    """Runs cProfile over a sampled fraction of requests.
+    
+    The latest `max_captures` profiles are kept in memory; the pstats
+    report is only formatted when a capture is read, so the profiled
+    request itself pays just for cProfile.
+    """
+    
+    def __init__(self, sample_rate=0.0, max_captures=20, report_lines=40, rng=random.random):
+        self.sample_rate = sample_rate
+        self.max_captures = max_captures
+        self.report_lines = report_lines
+        self.rng = rng
+        self._captures = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        
+        self.captured = 0
+        self.skipped = 0
+    
+    def should_profile(self, forced=False):
+        """Decide whether to profile a request"""
+        return forced or (self.sample_rate > 0 and self.rng() < self.sample_rate)
+    
+    def start(self):
+        """Start profiling the current thread; None if another profiler is active"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            self.skipped += 1
+            return None
+        return profile
+    
+    def finish(self, profile, method, path, status, duration):
+        """Stop a profile and keep it; returns its capture id"""
+        profile.disable()
+        with self._lock:
+            capture_id = next(self._ids)
+            self._captures[capture_id] = {
+                'id': capture_id,
+                'method': method,
+                'path': path,
+                'status': status,
+                'duration_seconds': round(duration, 6),
+                'captured_at': time.time(),
+                'profile': profile
+            }
+            if len(self._captures) > self.max_captures:
+                self._captures.popitem(last=False)
+            self.captured += 1
+        return capture_id
+    
+    def list(self):
+        """Get every kept capture without its report, newest first"""
+        with self._lock:
+            captures = list(self._captures.values())
+        return [{key: value for key, value in capture.items() if key != 'profile'}
+                for capture in reversed(captures)]
+    
+    def report(self, capture_id):
+        """Get a capture's pstats report sorted by cumulative time, or None"""
+        capture = self._captures.get(capture_id)
+        if capture is None:
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(capture['profile'], stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.report_lines)
+        return stream.getvalue()
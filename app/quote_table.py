@@ -0,0 +1,85 @@
+from array import array
+
+
+COLUMNS = ('id', 'text', 'author', 'category')
+
+
+class QuoteTable:
+    """Column-oriented, read-only quote storage.
+    
+    Instead of one dict per quote, the table keeps parallel arrays: ids,
+    small-int author and category codes pointing into lists of distinct
+    (interned) strings, and offsets into one UTF-8 buffer holding every
+    quote text. A quote dict is only built when a row is read, so memory
+    grows by a few dozen bytes per quote rather than a dict, four keys'
+    worth of slots and separate string objects.
+    
+    Fields beyond the four standard columns are kept per row in a sparse
+    dict, so rows read back exactly as they were given.
+    """
+    
+    def __init__(self, quotes):
+        self.ids = array('q')
+        self.author_codes = array('I')
+        self.category_codes = array('H')
+        self.authors = []
+        self.categories = []
+        self._text_offsets = array('Q', [0])
+        self._extras = {}
+        
+        author_codes = {}
+        category_codes = {}
+        text = bytearray()
+        for position, quote in enumerate(quotes):
+            self.ids.append(quote['id'])
+            self.author_codes.append(_intern(quote['author'], author_codes, self.authors))
+            self.category_codes.append(_intern(quote['category'], category_codes, self.categories))
+            text += quote['text'].encode('utf-8')
+            self._text_offsets.append(len(text))
+            
+            if len(quote) > len(COLUMNS):
+                self._extras[position] = {key: value for key, value in quote.items()
+                                          if key not in COLUMNS}
+        
+        self._text = bytes(text)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self.ids)
+        offsets = self._text_offsets
+        quote = {
+            'id': self.ids[position],
+            'text': self._text[offsets[position]:offsets[position + 1]].decode('utf-8'),
+            'author': self.authors[self.author_codes[position]],
+            'category': self.categories[self.category_codes[position]]
+        }
+        if self._extras:
+            quote.update(self._extras.get(position, ()))
+        return quote
+    
+    def __iter__(self):
+        for position in range(len(self.ids)):
+            yield self[position]
+    
+    def text(self, position):
+        """Decode one quote's text from the shared buffer"""
+        start, end = self._text_offsets[position], self._text_offsets[position + 1]
+        return self._text[start:end].decode('utf-8')
+    
+    def nbytes(self):
+        """Approximate bytes held by the columns, excluding interned strings"""
+        return (len(self._text)
+                + sum(column.itemsize * len(column) for column in
+                      (self.ids, self.author_codes, self.category_codes, self._text_offsets)))
+
+
+def _intern(value, codes, values):
+    """Code for a string, adding it to the distinct values on first sight"""
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = len(values)
+        values.append(value)
+    return code
@@ -0,0 +1,133 @@
+import os
+import signal
+import threading
+import time
+
+
+class CorpusReloader:
+    """Rebuilds the quote corpus at runtime without blocking requests.
+    
+    A reload builds a complete CorpusSnapshot on the calling thread and
+    then publishes it through QuoteManager.load_corpus, which is a single
+    attribute swap. Reloads are serialised by a lock that readers never
+    touch. Signals and the file watcher run the build on a background
+    thread; the admin endpoint runs it on the admin's own request, so no
+    user request ever pays for it.
+    
+    Each worker process reloads its own copy; with several workers, use
+    the file watcher (or signal every worker) to keep them in step.
+    
+    A new corpus must replace the old file atomically (write it elsewhere,
+    then os.replace() it over the path): the live snapshot maps the file,
+    and truncating or rewriting it in place can kill the worker with
+    SIGBUS. A reload of a file that was changed in place is refused.
+    """
+    
+    def __init__(self, quote_manager, popularity=None, clock=time.perf_counter):
+        self.quote_manager = quote_manager
+        self.popularity = popularity
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._watch_signature = None
+        
+        self.reloads = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_error = None
+        self.loaded_at = time.time()
+    
+    def reload(self, corpus_path=None):
+        """Build and publish a new snapshot; returns True on success.
+        
+        Defaults to the manager's current corpus path. A corpus that fails
+        to load leaves the current snapshot in place.
+        """
+        if corpus_path is None:
+            corpus_path = self.quote_manager.corpus_path
+        
+        with self._lock:
+            started = self.clock()
+            try:
+                self._check_replaced(corpus_path)
+                self.quote_manager.load_corpus(corpus_path, self.popularity)
+            except (OSError, ValueError) as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Corpus reload failed: {e}")
+                return False
+            
+            self.last_duration = self.clock() - started
+            self.last_error = None
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self._watch_signature = _file_signature(corpus_path)
+            return True
+    
+    def _check_replaced(self, corpus_path):
+        """Refuse a corpus that was rewritten in place under the live mapping"""
+        current = self.quote_manager.quotes
+        if (corpus_path and corpus_path == self.quote_manager.corpus_path
+                and hasattr(current, 'modified_in_place') and current.modified_in_place()):
+            raise ValueError(f"{corpus_path} was modified in place; "
+                             "write the new corpus elsewhere and os.replace() it over the path")
+    
+    def request_reload(self, corpus_path=None):
+        """Reload on a background thread and return immediately"""
+        thread = threading.Thread(target=self.reload, args=(corpus_path,),
+                                  name='corpus-reload', daemon=True)
+        thread.start()
+        return thread
+    
+    def install_signal_handler(self, signum=signal.SIGHUP):
+        """Reload when the process receives `signum` (main thread only)"""
+        signal.signal(signum, lambda *_: self.request_reload())
+    
+    def watch(self, interval):
+        """Poll the corpus file and reload whenever it is replaced or changes"""
+        self._watch_signature = _file_signature(self.quote_manager.corpus_path)
+        thread = threading.Thread(target=self._watch, args=(interval,),
+                                  name='corpus-watch', daemon=True)
+        thread.start()
+        return thread
+    
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                # Keep watching: the next change may well load
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Corpus watch failed: {e}")
+    
+    def check_for_changes(self):
+        """Reload if the corpus file changed since the last load"""
+        signature = _file_signature(self.quote_manager.corpus_path)
+        if signature is not None and signature != self._watch_signature:
+            self._watch_signature = signature
+            return self.reload()
+        return False
+    
+    def get_status(self):
+        """Get the current generation and reload counters"""
+        return {
+            'generation': self.quote_manager.generation,
+            'corpus_path': self.quote_manager.corpus_path,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_duration_seconds': self.last_duration,
+            'last_error': self.last_error
+        }
+
+
+def _file_signature(path):
+    """(inode, mtime, size) of a file, or None when there is no file to watch"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
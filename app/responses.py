@@ -0,0 +1,50 @@
+import json
+from array import array
+from hashlib import blake2b
+
+
+def encode_json(payload):
+    """Encode a payload the same way jsonify does outside debug mode"""
+    text = json.dumps(payload, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+    return (text + '\n').encode('utf-8')
+
+
+def body_digest(body):
+    """64-bit content hash used as a strong ETag"""
+    return int.from_bytes(blake2b(body, digest_size=8).digest(), 'big')
+
+
+class JsonBodyCache:
+    """JSON response bodies and ETags, encoded once per corpus load.
+    
+    Bodies for in-memory corpora are pre-encoded into one contiguous
+    buffer indexed by offsets, rather than one bytes object per quote. A
+    memory-mapped corpus already stores one JSON object per line, so its
+    bodies are sliced straight from the mapping and only the 8-byte
+    digests are kept.
+    """
+    
+    def __init__(self, quotes, categories):
+        self._quotes = quotes
+        self._mapped = hasattr(quotes, 'raw')
+        if not self._mapped:
+            bodies = bytearray()
+            self._offsets = array('Q', [0])
+            for quote in quotes:
+                bodies += encode_json(quote)
+                self._offsets.append(len(bodies))
+            self._bodies = bytes(bodies)
+        self._digests = array('Q', (body_digest(self.quote_body(p)) for p in range(len(quotes))))
+        
+        self.categories_body = encode_json({'categories': list(categories)})
+        self.categories_etag = f'{body_digest(self.categories_body):016x}'
+    
+    def quote_body(self, position):
+        """Get the encoded JSON body for the quote at a position"""
+        if self._mapped:
+            return self._quotes.raw(position) + b'\n'
+        return self._bodies[self._offsets[position]:self._offsets[position + 1]]
+    
+    def quote_etag(self, position):
+        """Get the ETag for the quote at a position"""
+        return f'{self._digests[position]:016x}'
@@ -0,0 +1,101 @@
+import random
+from array import array
+
+
+class FenwickTree:
+    """Binary indexed tree over non-negative integer weights.
+
+    Point updates, prefix sums and weighted draws all take O(log n).
+    """
+
+    def __init__(self, size, initial=0):
+        self.size = size
+        self._tree = array('Q', [0]) * (size + 1)
+        if initial:
+            # Linear-time build: push each node's sum up to its parent
+            tree = self._tree
+            for i in range(1, size + 1):
+                tree[i] += initial
+                parent = i + (i & -i)
+                if parent <= size:
+                    tree[parent] += tree[i]
+
+    def add(self, index, delta):
+        """Add delta to the weight at a 0-based index"""
+        i = index + 1
+        tree = self._tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, count):
+        """Sum of the first `count` weights"""
+        total = 0
+        tree = self._tree
+        while count > 0:
+            total += tree[count]
+            count -= count & -count
+        return total
+
+    def get(self, index):
+        """Weight at a 0-based index"""
+        return self.prefix_sum(index + 1) - self.prefix_sum(index)
+
+    def total(self):
+        """Sum of all weights"""
+        return self.prefix_sum(self.size)
+
+    def find(self, target):
+        """Smallest 0-based index whose prefix sum exceeds target"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        tree = self._tree
+        while step:
+            candidate = position + step
+            if candidate <= self.size and tree[candidate] <= target:
+                position = candidate
+                target -= tree[candidate]
+            step >>= 1
+        return position
+
+    def sample(self, rng=random):
+        """Draw an index with probability proportional to its weight"""
+        return self.find(rng.randrange(self.total()))
+
+
+class WeightedSampler:
+    """Popularity-weighted random draws over a QuoteIndex.
+
+    Every category has its own Fenwick tree over its quotes, and a small
+    tree over the categories holds their totals. A draw from the whole
+    corpus picks a category by weight and then a quote inside it, so both
+    draws and weight updates are O(log n) with no per-request rebuild.
+    Every quote starts at `base_weight` so unpopular quotes still appear.
+    """
+
+    def __init__(self, index, base_weight=1):
+        self.base_weight = base_weight
+        self._index = index
+        self._quotes = [FenwickTree(len(positions), base_weight)
+                        for positions in index.by_category.values()]
+        self._categories = FenwickTree(len(self._quotes))
+        for code, tree in enumerate(self._quotes):
+            self._categories.add(code, tree.total())
+
+    def set_count(self, position, count):
+        """Set the popularity count of the quote at a position"""
+        code = self._index.category_codes[position]
+        local = self._index.category_offsets[position]
+        tree = self._quotes[code]
+
+        delta = self.base_weight + count - tree.get(local)
+        if delta:
+            tree.add(local, delta)
+            self._categories.add(code, delta)
+
+    def sample(self, category_code=None, rng=random):
+        """Draw a quote position, optionally within one category"""
+        if category_code is None:
+            category_code = self._categories.sample(rng)
+        local = self._quotes[category_code].sample(rng)
+        return self._index.positions_by_code[category_code][local]
@@ -0,0 +1,117 @@
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+SEARCH_FIELDS = ('text', 'author')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class FieldIndex:
+    """Inverted index for one quote field.
+    
+    Each term maps to parallel arrays of quote positions and term
+    frequencies; the sorted vocabulary allows prefix lookups by bisection.
+    """
+    
+    def __init__(self):
+        self.postings = {}
+        self.lengths = array('I')
+        self.terms = []
+        self.average_length = 1.0
+    
+    def add(self, position, text):
+        """Index one field value; positions must be added in order"""
+        tokens = tokenize(text)
+        self.lengths.append(len(tokens))
+        
+        for term, freq in Counter(tokens).items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('I'), array('H'))
+            entry[0].append(position)
+            entry[1].append(min(freq, 0xFFFF))
+    
+    def finish(self):
+        """Prepare the vocabulary and length statistics for querying"""
+        self.terms = sorted(self.postings)
+        if self.lengths:
+            self.average_length = (sum(self.lengths) / len(self.lengths)) or 1.0
+    
+    def expand(self, token, prefix):
+        """Get the indexed terms a query token matches"""
+        if not prefix:
+            return [token] if token in self.postings else []
+        
+        terms = []
+        i = bisect_left(self.terms, token)
+        while i < len(self.terms) and self.terms[i].startswith(token):
+            terms.append(self.terms[i])
+            i += 1
+        return terms
+    
+    def accumulate(self, terms, scores):
+        """Add the BM25 contribution of each term to the score table"""
+        documents = len(self.lengths)
+        average = self.average_length
+        lengths = self.lengths
+        
+        for term in terms:
+            positions, freqs = self.postings[term]
+            df = len(positions)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            for position, freq in zip(positions, freqs):
+                norm = K1 * (1 - B + B * lengths[position] / average)
+                scores[position] = scores.get(position, 0.0) + idf * freq * (K1 + 1) / (freq + norm)
+
+
+class SearchIndex:
+    """BM25-ranked full-text search over quote text and authors.
+    
+    Built once per corpus load. A query only touches the postings of the
+    terms it matches, so its cost does not grow with the corpus size.
+    Query tokens ending in `*` match every term with that prefix.
+    """
+    
+    def __init__(self, quotes):
+        self.fields = {field: FieldIndex() for field in SEARCH_FIELDS}
+        for position, quote in enumerate(quotes):
+            for field, index in self.fields.items():
+                index.add(position, quote[field])
+        for index in self.fields.values():
+            index.finish()
+    
+    def search(self, query, field=None, offset=0, limit=10):
+        """Rank quotes for a query.
+        
+        Returns the total number of matches and one page of
+        (position, score) pairs, best first.
+        """
+        fields = [field] if field else SEARCH_FIELDS
+        scores = {}
+        
+        for name in fields:
+            index = self.fields[name]
+            terms = set()
+            for token in query.lower().split():
+                words = tokenize(token)
+                for i, word in enumerate(words):
+                    prefix = token.endswith('*') and i == len(words) - 1
+                    terms.update(index.expand(word, prefix))
+            index.accumulate(terms, scores)
+        
+        # Highest score first, then corpus order for stable pages
+        page = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), page[offset:]
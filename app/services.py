@@ -0,0 +1,250 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from .admission import LoadShedder, RateLimiter, parse_route_limits
+from .assets import DEFAULT_STATIC_FOLDER, AssetBundle
+from .favorites_store import FavoritesLog
+from .history import StatsHistory
+from .metrics import RequestMetrics
+from .models import QuoteManager
+from .profiling import RequestProfiler, SpanTimer, StackSampler, TimedJSONProvider, TimedProxy
+from .reload import CorpusReloader
+from .shared_stats import DEFAULT_SEGMENT_PATH, SharedStatsTracker
+from .shuffle import SharedShuffleBags, ShuffleBags
+from .stats import StatsTracker
+from .telemetry import TelemetryPipeline, parse_sample_rates
+
+
+class StartupTimer:
+    """Records how long each startup phase takes"""
+    
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = {}
+        self.pid = os.getpid()
+    
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one named phase"""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.clock() - started, 6)
+    
+    def report(self, import_seconds=None):
+        """Get the phase timings and whether they ran in this process"""
+        return {
+            'import_seconds': import_seconds,
+            'phases': dict(self.phases),
+            'total_seconds': round(sum(self.phases.values()), 6),
+            'built_in_pid': self.pid,
+            # False in forked gunicorn workers when the app was preloaded
+            'built_in_this_process': self.pid == os.getpid()
+        }
+
+
+class Services:
+    """Every long-lived component the app needs, built from one settings mapping.
+    
+    Building and starting are separate: the constructor only creates
+    objects, so it can run once in a preloading parent process, while
+    start_worker() starts per-process machinery (signal handlers, file
+    watchers) that does not survive fork.
+    """
+    
+    def __init__(self, settings, app=None):
+        self.settings = settings
+        self.startup = StartupTimer()
+        
+        # Upper bound on quotes returned by one /api/quotes call
+        self.max_batch_size = int(settings.get('MAX_BATCH_SIZE', '100'))
+        
+        with self.startup.phase('corpus'):
+            # Optional JSONL corpus; the built-in quotes are used when unset
+            self.quote_manager = QuoteManager(settings.get('QUOTES_CORPUS_PATH'))
+        
+        with self.startup.phase('assets'):
+            # static/ is served from memory, gzipped and fingerprinted up front
+            static_folder = app.static_folder if app is not None else DEFAULT_STATIC_FOLDER
+            self.assets = AssetBundle(static_folder)
+        
+        with self.startup.phase('stats'):
+            # Favorites survive restarts when a data directory is configured
+            favorites_dir = settings.get('FAVORITES_DIR')
+            shared = settings.get('STATS_BACKEND', 'memory') == 'shared'
+            segment_path = settings.get('STATS_SEGMENT_PATH', DEFAULT_SEGMENT_PATH)
+            if shared and not favorites_dir:
+                # Per-client favorites reach the other workers through the
+                # log, and the segment's directory is usually tmpfs, so the
+                # log must be placed on persistent storage explicitly
+                raise ValueError('STATS_BACKEND=shared requires FAVORITES_DIR on persistent storage')
+            self.favorites_store = FavoritesLog(favorites_dir) if favorites_dir else None
+            
+            # Multi-worker deployments share counters through an mmap'd segment
+            if shared:
+                self.stats_tracker = SharedStatsTracker(segment_path,
+                                                        favorites_store=self.favorites_store)
+            else:
+                self.stats_tracker = StatsTracker(favorites_store=self.favorites_store)
+            
+            # Favorites recovered from disk weight ?weighted=favorites draws
+            # from the first request, not only after the next corpus reload
+            self.quote_manager.seed_popularity(self.stats_tracker.popularity_counts())
+            
+            # Periodic rollups into an on-disk time-bucket file, behind
+            # /api/stats/history. With several workers this needs the
+            # shared backend, so every worker rolls up the same totals.
+            history_path = settings.get('STATS_HISTORY_PATH')
+            self.stats_history = StatsHistory(
+                history_path, self.stats_tracker.rollup_totals,
+                resolution=int(settings.get('STATS_ROLLUP_INTERVAL', '60'))
+            ) if history_path else None
+        
+        # Per-client no-repeat state for ?no_repeat=true draws, bounded and
+        # evicted when idle; with the shared backend every worker follows
+        # the same table, so clients keep their shuffle across workers
+        shuffle_settings = {
+            'max_clients': int(settings.get('SHUFFLE_MAX_CLIENTS', '10000')),
+            'idle_seconds': float(settings.get('SHUFFLE_IDLE_SECONDS', '1800'))
+        }
+        if shared:
+            self.shuffle_bags = SharedShuffleBags(
+                settings.get('SHUFFLE_SEGMENT_PATH', segment_path + '-shuffle'), **shuffle_settings
+            )
+        else:
+            self.shuffle_bags = ShuffleBags(**shuffle_settings)
+        
+        # Corpus reloads build a new snapshot off the request path and swap it in;
+        # the new samplers are seeded with the popularity counts gathered so far
+        self.corpus_reloader = CorpusReloader(self.quote_manager,
+                                              popularity=self.stats_tracker.popularity_counts)
+        
+        with self.startup.phase('monitoring'):
+            self.connection_string = settings.get('APPLICATIONINSIGHTS_CONNECTION_STRING')
+            export_events = configure_monitoring(app, self.connection_string)
+            
+            # Handlers only enqueue events; a background thread exports them in batches
+            self.telemetry = TelemetryPipeline(
+                export_events,
+                max_queue=int(settings.get('TELEMETRY_QUEUE_SIZE', '10000')),
+                flush_interval=float(settings.get('TELEMETRY_FLUSH_INTERVAL', '1.0')),
+                sample_rates=parse_sample_rates(settings.get('TELEMETRY_SAMPLE_RATES', ''))
+            )
+            self.log_event = self.telemetry.log_event
+            
+            # Built-in request instrumentation, exposed on /metrics
+            self.request_metrics = RequestMetrics()
+        
+        # Admission control: per-client token buckets and queue-time load
+        # shedding. Both are off unless configured.
+        rate_limit = float(settings.get('RATE_LIMIT_RPS', '0'))
+        self.rate_limiter = RateLimiter(
+            rate_limit,
+            float(settings.get('RATE_LIMIT_BURST', str(max(1.0, 2 * rate_limit)))),
+            route_limits=parse_route_limits(settings.get('RATE_LIMIT_ROUTES', '')),
+            max_buckets=int(settings.get('RATE_LIMIT_MAX_CLIENTS', '10000'))
+        ) if rate_limit > 0 else None
+        shed_budget = float(settings.get('LOAD_SHED_BUDGET', '0'))
+        # X-Request-Start is client-controlled unless a proxy overwrites it
+        trust_request_start = settings.get('LOAD_SHED_TRUST_REQUEST_START', 'false').lower() == 'true'
+        self.load_shedder = LoadShedder(
+            shed_budget, trust_request_start=trust_request_start
+        ) if shed_budget > 0 else None
+        
+        # Opt-in profiling: cProfile for a sampled fraction of requests and
+        # an on-demand stack sampler, both read through /admin/profile
+        self.request_profiler = RequestProfiler(
+            float(settings.get('PROFILE_SAMPLE_RATE', '0')),
+            max_captures=int(settings.get('PROFILE_MAX_CAPTURES', '20'))
+        )
+        self.stack_sampler = StackSampler(float(settings.get('PROFILE_SAMPLER_INTERVAL', '0.005')))
+        self.spans = None
+        if settings.get('PROFILE_SPANS', 'false').lower() == 'true':
+            self.enable_spans(app)
+        
+        # Response compression wraps the WSGI app, so create_app sets it up
+        self.compression = None
+        
+        self._worker_pid = None
+    
+    def enable_spans(self, app=None):
+        """Time quote lookups, stats updates, event logging and JSON encoding.
+        
+        The request-facing services are swapped for timing proxies, so
+        nothing is measured (or slowed down) unless this is called.
+        """
+        self.spans = SpanTimer()
+        self.quote_manager = TimedProxy(self.quote_manager, 'quote_manager', self.spans)
+        self.stats_tracker = TimedProxy(self.stats_tracker, 'stats_tracker', self.spans)
+        self.log_event = self.spans.wrap('log_event', self.telemetry.log_event)
+        if app is not None:
+            app.json = TimedJSONProvider(app)
+            app.json.spans = self.spans
+    
+    def admission_counters(self):
+        """Rate limiter and load shedder counters, for whichever are enabled"""
+        return {
+            'rate_limiter': self.rate_limiter.get_counters() if self.rate_limiter else None,
+            'load_shedder': self.load_shedder.get_counters() if self.load_shedder else None
+        }
+    
+    def start_worker(self):
+        """Start per-process background machinery; safe to call repeatedly"""
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return
+        self._worker_pid = pid
+        
+        if self.stats_history:
+            self.stats_history.start()
+        
+        if self.quote_manager.corpus_path:
+            if threading.current_thread() is threading.main_thread():
+                self.corpus_reloader.install_signal_handler()
+            watch_interval = float(self.settings.get('CORPUS_WATCH_INTERVAL', '0'))
+            if watch_interval > 0:
+                self.corpus_reloader.watch(watch_interval)
+
+
+def configure_monitoring(app, connection_string):
+    """Set up Application Insights if configured; returns the event exporter.
+    
+    The opencensus packages are only imported when a connection string is
+    set, so local runs and tests never pay for loading them.
+    """
+    if connection_string:
+        try:
+            from opencensus.ext.azure.log_exporter import AzureLogHandler
+            from opencensus.ext.azure.trace_exporter import AzureExporter
+            from opencensus.ext.flask.flask_middleware import FlaskMiddleware
+        except ImportError:
+            print("Application Insights configured but opencensus is not installed")
+        else:
+            if app is not None:
+                # Add Flask middleware for automatic request tracking
+                FlaskMiddleware(app, exporter=AzureExporter(connection_string=connection_string))
+            
+            # Configure logging to Azure
+            logger = logging.getLogger(__name__)
+            logger.addHandler(AzureLogHandler(connection_string=connection_string))
+            logger.setLevel(logging.INFO)
+            
+            def export_events(batch):
+                """Send a batch of custom events to Application Insights"""
+                for name, properties in batch:
+                    logger.info(name, extra={'custom_dimensions': properties or {}})
+            
+            print("Application Insights monitoring enabled")
+            return export_events
+    else:
+        print("Application Insights not configured (no connection string)")
+    
+    # Fallback logging for local development
+    def export_events(batch):
+        """Fallback logging when Application Insights not available"""
+        print('\n'.join(f"LOG: {name} - {properties}" for name, properties in batch))
+    
+    return export_events
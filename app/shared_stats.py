@@ -0,0 +1,504 @@
+import fcntl
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from collections import Counter
+from heapq import nlargest
+from .favorites import ANONYMOUS
+from .favorites_store import SharedFavorites
+from .stats import RATE_WINDOWS, TOP_K, RateTracker, TopCounter, rates_from_counts
+
+
+MAGIC = int.from_bytes(b'QSTATS03', 'little')
+HEADER_BYTES = 64
+NAME_BYTES = 64
+
+# Header words
+H_MAGIC, H_WORKERS, H_CATEGORIES, H_FAVORITE_BYTES, H_GENERATION = range(5)
+
+# Shard words before the per-category counters; S_BOARDS is odd while the
+# worker is rewriting its leaderboards
+S_PID, S_TOTAL, S_FAVORITES, S_BOARDS = range(4)
+SHARD_HEADER_WORDS = 4
+
+# Leaders each worker publishes per leaderboard. Several times TOP_K, so a
+# quote or author leading overall is in every worker's published list.
+BOARD_SIZE = 4 * TOP_K
+
+DEFAULT_SEGMENT_PATH = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+    'quote-generator-stats'
+)
+
+# Fetches from categories that do not fit in the table are counted here
+OVERFLOW_CATEGORY = 'other'
+
+_NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+# Every open tracker, so a forked child can reset their per-process state
+_TRACKERS = weakref.WeakSet()
+
+
+class _Shard:
+    """One worker's region of the shared segment"""
+    
+    def __init__(self, view, max_categories, favorite_bytes):
+        words = SHARD_HEADER_WORDS + max_categories
+        self.words = view[:8 * words].cast('Q')
+        
+        offset = 8 * words
+        self.rates = []
+        for _ in range(max_categories + 1):
+            self.rates.append(RateTracker(view[offset:offset + RateTracker.NBYTES]))
+            offset += RateTracker.NBYTES
+        
+        self.favorites = view[offset:offset + favorite_bytes]
+        offset += favorite_bytes
+        
+        # Leaderboards: (quote id, count) pairs, then author counts and names
+        self.quote_board = view[offset:offset + 16 * BOARD_SIZE].cast('Q')
+        offset += 16 * BOARD_SIZE
+        self.author_board = view[offset:offset + 8 * BOARD_SIZE].cast('Q')
+        offset += 8 * BOARD_SIZE
+        self.author_names = view[offset:offset + NAME_BYTES * BOARD_SIZE]
+    
+    @staticmethod
+    def nbytes(max_categories, favorite_bytes):
+        """Size of one shard"""
+        return (8 * (SHARD_HEADER_WORDS + max_categories)
+                + RateTracker.NBYTES * (max_categories + 1)
+                + favorite_bytes
+                + (24 + NAME_BYTES) * BOARD_SIZE)
+    
+    def publish(self, quotes, authors, quote_slots, author_slots):
+        """Copy changed leaderboard positions from this worker's counters"""
+        words = self.words
+        words[S_BOARDS] += 1
+        quote_top = quotes.most_common()
+        for slot in quote_slots:
+            quote_id, count = quote_top[slot]
+            self.quote_board[2 * slot] = quote_id
+            self.quote_board[2 * slot + 1] = count
+        author_top = authors.most_common()
+        for slot in author_slots:
+            author, count = author_top[slot]
+            encoded = _encode_name(author)
+            offset = slot * NAME_BYTES
+            self.author_names[offset:offset + NAME_BYTES] = encoded.ljust(NAME_BYTES, b'\x00')
+            self.author_board[slot] = count
+        words[S_BOARDS] += 1
+    
+    def boards(self, attempts=5):
+        """Read the published leaderboards as ([(quote_id, count)], [(author, count)])"""
+        for _ in range(attempts):
+            version = self.words[S_BOARDS]
+            quote_board = self.quote_board.tolist()
+            author_board = self.author_board.tolist()
+            names = bytes(self.author_names)
+            if version % 2 == 0 and self.words[S_BOARDS] == version:
+                break
+            time.sleep(0)
+        
+        quotes = [(quote_board[2 * slot], quote_board[2 * slot + 1])
+                  for slot in range(BOARD_SIZE) if quote_board[2 * slot + 1]]
+        authors = [(names[slot * NAME_BYTES:(slot + 1) * NAME_BYTES].rstrip(b'\x00')
+                    .decode('utf-8', 'replace'), author_board[slot])
+                   for slot in range(BOARD_SIZE) if author_board[slot]]
+        return quotes, authors
+
+
+class SharedStatsTracker:
+    """Statistics shared by every worker process through an mmap'd segment.
+    
+    Each worker claims its own shard of the segment and only ever writes
+    there, so recording a fetch is a handful of memory writes with no file
+    lock and no IPC (threads of one worker take an in-process lock).
+    Readers sum all shards, including those of workers that have exited,
+    to report global totals. The file lock is only taken for rare events:
+    claiming a shard, registering a new category and resets.
+    
+    Favorites are kept as one bitmap per shard over quote ids up to
+    `max_quote_id`; ids above that limit are rejected. That bitmap is the
+    union over all clients. Per-client favorites go through the favorites
+    store, which every worker follows (see SharedFavorites), so a client
+    sees the same favorites whichever worker answers. Without a store
+    they are only kept in each worker's memory.
+    
+    Per-quote and per-author counts stay in each worker's memory, which
+    also serves weighted sampling. Each worker publishes its leading
+    BOARD_SIZE entries to its shard as they change, and the top quotes and
+    authors in get_stats() are the sum of every shard's leaders.
+    """
+    
+    def __init__(self, path=DEFAULT_SEGMENT_PATH, max_workers=16, max_categories=32,
+                 max_quote_id=1 << 20, clock=time.time, favorites_store=None):
+        self.path = path
+        self.clock = clock
+        self.favorites_store = favorites_store
+        self.max_workers = max_workers
+        self.max_categories = max_categories
+        self.max_quote_id = max_quote_id
+        
+        self._favorite_bytes = (max_quote_id // 64 + 1) * 8
+        self._shard_bytes = _Shard.nbytes(max_categories, self._favorite_bytes)
+        self._shards_offset = HEADER_BYTES + NAME_BYTES * max_categories
+        size = self._shards_offset + self._shard_bytes * max_workers
+        
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # flock belongs to the open file description, which every thread of
+        # this process shares, so threads also exclude each other in-process
+        self._flock_guard = threading.Lock()
+        with self._locked():
+            self._prepare_segment(size)
+        self._mmap = mmap.mmap(self._fd, size)
+        self._view = memoryview(self._mmap)
+        self._header = self._view[:HEADER_BYTES].cast('Q')
+        self._shards = [
+            _Shard(self._view[self._shard_offset(i):self._shard_offset(i + 1)],
+                   max_categories, self._favorite_bytes)
+            for i in range(max_workers)
+        ]
+        
+        self._pid = None
+        self._shard = None
+        # Threads of one worker share its shard, so their read-modify-write
+        # updates are serialized; workers never contend with each other
+        self._write_lock = threading.Lock()
+        self._generation = None
+        self._category_slots = {}
+        # Per-quote and per-author counts are kept per worker; only their
+        # leaders are published to the shard for the merged leaderboards
+        self._quote_counts = TopCounter(BOARD_SIZE)
+        self._author_counts = TopCounter(BOARD_SIZE)
+        
+        _TRACKERS.add(self)
+        
+        # Every worker replays the same durable set; OR-ing bits is idempotent
+        self._client_favorites = SharedFavorites(favorites_store)
+        with self._client_favorites.current() as favorites:
+            shard = self._own_shard()
+            for quote_id in favorites.quote_ids():
+                self._set_favorite_bit(shard, quote_id)
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the segment's file lock"""
+        with self._flock_guard:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def _after_fork(self):
+        """Reset per-process state in a forked child, before any of its threads run"""
+        # A forked child shares its parent's open file description, and with
+        # it the parent's flock, so each process needs its own; locks held
+        # by parent threads at fork time would never be released here
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._flock_guard = threading.Lock()
+        self._write_lock = threading.Lock()
+    
+    def _prepare_segment(self, size):
+        """Create the segment, or recreate it if its layout changed"""
+        layout = [MAGIC, self.max_workers, self.max_categories, self._favorite_bytes]
+        header = os.pread(self._fd, 8 * len(layout), 0)
+        current = [int.from_bytes(header[i:i + 8], 'little') for i in range(0, len(header), 8)]
+        
+        if current == layout and os.fstat(self._fd).st_size == size:
+            return
+        
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        os.pwrite(self._fd, b''.join(word.to_bytes(8, 'little') for word in layout), 0)
+    
+    def _shard_offset(self, index):
+        return self._shards_offset + index * self._shard_bytes
+    
+    def _own_shard(self):
+        """Get this process's shard, claiming one after start or fork"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._locked():
+                shard = self._claim_shard(pid)
+            # Carry on from the leaders already published in the shard: those
+            # of an exited worker, or none, but never counts inherited via fork
+            quotes, authors = shard.boards()
+            with self._write_lock:
+                self._quote_counts = _top_counter(quotes)
+                self._author_counts = _top_counter(authors)
+                self._shard = shard
+                self._pid = pid
+        return self._shard
+    
+    def _claim_shard(self, pid):
+        """Pick a free shard or take over one left by an exited worker"""
+        free = None
+        for shard in self._shards:
+            owner = shard.words[S_PID]
+            if owner == pid:
+                return shard
+            if free is None and (owner == 0 or not _pid_alive(owner)):
+                free = shard
+        
+        if free is None:
+            # More workers than shards: share one and accept racy updates
+            print(f"Shared stats segment full, worker {pid} is sharing a shard")
+            free = self._shards[pid % self.max_workers]
+        free.words[S_PID] = pid
+        return free
+    
+    def _category_slot(self, category):
+        """Get the counter slot for a category, registering it if needed"""
+        generation = self._header[H_GENERATION]
+        if generation != self._generation:
+            self._category_slots = {}
+            self._generation = generation
+        
+        if category not in self._category_slots:
+            with self._locked():
+                self._category_slots[category] = self._claim_category(category)
+        return self._category_slots[category]
+    
+    def _claim_category(self, category):
+        """Find or add a category name in the shared table.
+        
+        The last slot is kept for OVERFLOW_CATEGORY, which counts every
+        category whose name is too long or arrives once the table is full.
+        """
+        encoded = category.encode('utf-8')
+        overflow = self.max_categories - 1
+        if len(encoded) <= NAME_BYTES:
+            for slot in range(overflow):
+                name = self._read_name(slot)
+                if name == encoded:
+                    return slot
+                if not name:
+                    self._write_name(slot, encoded)
+                    return slot
+        
+        if not self._read_name(overflow):
+            self._write_name(overflow, OVERFLOW_CATEGORY.encode('utf-8'))
+        return overflow
+    
+    def _write_name(self, slot, encoded):
+        offset = HEADER_BYTES + slot * NAME_BYTES
+        self._view[offset:offset + len(encoded)] = encoded
+    
+    def _read_name(self, slot):
+        offset = HEADER_BYTES + slot * NAME_BYTES
+        return bytes(self._view[offset:offset + NAME_BYTES]).rstrip(b'\x00')
+    
+    def _used_shards(self):
+        return [shard for shard in self._shards if shard.words[S_PID]]
+    
+    def record_quote_fetch(self, category, quote_id=None, author=None):
+        """Record that a quote was fetched from a category"""
+        shard = self._own_shard()
+        slot = self._category_slot(category)
+        now = self.clock()
+        
+        with self._write_lock:
+            quote_slots = self._quote_counts.add(quote_id) if quote_id is not None else ()
+            author_slots = self._author_counts.add(author) if author is not None else ()
+            if quote_slots or author_slots:
+                shard.publish(self._quote_counts, self._author_counts, quote_slots, author_slots)
+            shard.words[S_TOTAL] += 1
+            shard.rates[0].record(now)
+            shard.words[SHARD_HEADER_WORDS + slot] += 1
+            shard.rates[slot + 1].record(now)
+    
+    def add_favorite(self, quote_id, client_id=ANONYMOUS):
+        """Add a quote to a client's favorites"""
+        if not isinstance(quote_id, int) or quote_id < 1 or quote_id > self.max_quote_id:
+            return False
+        
+        shard = self._own_shard()
+        added = self._client_favorites.add(client_id, quote_id)
+        with self._write_lock:
+            if added:
+                shard.words[S_FAVORITES] += 1
+            self._set_favorite_bit(shard, quote_id)
+        return True
+    
+    def _set_favorite_bit(self, shard, quote_id):
+        if 0 < quote_id <= self.max_quote_id:
+            shard.favorites[quote_id >> 3] |= 1 << (quote_id & 7)
+    
+    def quote_fetch_count(self, quote_id):
+        """Get how many times this worker has fetched a quote"""
+        return self._quote_counts.get(quote_id, 0)
+    
+    def favorite_count(self, quote_id):
+        """Get how many clients have favorited a quote"""
+        with self._client_favorites.current() as favorites:
+            return favorites.count(quote_id)
+    
+    def top_favorites(self, limit=10):
+        """Get the most favorited quotes as (quote_id, clients) pairs"""
+        with self._client_favorites.current() as favorites:
+            return favorites.top(limit)
+    
+    def favorite_updates(self):
+        """Get {quote_id: clients} for favorites changed since the last call, by any worker"""
+        return self._client_favorites.take_changes()
+    
+    def popularity_counts(self):
+        """Get per-quote counts for every weighting mode; fetches are this worker's"""
+        with self._client_favorites.current() as favorites:
+            favorite_counts = dict(favorites.counts)
+        with self._write_lock:
+            fetch_counts = dict(self._quote_counts)
+        return {'fetches': fetch_counts, 'favorites': favorite_counts}
+    
+    def _favorites_bitmap(self):
+        """OR together every shard's favorites bitmap"""
+        combined = 0
+        for shard in self._used_shards():
+            combined |= int.from_bytes(shard.favorites, 'little')
+        return combined
+    
+    def get_favorites(self, client_id=None):
+        """Get one client's favorite quote IDs, or every favorited ID"""
+        if client_id is not None:
+            with self._client_favorites.current() as favorites:
+                return favorites.get(client_id)
+        
+        data = self._favorites_bitmap().to_bytes(self._favorite_bytes, 'little')
+        favorites = []
+        for match in _NONZERO_BYTE.finditer(data):
+            index = match.start()
+            byte = data[index]
+            favorites.extend(index * 8 + bit for bit in range(8) if byte >> bit & 1)
+        return favorites
+    
+    def get_stats(self):
+        """Get comprehensive statistics summed over all workers"""
+        now = self.clock()
+        shards = self._used_shards()
+        
+        category_counts = {}
+        category_qps = {}
+        for slot in range(self.max_categories):
+            name = self._read_name(slot)
+            if not name:
+                continue
+            count = sum(shard.words[SHARD_HEADER_WORDS + slot] for shard in shards)
+            if count:
+                category = name.decode('utf-8')
+                category_counts[category] = count
+                category_qps[category] = self._sum_rates(shards, slot + 1, now)
+        
+        # The category table is small and fixed, so ranking it directly is O(K)
+        top_categories = nlargest(TOP_K, category_counts.items(), key=lambda x: x[1])
+        with self._client_favorites.current() as favorites:
+            favorite_clients = favorites.client_count()
+        top_quotes, top_authors = self._merged_boards(shards)
+        
+        return {
+            'total_quotes_fetched': sum(shard.words[S_TOTAL] for shard in shards),
+            'categories_accessed': category_counts,
+            'most_popular_category': top_categories[0][0] if top_categories else None,
+            'top_categories': [{'category': category, 'count': count}
+                               for category, count in top_categories],
+            'top_quotes': top_quotes,
+            'top_authors': top_authors,
+            'total_favorites': self._favorites_bitmap().bit_count(),
+            'favorite_clients': favorite_clients,
+            'unique_categories_used': len(category_counts),
+            'qps': self._sum_rates(shards, 0, now),
+            'category_qps': category_qps,
+            'workers': sum(1 for shard in shards if _pid_alive(shard.words[S_PID]))
+        }
+    
+    @staticmethod
+    def _merged_boards(shards):
+        """Sum every worker's published leaders into the top quotes and authors.
+        
+        A key's count is exact when it is in each worker's published list,
+        which holds for the overall leaders unless traffic is very uneven
+        across workers; otherwise it is a lower bound.
+        """
+        quotes, authors = Counter(), Counter()
+        for shard in shards:
+            shard_quotes, shard_authors = shard.boards()
+            quotes.update(dict(shard_quotes))
+            authors.update(dict(shard_authors))
+        return ([{'quote_id': quote_id, 'count': count} for quote_id, count in
+                 nlargest(TOP_K, quotes.items(), key=lambda item: (item[1], -item[0]))],
+                [{'author': author, 'count': count} for author, count in
+                 nlargest(TOP_K, authors.items(), key=lambda item: item[1])])
+    
+    def rollup_totals(self):
+        """Get the running totals, summed over workers, recorded by history rollups"""
+        shards = self._used_shards()
+        return {'fetches': sum(shard.words[S_TOTAL] for shard in shards),
+                'favorites': sum(shard.words[S_FAVORITES] for shard in shards)}
+    
+    @staticmethod
+    def _sum_rates(shards, index, now):
+        """Add up one rate tracker across shards"""
+        totals = None
+        for shard in shards:
+            counts = shard.rates[index].window_counts(now)
+            if totals is None:
+                totals = counts
+            else:
+                totals = {label: totals[label] + counts[label] for label in totals}
+        return rates_from_counts(totals or dict.fromkeys(RATE_WINDOWS, 0))
+    
+    def reset_stats(self):
+        """Reset all statistics for every worker"""
+        with self._locked():
+            self._view[HEADER_BYTES:self._shards_offset] = bytes(self._shards_offset - HEADER_BYTES)
+            for index in range(self.max_workers):
+                # Keep shard ownership so live workers carry on writing safely
+                start = self._shard_offset(index) + 8 * (S_PID + 1)
+                end = self._shard_offset(index + 1)
+                self._view[start:end] = bytes(end - start)
+            self._header[H_GENERATION] += 1
+        with self._write_lock:
+            self._quote_counts = TopCounter(BOARD_SIZE)
+            self._author_counts = TopCounter(BOARD_SIZE)
+        self._client_favorites.clear()
+
+
+def _encode_name(name):
+    """UTF-8 name cut to NAME_BYTES on a character boundary"""
+    encoded = name.encode('utf-8')
+    if len(encoded) > NAME_BYTES:
+        encoded = encoded[:NAME_BYTES].decode('utf-8', 'ignore').encode('utf-8')
+    return encoded
+
+
+def _top_counter(leaders):
+    """TopCounter holding published (key, count) leaders, largest first"""
+    counter = TopCounter(BOARD_SIZE)
+    for key, count in leaders:
+        counter.add(key, count)
+    return counter
+
+
+def _reset_trackers_after_fork():
+    for tracker in list(_TRACKERS):
+        tracker._after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_trackers_after_fork)
+
+
+def _pid_alive(pid):
+    """Check whether a process id belongs to a running process"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,262 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+FEISTEL_ROUNDS = 4
+
+# Every open shared table, so a forked child can reset its per-process state
+_TABLES = weakref.WeakSet()
+
+
+def permute(index, size, seed):
+    """Map index to its place in a seeded pseudo-random permutation of range(size).
+    
+    A small Feistel network is a bijection on a power-of-two domain
+    covering `size`; values that land outside range(size) are fed back in
+    ("cycle walking") until they fall inside, which keeps it a bijection
+    on range(size). No permutation is ever materialized.
+    """
+    if size <= 1:
+        return 0
+    half_bits = ((size - 1).bit_length() + 1) // 2
+    mask = (1 << half_bits) - 1
+    keys = [_mix32(seed ^ (round_number * 0x9E3779B9)) for round_number in range(FEISTEL_ROUNDS)]
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for key in keys:
+            # _mix32 inlined: this loop is the whole cost of a draw
+            mixed = right ^ key
+            mixed ^= mixed >> 16
+            mixed = mixed * 0x85EBCA6B & 0xFFFFFFFF
+            mixed ^= mixed >> 13
+            mixed = mixed * 0xC2B2AE35 & 0xFFFFFFFF
+            left, right = right, (left ^ mixed ^ mixed >> 16) & mask
+        value = left << half_bits | right
+        if value < size:
+            return value
+
+
+def _mix32(value):
+    """Scramble 32 bits (the MurmurHash3 finalizer)"""
+    value &= 0xFFFFFFFF
+    value ^= value >> 16
+    value = value * 0x85EBCA6B & 0xFFFFFFFF
+    value ^= value >> 13
+    value = value * 0xC2B2AE35 & 0xFFFFFFFF
+    return value ^ value >> 16
+
+
+def shuffle_key(client, pool):
+    """64-bit non-zero key naming one client's shuffle of one pool"""
+    digest = hashlib.blake2b(f'{client}\x00{pool or ""}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+def pass_seed(key, generation, pass_number):
+    """Permutation seed of one pass; the same in every worker process"""
+    data = b''.join(value.to_bytes(8, 'little') for value in (key, generation, pass_number))
+    return int.from_bytes(hashlib.blake2b(data, digest_size=4).digest(), 'little')
+
+
+def advance(state, key, size, generation):
+    """Draw the next index from a shuffle state.
+    
+    `state` is (generation, size, pass, cursor, swapped, last) or None for
+    a new client; returns the next state, the index and whether a new
+    pass began. Each pass is the permutation seeded by pass_seed(). When
+    a pass would open with the index that ended the previous one, its
+    first two draws are swapped, so a client never gets the same index
+    twice in a row while its state is kept.
+    """
+    if state is None or state[0] != generation or state[1] != size:
+        pass_number, cursor, swapped, last = 0, 0, False, 0
+    else:
+        _, _, pass_number, cursor, swapped, last = state
+    
+    new_pass = cursor == size
+    if new_pass:
+        pass_number += 1
+        cursor = 0
+    seed = pass_seed(key, generation, pass_number)
+    if cursor == 0:
+        swapped = pass_number > 0 and size > 1 and permute(0, size, seed) == last
+    index = permute(1 - cursor if swapped and cursor < 2 else cursor, size, seed)
+    return (generation, size, pass_number, cursor + 1, swapped, index), index, new_pass
+
+
+class ShuffleBags:
+    """Per-client no-repeat draws: each client walks a shuffled permutation of a pool.
+    
+    The state per client and pool is a pass number and a cursor, whatever
+    the pool size; see advance(). Seeds are derived from the client, pool
+    and corpus generation, so every worker shuffles a client the same way.
+    States are kept in LRU order; the least recently used are evicted past
+    `max_clients`, and any idle for `idle_seconds` are evicted on the way.
+    An evicted client simply starts over. This keeps states per process;
+    SharedShuffleBags keeps them for all workers.
+    """
+    
+    def __init__(self, max_clients=10000, idle_seconds=1800, clock=time.monotonic):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        # (client, pool) -> (generation, size, pass, cursor, swapped, last, last_used)
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.passes = 0
+        self.evicted = 0
+    
+    def next_index(self, client, pool, size, generation=0):
+        """Next index into a pool of `size` for this client, never the previous one"""
+        key = (client, pool)
+        hashed = shuffle_key(client, pool)
+        now = self.clock()
+        with self._lock:
+            state = self._states.pop(key, None)
+            state, index, new_pass = advance(state and state[:6], hashed, size, generation)
+            self.passes += new_pass
+            self._states[key] = state + (now,)
+            self._evict(now)
+        return index
+    
+    def _evict(self, now):
+        """Drop idle and excess states; needs the lock"""
+        states = self._states
+        while states:
+            oldest = next(iter(states.values()))
+            if len(states) <= self.max_clients and now - oldest[6] < self.idle_seconds:
+                break
+            states.popitem(last=False)
+            self.evicted += 1
+    
+    def get_counters(self):
+        """Get bag counters"""
+        return {
+            'bags': len(self._states),
+            'passes': self.passes,
+            'evicted': self.evicted
+        }
+
+
+# Shared table: a header, then slots of
+# (key, generation, size, pass, cursor, swapped, last, last_used) words
+SHUFFLE_MAGIC = int.from_bytes(b'QSHUF001', 'little')
+SLOT_WORDS = 8
+WAYS = 4
+
+
+class SharedShuffleBags:
+    """ShuffleBags kept in an mmap'd table that every worker process shares.
+    
+    A client alternating between workers still walks one shuffle. The
+    table is set-associative: a key hashes to a set of WAYS slots and,
+    when none is free, replaces the least recently used of them. Each
+    draw holds the table's file lock for a few word reads and writes.
+    Counters other than `bags` are this worker's.
+    """
+    
+    def __init__(self, path, max_clients=10000, idle_seconds=1800, clock=time.time):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.sets = max(1, -(-max_clients // WAYS))
+        self.slots = self.sets * WAYS
+        size = 8 * SLOT_WORDS * (self.slots + 1)
+        
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # flock belongs to the open file description, which every thread of
+        # this process shares, so threads also exclude each other in-process
+        self._flock_guard = threading.Lock()
+        with self._locked():
+            self._prepare_table(size)
+        self._mmap = mmap.mmap(self._fd, size)
+        self._words = memoryview(self._mmap).cast('Q')
+        
+        self.passes = 0
+        self.evicted = 0
+        _TABLES.add(self)
+    
+    def _prepare_table(self, size):
+        """Create the table, or recreate it if its shape changed"""
+        header = os.pread(self._fd, 16, 0)
+        if (header == b''.join(word.to_bytes(8, 'little') for word in (SHUFFLE_MAGIC, self.slots))
+                and os.fstat(self._fd).st_size == size):
+            return
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        os.pwrite(self._fd, SHUFFLE_MAGIC.to_bytes(8, 'little') + self.slots.to_bytes(8, 'little'), 0)
+    
+    @contextmanager
+    def _locked(self):
+        """Hold the table's file lock"""
+        with self._flock_guard:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def _after_fork(self):
+        """Reset per-process state in a forked child, before any of its threads run"""
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._flock_guard = threading.Lock()
+    
+    def next_index(self, client, pool, size, generation=0):
+        """Next index into a pool of `size` for this client, never the previous one"""
+        key = shuffle_key(client, pool)
+        now = int(self.clock())
+        words = self._words
+        with self._locked():
+            offset, state = self._find(key, now)
+            state, index, new_pass = advance(state, key, size, generation)
+            words[offset:offset + SLOT_WORDS] = array('Q', (key, *state[:4], int(state[4]), state[5], now))
+        self.passes += new_pass
+        return index
+    
+    def _find(self, key, now):
+        """Word offset of the key's slot and its live state, or a slot to reuse and None"""
+        words = self._words
+        first = SLOT_WORDS * (1 + (key % self.sets) * WAYS)
+        victim = None
+        for offset in range(first, first + SLOT_WORDS * WAYS, SLOT_WORDS):
+            slot_key, last_used = words[offset], words[offset + 7]
+            if slot_key == key:
+                if now - last_used < self.idle_seconds:
+                    return offset, tuple(words[offset + 1:offset + 7])
+                return offset, None
+            if victim is None or (words[victim] and (not slot_key or last_used < words[victim + 7])):
+                victim = offset
+        if words[victim] and now - words[victim + 7] < self.idle_seconds:
+            self.evicted += 1
+        return victim, None
+    
+    def get_counters(self):
+        """Get bag counters"""
+        now = int(self.clock())
+        keys = self._words[SLOT_WORDS::SLOT_WORDS]
+        last_used = self._words[SLOT_WORDS + 7::SLOT_WORDS]
+        return {
+            'bags': sum(1 for key, used in zip(keys, last_used)
+                        if key and now - used < self.idle_seconds),
+            'passes': self.passes,
+            'evicted': self.evicted
+        }
+
+
+def _reset_tables_after_fork():
+    for table in list(_TABLES):
+        table._after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_tables_after_fork)
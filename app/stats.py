@@ -1,56 +1,416 @@
+import threading
+import time
 from collections import defaultdict
-from datetime import datetime
+from .favorites import ANONYMOUS, ClientFavorites
+
+
+# Reporting windows in seconds, keyed by the label used in /api/stats
+RATE_WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+
+# Length of the category, quote and author leaderboards in /api/stats
+TOP_K = 10
+
+
+class RollingCounter:
+    """Fixed-size ring of event counts, one slot per time bucket.
+    
+    Each slot remembers which bucket it currently holds, so stale slots
+    are recycled lazily and memory never grows with uptime. Bucket 0 (the
+    Unix epoch) doubles as the empty marker, which lets the ring live in
+    any zero-filled buffer, including a shared memory segment.
+    """
+    
+    def __init__(self, slots, resolution, buffer=None):
+        self.slots = slots
+        self.resolution = resolution
+        if buffer is None:
+            buffer = bytearray(self.nbytes(slots))
+        view = memoryview(buffer)
+        self._counts = view[:8 * slots].cast('Q')
+        self._buckets = view[8 * slots:16 * slots].cast('q')
+    
+    @staticmethod
+    def nbytes(slots):
+        """Size of the buffer backing a ring with this many slots"""
+        return 16 * slots
+    
+    def add(self, now, amount=1):
+        """Count events at the given timestamp"""
+        bucket = int(now // self.resolution)
+        slot = bucket % self.slots
+        if self._buckets[slot] != bucket:
+            self._buckets[slot] = bucket
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+    
+    def total(self, now, window):
+        """Count events in the last `window` seconds"""
+        current = int(now // self.resolution)
+        span = min(self.slots, -(-window // self.resolution))
+        oldest = current - span + 1
+        
+        return sum(count for bucket, count in zip(self._buckets, self._counts)
+                   if oldest <= bucket <= current)
+    
+    def merge(self, other):
+        """Add another ring with the same shape into this one, slot by slot"""
+        for slot, bucket in enumerate(other._buckets):
+            if bucket == 0 or bucket < self._buckets[slot]:
+                continue
+            if bucket > self._buckets[slot]:
+                self._buckets[slot] = bucket
+                self._counts[slot] = 0
+            self._counts[slot] += other._counts[slot]
+
+
+class RateTracker:
+    """Per-second and per-minute rings for windowed request rates"""
+    
+    SECOND_SLOTS = 300
+    MINUTE_SLOTS = 60
+    NBYTES = RollingCounter.nbytes(SECOND_SLOTS) + RollingCounter.nbytes(MINUTE_SLOTS)
+    
+    def __init__(self, buffer=None):
+        if buffer is None:
+            buffer = bytearray(self.NBYTES)
+        split = RollingCounter.nbytes(self.SECOND_SLOTS)
+        view = memoryview(buffer)
+        self.seconds = RollingCounter(self.SECOND_SLOTS, 1, view[:split])
+        self.minutes = RollingCounter(self.MINUTE_SLOTS, 60, view[split:self.NBYTES])
+    
+    def record(self, now):
+        """Record one event"""
+        self.seconds.add(now)
+        self.minutes.add(now)
+    
+    def merge(self, other):
+        """Add another tracker's events into this one"""
+        self.seconds.merge(other.seconds)
+        self.minutes.merge(other.minutes)
+    
+    def window_counts(self, now):
+        """Get the number of events in each reporting window"""
+        counts = {}
+        for label, window in RATE_WINDOWS.items():
+            ring = self.seconds if window <= self.seconds.slots else self.minutes
+            counts[label] = ring.total(now, window)
+        return counts
+    
+    def rates(self, now):
+        """Get events per second for each reporting window"""
+        return rates_from_counts(self.window_counts(now))
+
+
+class TopCounter(dict):
+    """Per-key counts with the K largest kept in order as counts change.
+    
+    Counts only ever go up, so a key outside the top K can only enter it
+    by overtaking the current K-th entry; each add() is then at most a
+    short bubble up a list of K keys, and reading the leaders never
+    scans every key.
+    """
+    
+    def __init__(self, k=10):
+        super().__init__()
+        self.k = k
+        self._top = []
+    
+    def add(self, key, amount=1):
+        """Increase a key's count and update the top K.
+        
+        Returns the range of top-K positions whose key or count changed.
+        """
+        count = self[key] = self.get(key, 0) + amount
+        top = self._top
+        if key in top:
+            position = top.index(key)
+        elif len(top) < self.k:
+            top.append(key)
+            position = len(top) - 1
+        elif count > self[top[-1]]:
+            top[-1] = key
+            position = len(top) - 1
+        else:
+            return range(0)
+        
+        start = position
+        while position and self[top[position - 1]] < count:
+            top[position] = top[position - 1]
+            position -= 1
+        top[position] = key
+        return range(position, start + 1)
+    
+    def most_common(self, limit=None):
+        """Get up to `limit` (key, count) pairs, largest first"""
+        return [(key, self[key]) for key in self._top[:limit]]
+    
+    def leader(self):
+        """Get the key with the highest count, or None"""
+        return self._top[0] if self._top else None
+
+
+def rates_from_counts(counts):
+    """Convert per-window event counts into events per second"""
+    return {label: round(counts[label] / window, 4)
+            for label, window in RATE_WINDOWS.items()}
+
+
+class _FetchShard:
+    """One thread's fetch counters.
+    
+    Only the owning thread records into a shard, so its lock is almost
+    never contended; readers take it briefly to collect the count deltas
+    that have not been folded into the leaderboards yet.
+    """
+    
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.lock = threading.Lock()
+        self.total = 0
+        self.quote_totals = defaultdict(int)
+        self.fetch_rates = RateTracker()
+        self.category_rates = defaultdict(RateTracker)
+        # Category, quote and author counts added since the last drain
+        self.pending = (defaultdict(int), defaultdict(int), defaultdict(int))
+    
+    def record(self, now, category, quote_id, author):
+        """Count one fetch; the caller holds the lock"""
+        categories, quotes, authors = self.pending
+        categories[category] += 1
+        if quote_id is not None:
+            quotes[quote_id] += 1
+            self.quote_totals[quote_id] += 1
+        if author is not None:
+            authors[author] += 1
+        self.total += 1
+        self.fetch_rates.record(now)
+        self.category_rates[category].record(now)
+    
+    def take_pending(self):
+        """Swap out the undrained deltas"""
+        with self.lock:
+            pending = self.pending
+            self.pending = (defaultdict(int), defaultdict(int), defaultdict(int))
+        return pending
+    
+    def absorb(self, other):
+        """Fold another shard's running totals and rates into this one"""
+        self.total += other.total
+        for quote_id, count in other.quote_totals.items():
+            self.quote_totals[quote_id] += count
+        self.fetch_rates.merge(other.fetch_rates)
+        for category, rates in other.category_rates.items():
+            self.category_rates[category].merge(rates)
 
 
 class StatsTracker:
-    """Tracks usage statistics for the quote generator"""
+    """Tracks usage statistics for the quote generator.
+    
+    Safe to share between request threads without a global lock on the
+    fetch path: each thread records into its own shard, and readers sum
+    the shards. Leaderboard deltas are drained from the shards into the
+    top-K counters when stats are read. Shards of threads that have
+    exited are folded into one retired shard, so thread-per-request
+    servers do not grow the shard list; readers sum under the registry
+    lock, which writers only take to register, so totals never skip or
+    double count a shard being retired. Favorites change far less often
+    and share one lock.
+    """
+    
+    def __init__(self, clock=time.time, favorites_store=None):
+        self.clock = clock
+        self.favorites_store = favorites_store
+        self._local = threading.local()
+        self._registry_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._favorites_lock = threading.Lock()
+        self._init_counters()
+        # Favorites are served from memory; the store only makes them durable
+        self.favorites = recover_favorites(favorites_store)
+    
+    def _init_counters(self):
+        self._shards = []
+        self._retired = _FetchShard()
+        self._generation = getattr(self, '_generation', 0) + 1
+        self.category_counts = TopCounter(TOP_K)
+        self.quote_counts = TopCounter(TOP_K)
+        self.author_counts = TopCounter(TOP_K)
+    
+    def _shard(self):
+        """Get the calling thread's shard, registering one on first use"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None or self._local.generation != self._generation:
+            shard = _FetchShard(threading.current_thread())
+            with self._registry_lock:
+                self._retire_dead_shards()
+                self._shards = self._shards + [shard]
+                self._local.shard = shard
+                self._local.generation = self._generation
+        return shard
+    
+    def _retire_dead_shards(self):
+        """Fold shards of exited threads into the retired shard; needs the registry lock"""
+        dead = [shard for shard in self._shards if not shard.thread.is_alive()]
+        if not dead:
+            return
+        self._drain(dead)
+        with self._retired.lock:
+            for shard in dead:
+                self._retired.absorb(shard)
+        self._shards = [shard for shard in self._shards if shard not in dead]
+    
+    def _drain(self, shards=None):
+        """Fold pending leaderboard deltas from the shards into the top-K counters"""
+        with self._drain_lock:
+            for shard in self._shards if shards is None else shards:
+                counts = zip((self.category_counts, self.quote_counts, self.author_counts),
+                             shard.take_pending())
+                for counter, deltas in counts:
+                    for key, amount in deltas.items():
+                        counter.add(key, amount)
+    
+    def _all_shards(self):
+        # Until a thread has exited the retired shard is empty, so skip its rates
+        return [self._retired] + self._shards if self._retired.total else list(self._shards)
     
-    def __init__(self):
-        self.category_counts = defaultdict(int)
-        self.total_fetches = 0
-        self.favorites = set()
-        self.fetch_timestamps = []
+    @property
+    def total_fetches(self):
+        """Fetches recorded by every thread"""
+        # Under the registry lock a shard being retired is never missed or
+        # counted twice, so the total never appears to go down
+        with self._registry_lock:
+            return sum(shard.total for shard in self._all_shards())
     
-    def record_quote_fetch(self, category):
+    def record_quote_fetch(self, category, quote_id=None, author=None):
         """Record that a quote was fetched from a category"""
-        self.category_counts[category] += 1
-        self.total_fetches += 1
-        self.fetch_timestamps.append(datetime.now())
+        now = self.clock()
+        shard = self._shard()
+        with shard.lock:
+            shard.record(now, category, quote_id, author)
     
-    def add_favorite(self, quote_id):
-        """Add a quote to favorites"""
+    def add_favorite(self, quote_id, client_id=ANONYMOUS):
+        """Add a quote to a client's favorites"""
         if not isinstance(quote_id, int) or quote_id < 1:
             return False
         
-        self.favorites.add(quote_id)
+        with self._favorites_lock:
+            if self.favorites.add(client_id, quote_id) and self.favorites_store:
+                self.favorites_store.append_add(quote_id, client_id)
         return True
     
-    def get_favorites(self):
-        """Get all favorite quote IDs"""
-        return sorted(list(self.favorites))
+    def quote_fetch_count(self, quote_id):
+        """Get how many times a quote has been fetched"""
+        # On the fetch path, so no lock: a count caught mid-retirement only
+        # skews one sampler weight until the quote's next fetch
+        count = self._retired.quote_totals.get(quote_id, 0)
+        for shard in self._shards:
+            count += shard.quote_totals.get(quote_id, 0)
+        return count
+    
+    def favorite_count(self, quote_id):
+        """Get how many clients have favorited a quote"""
+        return self.favorites.count(quote_id)
+    
+    def get_favorites(self, client_id=None):
+        """Get one client's favorite quote IDs, or every favorited ID"""
+        with self._favorites_lock:
+            if client_id is None:
+                return self.favorites.quote_ids()
+            return self.favorites.get(client_id)
+    
+    def top_favorites(self, limit=10):
+        """Get the most favorited quotes as (quote_id, clients) pairs"""
+        with self._favorites_lock:
+            return self.favorites.top(limit)
+    
+    def favorite_updates(self):
+        """Get favorites changed by other workers; this tracker has none"""
+        return {}
+    
+    def popularity_counts(self):
+        """Get per-quote counts for every weighting mode, to seed a reloaded corpus"""
+        fetches = defaultdict(int)
+        with self._registry_lock:
+            for shard in self._all_shards():
+                with shard.lock:
+                    for quote_id, count in shard.quote_totals.items():
+                        fetches[quote_id] += count
+        with self._favorites_lock:
+            favorites = dict(self.favorites.counts)
+        return {'fetches': dict(fetches), 'favorites': favorites}
+    
+    def rollup_totals(self):
+        """Get the running totals recorded by stats history rollups"""
+        return {'fetches': self.total_fetches, 'favorites': self.favorites.total}
     
     def get_stats(self):
         """Get comprehensive statistics"""
-        most_popular = self._get_most_popular_category()
+        now = self.clock()
+        self._drain()
+        # Other readers drain into the leaderboards too, so copy them under the lock
+        with self._drain_lock:
+            category_counts = dict(self.category_counts)
+            most_popular = self.category_counts.leader()
+            top_categories = top_list(self.category_counts, 'category')
+            top_quotes = top_list(self.quote_counts, 'quote_id')
+            top_authors = top_list(self.author_counts, 'author')
+        with self._favorites_lock:
+            total_favorites = len(self.favorites)
+            favorite_clients = self.favorites.client_count()
+        with self._registry_lock:
+            shards = self._all_shards()
+            total = sum(shard.total for shard in shards)
+            qps = sum_rates([shard.fetch_rates for shard in shards], now)
+            category_qps = {
+                category: sum_rates([shard.category_rates[category] for shard in shards
+                                     if category in shard.category_rates], now)
+                for category in category_counts
+            }
         
         return {
-            'total_quotes_fetched': self.total_fetches,
-            'categories_accessed': dict(self.category_counts),
+            'total_quotes_fetched': total,
+            'categories_accessed': category_counts,
             'most_popular_category': most_popular,
-            'total_favorites': len(self.favorites),
-            'unique_categories_used': len(self.category_counts)
+            'top_categories': top_categories,
+            'top_quotes': top_quotes,
+            'top_authors': top_authors,
+            'total_favorites': total_favorites,
+            'favorite_clients': favorite_clients,
+            'unique_categories_used': len(category_counts),
+            'qps': qps,
+            'category_qps': category_qps
         }
     
-    def _get_most_popular_category(self):
-        """Get the category with the most fetches"""
-        if not self.category_counts:
-            return None
-        
-        return max(self.category_counts.items(), key=lambda x: x[1])[0]
-    
     def reset_stats(self):
         """Reset all statistics"""
-        self.category_counts = defaultdict(int)
-        self.total_fetches = 0
-        self.favorites = set()
-        self.fetch_timestamps = []
\ No newline at end of file
+        with self._registry_lock, self._drain_lock:
+            # Threads notice the new generation and register fresh shards
+            self._init_counters()
+        with self._favorites_lock:
+            self.favorites = ClientFavorites()
+            if self.favorites_store:
+                self.favorites_store.append_clear()
+
+
+def sum_rates(trackers, now):
+    """Add up the windowed counts of several rate trackers as rates"""
+    totals = dict.fromkeys(RATE_WINDOWS, 0)
+    for tracker in trackers:
+        for label, count in tracker.window_counts(now).items():
+            totals[label] += count
+    return rates_from_counts(totals)
+
+
+def top_list(counter, name):
+    """Format a counter's leaders for JSON"""
+    return [{name: key, 'count': count} for key, count in counter.most_common()]
+
+
+def recover_favorites(favorites_store=None):
+    """Load persisted favorites into a ClientFavorites"""
+    favorites = ClientFavorites()
+    if favorites_store:
+        for client_id, quote_ids in favorites_store.recover().items():
+            for quote_id in sorted(quote_ids):
+                favorites.add(client_id, quote_id)
+    return favorites
\ No newline at end of file
@@ -0,0 +1,119 @@
+import atexit
+import os
+import random
+import threading
+from collections import deque
+
+
+class TelemetryPipeline:
+    """Buffers custom events and exports them in batches off the request path.
+    
+    `log_event` only samples the event and appends it to a bounded deque;
+    a background thread hands batches to the exporter. When the queue is
+    full the oldest event is dropped, so request latency never depends on
+    the exporter or stdout.
+    """
+    
+    def __init__(self, exporter, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 sample_rates=None, default_sample_rate=1.0, rng=random.random):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rates = sample_rates or {}
+        self.default_sample_rate = default_sample_rate
+        self._random = rng
+        self._queue = deque(maxlen=max_queue)
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        
+        self.enqueued = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.export_errors = 0
+        
+        atexit.register(self.flush)
+    
+    def log_event(self, name, properties=None):
+        """Queue a custom event for export"""
+        rate = self.sample_rates.get(name, self.default_sample_rate)
+        if rate < 1.0 and self._random() >= rate:
+            self.sampled_out += 1
+            return
+        
+        queue = self._queue
+        if len(queue) == queue.maxlen:
+            # deque(maxlen=...) discards the oldest entry on append
+            self.dropped += 1
+        queue.append((name, properties))
+        self.enqueued += 1
+        
+        self._ensure_flusher()
+        if len(queue) >= self.batch_size:
+            self._wake.set()
+    
+    def _ensure_flusher(self):
+        """Start the flusher thread, once per process (threads do not survive fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='telemetry-flusher', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+    
+    def flush(self):
+        """Export everything queued so far in batches"""
+        with self._flush_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.popleft())
+                    except IndexError:
+                        break
+                if not batch:
+                    break
+                
+                try:
+                    self.exporter(batch)
+                    self.flushed += len(batch)
+                    self.batches += 1
+                except Exception:
+                    # Telemetry must never take the app down
+                    self.export_errors += 1
+    
+    def get_counters(self):
+        """Get pipeline counters"""
+        return {
+            'enqueued': self.enqueued,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'export_errors': self.export_errors,
+            'queued': len(self._queue)
+        }
+
+
+def parse_sample_rates(spec):
+    """Parse 'event=rate,event=rate' into a dict of sampling rates"""
+    rates = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition('=')
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Ignoring invalid telemetry sample rate: {item}")
+    return rates
@@ -0,0 +1,96 @@
+"""Benchmark suite for the quote generator.
+    
+    python -m benchmarks micro
+    python -m benchmarks load --model closed --concurrency 8 --duration 10
+    python -m benchmarks load --model open --rate 300 --server gunicorn
+
+Results are compared with benchmarks/baselines.json and the run exits
+with status 1 on a regression. Pass --save-baseline to record new ones.
+Microbenchmarks are saved relative to a reference loop timed alongside
+them; load results are absolute, so they are only compared on the machine
+that recorded them.
+"""
+import argparse
+import json
+import sys
+from .baseline import (DEFAULT_BASELINE, compare_load, compare_micro, load_baseline, machine_id,
+                       save_baseline)
+from .load import run_closed_loop, run_open_loop
+from .micro import calibrate, run_micro
+from .server import external_server, gunicorn_server, in_process_server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='record results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed relative regression')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    micro = commands.add_parser('micro', help='QuoteManager and StatsTracker microbenchmarks')
+    micro.add_argument('--number', type=int, default=2000, help='calls per timing run')
+    
+    load = commands.add_parser('load', help='concurrent HTTP load test')
+    load.add_argument('--server', choices=['inprocess', 'gunicorn', 'url'], default='inprocess')
+    load.add_argument('--url', help='base URL when --server=url')
+    load.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    load.add_argument('--model', choices=['closed', 'open'], default='closed')
+    load.add_argument('--concurrency', type=int, default=8, help='closed-loop users')
+    load.add_argument('--rate', type=float, default=200.0, help='open-loop requests per second')
+    load.add_argument('--duration', type=float, default=10.0, help='seconds of load')
+    return parser.parse_args(argv)
+
+
+def server_for(args):
+    if args.server == 'gunicorn':
+        return gunicorn_server(workers=args.workers)
+    if args.server == 'url':
+        if not args.url:
+            raise SystemExit('--url is required with --server=url')
+        return external_server(args.url)
+    return in_process_server()
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    baseline = load_baseline(args.baseline)
+    
+    if args.command == 'micro':
+        section = 'micro'
+        print(f'Reference workload: {calibrate()} ns/op')
+        results = run_micro(number=args.number)
+        saved = results
+        regressions = compare_micro(results, baseline.get(section, {}), args.tolerance)
+    else:
+        section = f'load_{args.model}'
+        with server_for(args) as base_url:
+            if args.model == 'closed':
+                outcome = run_closed_loop(base_url, args.concurrency, args.duration)
+            else:
+                outcome = run_open_loop(base_url, args.rate, args.duration)
+        results = outcome.summary()
+        machine = machine_id()
+        saved = {'machine': machine, 'results': results}
+        expected = baseline.get(section, {})
+        if expected.get('machine') == machine:
+            regressions = compare_load(results, expected['results'], args.tolerance)
+        else:
+            if expected:
+                print(f'{section} baseline was recorded on {expected.get("machine")}; not comparing')
+            regressions = []
+    
+    print(json.dumps(results, indent=2))
+    
+    if args.save_baseline:
+        save_baseline(section, saved, args.baseline)
+        print(f'Saved {section} baseline to {args.baseline}')
+        return 0
+    
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
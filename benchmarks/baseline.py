@@ -0,0 +1,67 @@
+import json
+import os
+import platform
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def machine_id():
+    """Describe the CPU and interpreter, to tell whether absolute results are comparable"""
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return (f'{platform.machine()} {model} x{os.cpu_count()}, '
+            f'{platform.python_implementation()} {platform.python_version()}')
+
+
+def load_baseline(path=DEFAULT_BASELINE):
+    """Read saved baselines, or an empty set if none were saved yet"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(section, results, path=DEFAULT_BASELINE):
+    """Store results as the new baseline for one section"""
+    baseline = load_baseline(path)
+    baseline[section] = results
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_micro(results, baseline, tolerance):
+    """Regressions where a call got more than `tolerance` slower.
+    
+    Both sides are in reference-workload units (see micro.run_micro).
+    """
+    regressions = []
+    for name, cost in results.items():
+        expected = baseline.get(name)
+        if expected and cost > expected * (1 + tolerance):
+            regressions.append(f'{name}: {cost}x reference vs baseline {expected}x')
+    return regressions
+
+
+def compare_load(summary, baseline, tolerance):
+    """Regressions in per-endpoint throughput or p99 latency"""
+    regressions = []
+    for endpoint, current in summary.items():
+        expected = baseline.get(endpoint)
+        if not expected:
+            continue
+        if current['throughput'] < expected['throughput'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {current['throughput']}/s "
+                               f"vs baseline {expected['throughput']}/s")
+        if current['p99_ms'] > expected['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p99 {current['p99_ms']} ms "
+                               f"vs baseline {expected['p99_ms']} ms")
+    return regressions
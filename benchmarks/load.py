@@ -0,0 +1,165 @@
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+CATEGORIES = ['motivational', 'wisdom', 'humor']
+
+# Relative weight of each endpoint in the generated traffic
+DEFAULT_MIX = {
+    'quote': 0.5,
+    'quote_by_category': 0.3,
+    'stats': 0.1,
+    'favorite': 0.1
+}
+
+
+def build_request(endpoint, rng):
+    """Method, path and body for one request to an endpoint"""
+    if endpoint == 'quote':
+        return 'GET', '/api/quote', None
+    if endpoint == 'quote_by_category':
+        return 'GET', f'/api/quote/category/{rng.choice(CATEGORIES)}', None
+    if endpoint == 'stats':
+        return 'GET', '/api/stats', None
+    if endpoint == 'favorite':
+        return 'POST', '/api/favorite', json.dumps({'quote_id': rng.randint(1, 20)})
+    raise ValueError(f'Unknown endpoint: {endpoint}')
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadResult:
+    """Latencies and errors collected per endpoint"""
+    
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            if ok:
+                self.latencies[endpoint].append(seconds)
+            else:
+                self.errors[endpoint] += 1
+    
+    def summary(self):
+        """Throughput and latency percentiles (ms) per endpoint"""
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[endpoint])
+            report[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'throughput': round(len(values) / self.elapsed, 2) if self.elapsed else 0.0,
+                'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+                'p90_ms': round(percentile(values, 0.90) * 1000, 3),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3) if values else 0.0
+            }
+        return report
+
+
+class Client:
+    """Keep-alive HTTP connection per thread"""
+    
+    def __init__(self, base_url):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self._local = threading.local()
+    
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=30)
+        return connection
+    
+    def send(self, method, path, body):
+        """Send one request; returns True on a 2xx response"""
+        headers = {'Content-Type': 'application/json'} if body else {}
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return 200 <= response.status < 300
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return False
+
+
+def _pick(mix, rng):
+    endpoints = list(mix)
+    return rng.choices(endpoints, weights=[mix[e] for e in endpoints])[0]
+
+
+def run_closed_loop(base_url, concurrency=8, duration=10.0, mix=None, seed=0):
+    """Each of `concurrency` users sends its next request as soon as the last returns"""
+    mix = mix or DEFAULT_MIX
+    client = Client(base_url)
+    result = LoadResult()
+    deadline = time.perf_counter() + duration
+    
+    def user(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            endpoint = _pick(mix, rng)
+            method, path, body = build_request(endpoint, rng)
+            started = time.perf_counter()
+            ok = client.send(method, path, body)
+            result.record(endpoint, time.perf_counter() - started, ok)
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def run_open_loop(base_url, rate=200.0, duration=10.0, mix=None, seed=0, max_workers=64):
+    """Send requests at a fixed arrival rate regardless of response times.
+    
+    Latency is measured from each request's scheduled start, so queueing
+    delay on an overloaded server is included rather than hidden.
+    """
+    mix = mix or DEFAULT_MIX
+    client = Client(base_url)
+    result = LoadResult()
+    rng = random.Random(seed)
+    total = int(rate * duration)
+    
+    def send(endpoint, request, scheduled):
+        ok = client.send(*request)
+        result.record(endpoint, time.perf_counter() - scheduled, ok)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = _pick(mix, rng)
+            pool.submit(send, endpoint, build_request(endpoint, rng), scheduled)
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,59 @@
+import timeit
+from app.models import QuoteManager
+from app.stats import StatsTracker
+
+
+def _cases():
+    """Named callables for each QuoteManager and StatsTracker method under test"""
+    manager = QuoteManager()
+    tracker = StatsTracker()
+    for _ in range(1000):
+        tracker.record_quote_fetch('wisdom', 8)
+    
+    return {
+        'QuoteManager.get_random_quote': manager.get_random_quote,
+        'QuoteManager.get_quote_by_category': lambda: manager.get_quote_by_category('wisdom'),
+        'QuoteManager.get_random_entry': manager.get_random_entry,
+        'QuoteManager.get_random_entry_weighted': lambda: manager.get_random_entry('humor', 'fetches'),
+        'QuoteManager.get_quote_by_id': lambda: manager.get_quote_by_id(12),
+        'QuoteManager.get_categories': manager.get_categories,
+        'QuoteManager.get_quotes_by_author': lambda: manager.get_quotes_by_author('roosevelt'),
+        'QuoteManager.search': lambda: manager.search('the bea*'),
+        'StatsTracker.record_quote_fetch': lambda: tracker.record_quote_fetch('humor', 15),
+        'StatsTracker.add_favorite': lambda: tracker.add_favorite(3),
+        'StatsTracker.get_favorites': tracker.get_favorites,
+        'StatsTracker.get_stats': tracker.get_stats
+    }
+
+
+def _reference():
+    """Fixed interpreter workload the cases are measured against"""
+    counts = {}
+    for i in range(64):
+        key = i & 7
+        counts[key] = counts.get(key, 0) + 1
+    return sorted(counts.items())
+
+
+def calibrate(number=200, repeat=5):
+    """Best-of-`repeat` nanoseconds per call of the reference workload"""
+    timings = timeit.repeat(_reference, number=number, repeat=repeat)
+    return round(min(timings) / number * 1e9, 1)
+
+
+def run_micro(number=2000, repeat=5):
+    """Best-of-`repeat` cost of every case, in multiples of the reference workload.
+    
+    Absolute timings move with the CPU, its clock and the Python build, so
+    each case is timed alternately with the reference loop and reported
+    as a ratio, which is what the baselines store.
+    """
+    reference_number = max(number // 10, 1)
+    results = {}
+    for name, func in _cases().items():
+        reference, case = [], []
+        for _ in range(repeat):
+            reference.append(timeit.timeit(_reference, number=reference_number) / reference_number)
+            case.append(timeit.timeit(func, number=number) / number)
+        results[name] = round(min(case) / min(reference), 3)
+    return results
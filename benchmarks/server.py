@@ -0,0 +1,76 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from werkzeug.serving import make_server
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_healthy(base_url, timeout=15.0):
+    """Poll /health until the server answers"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'Server at {base_url} did not become healthy')
+            time.sleep(0.1)
+
+
+@contextmanager
+def in_process_server():
+    """Serve the Flask app from a background thread; yields its base URL"""
+    from app.main import create_app
+    
+    # Keep the report readable: no per-request access log or event printing
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app()
+    app.extensions['quote_generator'].telemetry.exporter = lambda batch: None
+    
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        wait_until_healthy(base_url)
+        yield base_url
+    finally:
+        server.shutdown()
+
+
+@contextmanager
+def gunicorn_server(workers=2, port=8765, extra_args=()):
+    """Run the app under gunicorn as in the Dockerfile; yields its base URL"""
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--config', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--timeout', '60',
+        *extra_args,
+        'app.main:app'
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_healthy(base_url)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@contextmanager
+def external_server(base_url):
+    """Use an already running server"""
+    wait_until_healthy(base_url)
+    yield base_url.rstrip('/')
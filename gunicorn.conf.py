@@ -0,0 +1,38 @@
+# Gunicorn settings for the container (see Dockerfile)
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+# Threaded workers overlap requests within a process, which is also what
+# gives the load shedder's in-flight estimate something to count: a sync
+# worker only ever has the one request it is serving
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = 60
+
+# Build the corpus, indexes and response cache once in the master and let
+# workers inherit them through fork instead of rebuilding them each
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+if preload_app:
+    # Signal handlers and watcher threads must be set up in each worker
+    os.environ['DEFER_WORKER_START'] = '1'
+
+
+def when_ready(server):
+    """Freeze the preloaded objects before the first fork.
+
+    gc.freeze() moves everything allocated so far into a permanent
+    generation the collector never scans, so collections in the workers
+    do not write to (and un-share) the pages holding the corpus.
+    """
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info("Preloaded app frozen: %d objects", gc.get_freeze_count())
+
+
+def post_worker_init(worker):
+    """Start per-process machinery that does not survive fork"""
+    worker.wsgi.extensions['quote_generator'].start_worker()
@@ -0,0 +1,117 @@
+import pytest
+from app.admission import LoadShedder, RateLimiter, parse_request_start, parse_route_limits
+
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    """Tests for per-client token buckets"""
+    
+    def test_burst_then_refill(self):
+        """Test a client can spend its burst and then refills at the rate"""
+        clock = FakeClock()
+        limiter = RateLimiter(rate=2, burst=3, clock=clock)
+        
+        assert [limiter.acquire('a', '/api/quote') for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire('a', '/api/quote') == pytest.approx(0.5)
+        
+        clock.now += 0.5
+        assert limiter.acquire('a', '/api/quote') == 0
+        assert limiter.get_counters()['limited'] == 1
+    
+    def test_clients_and_routes_are_independent(self):
+        """Test buckets are keyed by client and route"""
+        limiter = RateLimiter(rate=1, burst=1, clock=FakeClock())
+        
+        assert limiter.acquire('a', '/api/quote') == 0
+        assert limiter.acquire('b', '/api/quote') == 0
+        assert limiter.acquire('a', '/api/search') == 0
+        assert limiter.acquire('a', '/api/quote') > 0
+    
+    def test_route_limits_override_default(self):
+        """Test a per-route limit replaces the default"""
+        limiter = RateLimiter(rate=100, burst=100, route_limits={'/api/search': (1, 1)},
+                              clock=FakeClock())
+        
+        assert limiter.acquire('a', '/api/search') == 0
+        assert limiter.acquire('a', '/api/search') > 0
+    
+    def test_idle_buckets_are_evicted(self):
+        """Test the least recently used bucket is dropped at capacity"""
+        limiter = RateLimiter(rate=1, burst=1, max_buckets=2, clock=FakeClock())
+        limiter.acquire('a', '/')
+        limiter.acquire('b', '/')
+        limiter.acquire('a', '/')
+        limiter.acquire('c', '/')
+        
+        counters = limiter.get_counters()
+        assert counters['buckets'] == 2
+        assert counters['evicted'] == 1
+        # 'b' was evicted, so it comes back with a full bucket
+        assert limiter.acquire('b', '/') == 0
+
+
+class TestLoadShedder:
+    """Tests for queue-time load shedding"""
+    
+    def test_sheds_on_proxy_queue_time(self):
+        """Test requests queued longer than the budget are rejected"""
+        shedder = LoadShedder(budget=1.0, trust_request_start=True, wall_clock=FakeClock(5000.0))
+        
+        assert shedder.admit(request_start=4999.5) == 0
+        assert shedder.admit(request_start=4997.5) == 3
+        assert shedder.get_counters()['shed'] == 1
+    
+    def test_request_start_ignored_unless_trusted(self):
+        """Test a client-supplied X-Request-Start is not trusted by default"""
+        shedder = LoadShedder(budget=1.0, wall_clock=FakeClock(5000.0))
+        
+        assert shedder.admit(request_start=4990.0) == 0
+    
+    def test_future_request_start_cannot_bypass_backlog(self):
+        """Test the in-flight estimate still applies when the header claims no wait"""
+        shedder = LoadShedder(budget=1.0, smoothing=1.0, trust_request_start=True,
+                              wall_clock=FakeClock(5000.0))
+        shedder.admit()
+        shedder.finish(0.6)
+        shedder.admit()
+        shedder.admit()
+        
+        assert shedder.admit(request_start=9999.0) == 2
+    
+    def test_sheds_on_estimated_backlog(self):
+        """Test in-flight requests times service time drives the estimate"""
+        shedder = LoadShedder(budget=1.0, smoothing=1.0)
+        shedder.admit()
+        shedder.finish(0.6)
+        
+        assert shedder.admit() == 0
+        assert shedder.admit() == 0
+        assert shedder.admit() == 2
+        assert shedder.get_counters()['in_flight'] == 2
+
+
+class TestParsing:
+    """Tests for admission config and header parsing"""
+    
+    def test_request_start_units(self):
+        """Test seconds, milliseconds and microseconds all parse to seconds"""
+        assert parse_request_start('t=1700000000.5') == pytest.approx(1700000000.5)
+        assert parse_request_start('t=1700000000500') == pytest.approx(1700000000.5)
+        assert parse_request_start('1700000000500000') == pytest.approx(1700000000.5)
+        assert parse_request_start('garbage') is None
+        assert parse_request_start(None) is None
+    
+    def test_route_limits(self):
+        """Test route limits parse and invalid entries are skipped"""
+        limits = parse_route_limits('/api/search=2:5, /api/quotes=4,/bad=x,/zero=0')
+        
+        assert limits == {'/api/search': (2.0, 5.0), '/api/quotes': (4.0, 4.0)}
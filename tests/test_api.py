@@ -1,5 +1,7 @@
+import gzip
 import pytest
 import json
+import re
 from app.main import app
 
 
@@ -31,6 +33,7 @@ class TestAPIEndpoints:
         data = json.loads(response.data)
         assert data['status'] == 'healthy'
         assert data['service'] == 'quote-generator'
+        assert 'dropped' in data['telemetry']
     
     def test_get_random_quote(self, client):
         """Test getting a random quote"""
@@ -84,6 +87,21 @@ class TestAPIEndpoints:
         
         assert data['category'] == 'humor'
     
+    def test_get_weighted_quote(self, client):
+        """Test weighted selection stays within the requested category"""
+        response = client.get('/api/quote/category/wisdom?weighted=fetches')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        
+        assert data['category'] == 'wisdom'
+        assert client.get('/api/quote?weighted=favorites').status_code == 200
+    
+    def test_get_weighted_quote_invalid_mode(self, client):
+        """Test an unknown weighting mode returns 400"""
+        assert client.get('/api/quote?weighted=likes').status_code == 400
+        assert client.get('/api/quote/category/humor?weighted=likes').status_code == 400
+    
     def test_get_quote_by_invalid_category(self, client):
         """Test that invalid category returns 404"""
         response = client.get('/api/quote/category/nonexistent')
@@ -93,6 +111,92 @@ class TestAPIEndpoints:
         
         assert 'error' in data
     
+    def test_get_quotes_batch(self, client):
+        """Test the batch endpoint returns unique quotes"""
+        response = client.get('/api/quotes?count=5&category=wisdom')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        
+        assert data['count'] == 5
+        assert len({q['id'] for q in data['quotes']}) == 5
+        assert all(q['category'] == 'wisdom' for q in data['quotes'])
+    
+    def test_get_quotes_batch_unique_caps_at_pool(self, client):
+        """Test unique sampling returns at most the whole category"""
+        response = client.get('/api/quotes?count=50&category=humor')
+        data = json.loads(response.data)
+        
+        assert data['count'] == 6
+    
+    def test_get_quotes_batch_with_replacement(self, client):
+        """Test unique=false returns exactly count quotes"""
+        response = client.get('/api/quotes?count=50&category=humor&unique=false')
+        data = json.loads(response.data)
+        
+        assert data['count'] == 50
+    
+    def test_get_quotes_batch_invalid_count(self, client):
+        """Test out-of-range counts return 400"""
+        assert client.get('/api/quotes?count=0').status_code == 400
+        assert client.get('/api/quotes?count=abc').status_code == 400
+        assert client.get('/api/quotes?count=100000').status_code == 400
+    
+    def test_get_quotes_batch_invalid_category(self, client):
+        """Test unknown categories return 404"""
+        response = client.get('/api/quotes?count=2&category=nonexistent')
+        
+        assert response.status_code == 404
+    
+    def test_export_quotes_ndjson(self, client):
+        """Test the export streams one JSON object per line"""
+        response = client.get('/api/quotes/export')
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        assert [row['id'] for row in rows] == list(range(1, 21))
+    
+    def test_export_quotes_by_category(self, client):
+        """Test the export can be limited to one category"""
+        response = client.get('/api/quotes/export?category=Humor')
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        
+        assert len(rows) == 6
+        assert client.get('/api/quotes/export?category=nonexistent').status_code == 404
+    
+    def test_search_quotes(self, client):
+        """Test searching quote text ranks matching quotes"""
+        response = client.get('/api/search?q=wisdom')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        
+        assert data['total'] == 1
+        assert data['results'][0]['id'] == 8
+        assert data['results'][0]['score'] > 0
+    
+    def test_search_by_author_with_prefix(self, client):
+        """Test author search with a prefix token"""
+        response = client.get('/api/search?q=roose*&field=author')
+        data = json.loads(response.data)
+        
+        assert sorted(q['id'] for q in data['results']) == [3, 5, 13]
+    
+    def test_search_pagination(self, client):
+        """Test search results can be paged"""
+        first = json.loads(client.get('/api/search?q=anonymous&per_page=2').data)
+        second = json.loads(client.get('/api/search?q=anonymous&per_page=2&page=2').data)
+        
+        assert first['total'] == 5
+        assert len(first['results']) == 2
+        assert not {q['id'] for q in first['results']} & {q['id'] for q in second['results']}
+    
+    def test_search_requires_query(self, client):
+        """Test missing query or bad field returns 400"""
+        assert client.get('/api/search').status_code == 400
+        assert client.get('/api/search?q=x&field=category').status_code == 400
+    
     def test_get_categories(self, client):
         """Test getting all categories"""
         response = client.get('/api/categories')
@@ -114,6 +218,28 @@ class TestAPIEndpoints:
         assert 'wisdom' in categories
         assert 'humor' in categories
     
+    def test_get_categories_etag_not_modified(self, client):
+        """Test categories honour If-None-Match with a 304"""
+        response = client.get('/api/categories')
+        etag = response.headers['ETag']
+        
+        cached = client.get('/api/categories', headers={'If-None-Match': etag})
+        
+        assert response.headers['Cache-Control'] == 'no-cache'
+        assert cached.status_code == 304
+        assert cached.data == b''
+        assert cached.headers['ETag'] == etag
+    
+    def test_quote_body_matches_jsonify(self, client):
+        """Test pre-encoded quote bodies match what jsonify produced"""
+        from app.main import quote_manager
+        response = client.get('/api/quote/category/wisdom')
+        data = json.loads(response.data)
+        
+        assert data == quote_manager.get_quote_by_id(data['id'])
+        assert response.data == app.json.response(data).data
+        assert response.headers['ETag']
+    
     def test_get_stats_initial(self, client):
         """Test getting stats returns proper structure"""
         response = client.get('/api/stats')
@@ -127,6 +253,42 @@ class TestAPIEndpoints:
         assert 'total_favorites' in data
         assert 'unique_categories_used' in data
     
+    def test_get_stats_includes_rates(self, client):
+        """Test stats include windowed QPS overall and per category"""
+        client.get('/api/quote/category/humor')
+        
+        response = client.get('/api/stats')
+        data = json.loads(response.data)
+        
+        assert set(data['qps']) == {'1m', '5m', '1h'}
+        assert data['qps']['1m'] > 0
+        assert 'humor' in data['category_qps']
+    
+    def test_get_stats_includes_leaders(self, client):
+        """Test stats include top categories, quotes and authors"""
+        client.get('/api/quote/category/humor')
+        
+        data = json.loads(client.get('/api/stats').data)
+        
+        assert data['top_categories'] == [{'category': 'humor', 'count': 1}]
+        assert data['top_quotes'][0]['count'] == 1
+        assert data['top_authors'][0]['count'] == 1
+    
+    def test_stats_use_corpus_category(self, client):
+        """Test fetches are counted under the corpus spelling of the category"""
+        client.get('/api/quote/category/HUMOR')
+        client.get('/api/quote/category/Humor')
+        
+        data = json.loads(client.get('/api/stats').data)
+        
+        assert data['categories_accessed'] == {'humor': 2}
+    
+    def test_stats_history_disabled(self, client):
+        """Test history is 404 unless STATS_HISTORY_PATH is set"""
+        response = client.get('/api/stats/history')
+        
+        assert response.status_code == 404
+    
     def test_add_favorite_valid(self, client):
         """Test adding a valid favorite"""
         response = client.post('/api/favorite',
@@ -197,6 +359,42 @@ class TestAPIEndpoints:
         assert 1 in data['favorites']
         assert 3 in data['favorites']
     
+    def test_favorites_are_per_client(self, client):
+        """Test each client only sees its own favorites"""
+        for client_id, quote_id in [('alice', 1), ('alice', 2), ('bob', 2)]:
+            client.post('/api/favorite',
+                       data=json.dumps({'quote_id': quote_id}),
+                       content_type='application/json',
+                       headers={'X-Client-Id': client_id})
+        
+        alice = json.loads(client.get('/api/favorites', headers={'X-Client-Id': 'alice'}).data)
+        bob = json.loads(client.get('/api/favorites?client_id=bob').data)
+        anonymous = json.loads(client.get('/api/favorites').data)
+        
+        assert alice['favorites'] == [1, 2]
+        assert bob['favorites'] == [2]
+        assert anonymous['count'] == 0
+    
+    def test_invalid_client_id(self, client):
+        """Test a malformed client id is rejected"""
+        response = client.get('/api/favorites', headers={'X-Client-Id': 'bad id'})
+        
+        assert response.status_code == 400
+    
+    def test_top_favorites(self, client):
+        """Test quotes are ranked by how many clients favorited them"""
+        for client_id, quote_id in [('a', 5), ('b', 5), ('c', 5), ('a', 7), ('b', 7), ('a', 9)]:
+            client.post('/api/favorite',
+                       data=json.dumps({'quote_id': quote_id}),
+                       content_type='application/json',
+                       headers={'X-Client-Id': client_id})
+        
+        response = client.get('/api/favorites/top?limit=2')
+        data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        assert data['top'] == [{'quote_id': 5, 'clients': 3}, {'quote_id': 7, 'clients': 2}]
+    
     def test_stats_tracking_after_quote_fetch(self, client):
         """Test that stats are updated after fetching quotes"""
         # Fetch some quotes
@@ -209,6 +407,117 @@ class TestAPIEndpoints:
         
         assert data['total_quotes_fetched'] >= 2
     
+    def test_metrics_endpoint(self, client):
+        """Test /metrics reports per-route latency in Prometheus format"""
+        client.get('/api/quote')
+        
+        response = client.get('/metrics')
+        text = response.data.decode()
+        
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert 'http_request_duration_seconds_bucket{route="/api/quote",method="GET",status="200"' in text
+        assert 'http_requests_in_flight{route="/metrics"} 1' in text
+        assert 'telemetry_events_dropped_total' in text
+        assert 'corpus_generation' in text
+    
+    def test_admin_reload(self, client, monkeypatch):
+        """Test the reload endpoint needs the admin token and bumps the generation"""
+        from app.main import quote_manager
+        assert client.post('/admin/reload').status_code == 404
+        
+        monkeypatch.setitem(app.extensions['quote_generator'].settings, 'ADMIN_TOKEN', 'secret')
+        assert client.post('/admin/reload', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        
+        generation = quote_manager.generation
+        response = client.post('/admin/reload', headers={'Authorization': 'Bearer secret'})
+        data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        assert data['generation'] == generation + 1
+        assert json.loads(client.get('/health').data)['corpus']['generation'] == generation + 1
+    
+    def test_request_profiling(self, client, monkeypatch):
+        """Test X-Profile with the admin token captures a profile readable by admins"""
+        services = app.extensions['quote_generator']
+        monkeypatch.setitem(services.settings, 'ADMIN_TOKEN', 'secret')
+        
+        assert 'X-Profile-Id' not in client.get('/api/quote', headers={'X-Profile': 'wrong'}).headers
+        response = client.get('/api/quote', headers={'X-Profile': 'secret'})
+        capture_id = response.headers['X-Profile-Id']
+        
+        admin = {'Authorization': 'Bearer secret'}
+        assert client.get('/admin/profile').status_code == 401
+        status = json.loads(client.get('/admin/profile', headers=admin).data)
+        assert status['requests']['captures'][0]['path'] == '/api/quote'
+        assert status['spans'] is None
+        
+        report = client.get(f'/admin/profile/requests/{capture_id}', headers=admin)
+        assert report.status_code == 200
+        assert b'get_random_quote' in report.data
+        assert client.get('/admin/profile/requests/0', headers=admin).status_code == 404
+    
+    def test_stack_sampler_endpoints(self, client, monkeypatch):
+        """Test the sampler can be started, stopped and downloaded as collapsed stacks"""
+        services = app.extensions['quote_generator']
+        monkeypatch.setitem(services.settings, 'ADMIN_TOKEN', 'secret')
+        admin = {'Authorization': 'Bearer secret'}
+        
+        started = client.post('/admin/profile/sampler?action=start&duration=5', headers=admin)
+        assert json.loads(started.data)['running'] is True
+        assert client.post('/admin/profile/sampler', headers=admin).status_code == 409
+        services.stack_sampler.sample()
+        stopped = client.post('/admin/profile/sampler?action=stop', headers=admin)
+        assert json.loads(stopped.data)['running'] is False
+        
+        flamegraph = client.get('/admin/profile/flamegraph', headers=admin)
+        assert flamegraph.mimetype == 'text/plain'
+        assert flamegraph.data.strip().split(b'\n')[0].rsplit(b' ', 1)[1].isdigit()
+    
+    def test_no_repeat_quotes(self, client):
+        """Test no_repeat walks a client's shuffle of the category without repeats"""
+        from app.main import quote_manager
+        count = sum(1 for quote in quote_manager.quotes if quote['category'] == 'wisdom')
+        
+        ids = []
+        for _ in range(count):
+            response = client.get('/api/quote/category/wisdom?no_repeat=true&client_id=tab-1')
+            ids.append(json.loads(response.data)['id'])
+        
+        assert len(set(ids)) == count
+        response = client.get('/api/quote?no_repeat=1', headers={'X-Client-Id': 'tab-1'})
+        assert response.status_code == 200
+        assert client.get('/api/quote?no_repeat=true&weighted=fetches').status_code == 400
+        assert client.get('/api/quote?no_repeat=true&client_id=bad id').status_code == 400
+        assert json.loads(client.get('/health').data)['shuffle_bags']['bags'] >= 2
+    
+    def test_rate_limit_returns_429(self, client, monkeypatch):
+        """Test a client over its limit gets 429 with Retry-After, probes are exempt"""
+        from app.admission import RateLimiter
+        services = app.extensions['quote_generator']
+        monkeypatch.setattr(services, 'rate_limiter', RateLimiter(rate=0.5, burst=2))
+        
+        statuses = [client.get('/api/quote').status_code for _ in range(3)]
+        
+        assert statuses == [200, 200, 429]
+        assert client.get('/api/quote').headers['Retry-After'] == '2'
+        assert client.get('/health').status_code == 200
+    
+    def test_load_shedding_returns_503(self, client, monkeypatch):
+        """Test a request queued past the budget is shed"""
+        import time
+        from app.admission import LoadShedder
+        services = app.extensions['quote_generator']
+        monkeypatch.setattr(services, 'load_shedder', LoadShedder(budget=1.0, trust_request_start=True))
+        
+        stale = client.get('/api/quote', headers={'X-Request-Start': f't={time.time() - 5:.3f}'})
+        fresh = client.get('/api/quote', headers={'X-Request-Start': f't={time.time():.3f}'})
+        
+        assert stale.status_code == 503
+        assert int(stale.headers['Retry-After']) >= 5
+        assert fresh.status_code == 200
+        assert services.load_shedder.get_counters()['in_flight'] == 0
+    
     def test_content_type_json(self, client):
         """Test that API returns JSON content type"""
         response = client.get('/api/quote')
@@ -226,32 +535,180 @@ class TestAPIEndpoints:
         data = json.loads(response.data)
         
         assert data['total_quotes_fetched'] == 5
-
+    
     def test_static_file_serving(self, client):
         """Test that static files are served correctly"""
         response = client.get('/static/style.css')
         assert response.status_code in [200, 404]  # 404 ok in test env without static files
-        
+    
     def test_root_serves_html(self, client):
         """Test root serves index.html"""
         response = client.get('/')
         # In test env without static files, might get 404 - both ok
         assert response.status_code in [200, 404]
-
+    
+    def test_static_assets_fingerprinted_and_gzipped(self, client):
+        """Test index.html links a fingerprinted stylesheet served gzipped and immutable"""
+        page = client.get('/')
+        assert page.headers['Cache-Control'] == 'no-cache'
+        stylesheet = re.search(r'href="(/static/style\.[0-9a-f]{10}\.css)"', page.get_data(as_text=True))
+        assert stylesheet
+        
+        response = client.get(stylesheet.group(1), headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == client.get('/static/style.css').data
+        
+        revalidated = client.get(stylesheet.group(1), headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']
+        })
+        assert revalidated.status_code == 304
+        assert client.get('/static/missing.css').status_code == 404
+    
+    def test_large_responses_compressed(self, client):
+        """Test bulk and export responses are gzipped for clients that accept it"""
+        plain = client.get('/api/quotes/export')
+        response = client.get('/api/quotes/export', headers={'Accept-Encoding': 'gzip'})
+        
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == plain.data
+        assert client.get('/api/quote', headers={'Accept-Encoding': 'gzip'}).headers.get(
+            'Content-Encoding') is None
+        assert json.loads(client.get('/health').data)['compression']['compressed'] >= 1
+    
     def test_flask_static_folder_configuration(self):
         """Test that Flask app has correct static folder configured"""
         from app.main import app
         assert app.static_folder is not None
         assert app.static_url_path == '/static'
-
+    
     def test_quote_manager_initialization(self):
         """Test that QuoteManager is initialized"""
         from app.main import quote_manager
         assert quote_manager is not None
         quotes = quote_manager.get_random_quote()
         assert 'text' in quotes
-
+    
     def test_stats_tracker_initialization(self):
         """Test that StatsTracker is initialized"""
         from app.main import stats_tracker
-        assert stats_tracker is not None
\ No newline at end of file
+        assert stats_tracker is not None
+
+class TestAppFactory:
+    """Tests for create_app and startup reporting"""
+    
+    def test_apps_are_independent(self):
+        """Test each app gets its own services built from its config"""
+        from app.main import create_app
+        limited = create_app({'RATE_LIMIT_RPS': '1', 'RATE_LIMIT_BURST': '1'})
+        
+        with limited.test_client() as client:
+            assert client.get('/api/quote').status_code == 200
+            assert client.get('/api/quote').status_code == 429
+        assert limited.extensions['quote_generator'] is not app.extensions['quote_generator']
+        assert app.extensions['quote_generator'].rate_limiter is None
+    
+    def test_rate_limit_keyed_on_forwarded_client(self):
+        """Test behind a trusted proxy each forwarded client gets its own bucket"""
+        from app.main import create_app
+        proxied = create_app({'RATE_LIMIT_RPS': '1', 'RATE_LIMIT_BURST': '1',
+                              'TRUST_PROXY_HOPS': '1'})
+        
+        with proxied.test_client() as client:
+            def get(address):
+                return client.get('/api/quote', headers={'X-Forwarded-For': address}).status_code
+            
+            assert get('203.0.113.1') == 200
+            assert get('203.0.113.2') == 200
+            assert get('203.0.113.1') == 429
+            # Only the hop the proxy appended counts, not what the client claimed
+            assert get('198.51.100.7, 203.0.113.2') == 429
+    
+    def test_health_reports_startup(self, client):
+        """Test /health includes import and build timings"""
+        data = json.loads(client.get('/health').data)
+        
+        assert set(data['startup']['phases']) == {'corpus', 'assets', 'stats', 'monitoring'}
+        assert data['startup']['import_seconds'] > 0
+        assert data['startup']['built_in_this_process'] is True
+    
+    def test_stats_history(self, tmp_path):
+        """Test rollups are served from /api/stats/history"""
+        from app.main import create_app
+        history_app = create_app({'STATS_HISTORY_PATH': str(tmp_path / 'stats.bin'),
+                                  'DEFER_WORKER_START': '1'})
+        services = history_app.extensions['quote_generator']
+        
+        with history_app.test_client() as client:
+            client.get('/api/quote')
+            client.get('/api/quote')
+            services.stats_history.roll_up(now=6030)
+            
+            data = json.loads(client.get('/api/stats/history?from=0&to=10000&granularity=1h').data)
+            assert data['granularity'] == 3600
+            assert data['buckets'] == [{'start': 3600, 'end': 7200, 'fetches': 2, 'favorites': 0}]
+            
+            assert client.get('/api/stats/history?granularity=fast').status_code == 400
+            assert client.get('/api/stats/history?from=10&to=5').status_code == 400
+            assert client.get('/api/stats/history?from=0&to=1e9').status_code == 400
+    
+    def test_recovered_favorites_weight_draws(self, tmp_path):
+        """Test favorites persisted before a restart weight the first snapshot"""
+        from app.main import create_app
+        settings = {'FAVORITES_DIR': str(tmp_path / 'favorites'), 'DEFER_WORKER_START': '1'}
+        first = create_app(settings)
+        first.test_client().post('/api/favorite', json={'quote_id': 3})
+        first.extensions['quote_generator'].favorites_store.flush()
+        
+        restarted = create_app(settings).extensions['quote_generator']
+        
+        assert restarted.quote_manager._snapshot.samplers['favorites']._categories.total() == 21
+    
+    def test_shared_favorites_weight_other_workers(self, tmp_path):
+        """Test weighted=favorites draws pick up favorites added through another worker"""
+        from app.main import create_app
+        settings = {'STATS_BACKEND': 'shared', 'STATS_SEGMENT_PATH': str(tmp_path / 'stats'),
+                    'FAVORITES_DIR': str(tmp_path / 'favorites'), 'DEFER_WORKER_START': '1'}
+        first, second = create_app(settings), create_app(settings)
+        sampler = second.extensions['quote_generator'].quote_manager._snapshot.samplers['favorites']
+        
+        first.test_client().post('/api/favorite', json={'quote_id': 3})
+        assert sampler._categories.total() == 20
+        second.test_client().get('/api/quote?weighted=favorites')
+        
+        assert sampler._categories.total() == 21
+    
+    def test_shared_backend_requires_favorites_dir(self, tmp_path):
+        """Test the shared backend refuses to start without a durable favorites log"""
+        from app.main import create_app
+        with pytest.raises(ValueError, match='FAVORITES_DIR'):
+            create_app({'STATS_BACKEND': 'shared', 'STATS_SEGMENT_PATH': str(tmp_path / 'stats'),
+                        'DEFER_WORKER_START': '1'})
+    
+    def test_profile_spans(self):
+        """Test PROFILE_SPANS times quote lookups, stats, events and JSON encoding"""
+        from app.main import create_app
+        timed_app = create_app({'PROFILE_SPANS': 'true', 'ADMIN_TOKEN': 'secret'})
+        
+        with timed_app.test_client() as client:
+            client.get('/api/quote')
+            client.get('/api/stats')
+            status = json.loads(client.get('/admin/profile',
+                                           headers={'Authorization': 'Bearer secret'}).data)
+        
+        spans = status['spans']
+        assert spans['quote_manager.get_random_entry']['calls'] == 1
+        assert spans['stats_tracker.record_quote_fetch']['calls'] == 1
+        assert spans['log_event']['calls'] >= 2
+        assert spans['json.dumps']['calls'] >= 1
+    
+    def test_import_builds_nothing(self):
+        """Test importing the module neither builds the app nor loads opencensus"""
+        import subprocess
+        import sys
+        code = ("import sys, app.main; "
+                "assert 'app' not in vars(app.main); "
+                "assert not any(m.startswith('opencensus') for m in sys.modules)")
+        
+        subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,64 @@
+import gzip
+import pytest
+from app.assets import IMMUTABLE, AssetBundle
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    """Create a bundle from a small static folder"""
+    (tmp_path / 'index.html').write_text(
+        '<link href="/static/app.css"><script src="/static/js/app.js"></script>'
+        '<a href="/static/missing.png">'
+    )
+    (tmp_path / 'app.css').write_text('body { color: red; }\n' * 20)
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_text('console.log(1);')
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG' + bytes(100))
+    return AssetBundle(str(tmp_path))
+
+
+class TestAssetBundle:
+    """Tests for the in-memory static asset pipeline"""
+    
+    def test_fingerprinted_urls(self, bundle):
+        """Test assets get content-hashed names that caches may keep forever"""
+        url = bundle.url('app.css')
+        name = url.removeprefix('/static/')
+        
+        assert name.startswith('app.') and name.endswith('.css')
+        assert bundle.get(name).body == bundle.get('app.css').body
+        assert bundle.get(name).cache_control == IMMUTABLE
+        assert bundle.get('app.css').cache_control == 'no-cache'
+        assert bundle.url('js/app.js').startswith('/static/js/app.')
+    
+    def test_pages_are_rewritten(self, bundle):
+        """Test HTML references point at fingerprinted URLs; unknown ones are kept"""
+        page = bundle.get('index.html').body.decode()
+        
+        assert f'href="{bundle.url("app.css")}"' in page
+        assert f'src="{bundle.url("js/app.js")}"' in page
+        assert 'href="/static/missing.png"' in page
+        assert bundle.get('index.html').cache_control == 'no-cache'
+    
+    def test_gzip_variants(self, bundle):
+        """Test text assets are precompressed and binary ones are not"""
+        css = bundle.get('app.css')
+        body, etag, encoding = css.variant(accepts_gzip=True)
+        
+        assert encoding == 'gzip'
+        assert gzip.decompress(body) == css.body
+        assert etag != css.variant(accepts_gzip=False)[1]
+        assert bundle.get('logo.png').variant(accepts_gzip=True)[2] is None
+    
+    def test_content_change_changes_url(self, tmp_path, bundle):
+        """Test editing a file yields a new fingerprint on the next load"""
+        (tmp_path / 'app.css').write_text('body { color: blue; }')
+        
+        assert AssetBundle(str(tmp_path)).url('app.css') != bundle.url('app.css')
+    
+    def test_missing_folder(self, tmp_path):
+        """Test a missing folder gives an empty bundle"""
+        bundle = AssetBundle(str(tmp_path / 'nope'))
+        
+        assert bundle.get('index.html') is None
+        assert bundle.nbytes() == 0
@@ -0,0 +1,48 @@
+from benchmarks.baseline import compare_load, compare_micro
+from benchmarks.load import percentile, run_closed_loop
+from benchmarks.micro import run_micro
+from benchmarks.server import in_process_server
+
+
+class TestBenchmarkSuite:
+    """Tests for the load-testing and baseline helpers"""
+    
+    def test_percentile_nearest_rank(self):
+        """Test percentiles use the nearest-rank method"""
+        values = list(range(1, 101))
+        
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) == 0.0
+    
+    def test_compare_micro_flags_slowdowns(self):
+        """Test microbenchmarks slower than the tolerance are regressions"""
+        baseline = {'QuoteManager.get_quote_by_id': 100.0}
+        
+        assert compare_micro({'QuoteManager.get_quote_by_id': 120.0}, baseline, 0.3) == []
+        assert len(compare_micro({'QuoteManager.get_quote_by_id': 140.0}, baseline, 0.3)) == 1
+    
+    def test_micro_reports_costs_relative_to_reference(self):
+        """Test microbenchmarks are ratios to the reference loop, not nanoseconds"""
+        results = run_micro(number=20, repeat=1)
+        
+        assert 'QuoteManager.get_quote_by_id' in results
+        assert all(0 < cost < 1000 for cost in results.values())
+    
+    def test_compare_load_flags_throughput_and_p99(self):
+        """Test lower throughput or higher p99 are regressions"""
+        baseline = {'quote': {'throughput': 100.0, 'p99_ms': 10.0}}
+        current = {'quote': {'throughput': 50.0, 'p99_ms': 20.0}}
+        
+        assert len(compare_load(current, baseline, 0.3)) == 2
+    
+    def test_closed_loop_against_in_process_server(self):
+        """Test a short closed-loop run reports every endpoint"""
+        with in_process_server() as base_url:
+            result = run_closed_loop(base_url, concurrency=2, duration=0.5)
+        
+        summary = result.summary()
+        
+        assert set(summary) == {'quote', 'quote_by_category', 'stats', 'favorite'}
+        assert all(row['errors'] == 0 for row in summary.values())
+        assert summary['quote']['requests'] > 0
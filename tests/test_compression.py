@@ -0,0 +1,110 @@
+import gzip
+import zlib
+from app.compression import CompressionMiddleware, choose_encoding
+
+
+def wsgi_app(body_chunks, headers):
+    """Build a WSGI app returning fixed chunks and headers"""
+    def app(environ, start_response):
+        start_response('200 OK', list(headers))
+        return iter(body_chunks)
+    return app
+
+
+def call(app, accept_encoding='gzip'):
+    """Run a WSGI app; returns (headers dict, body, chunks)"""
+    captured = {}
+    
+    def start_response(status, headers, exc_info=None):
+        captured.update(headers)
+    
+    chunks = list(app({'HTTP_ACCEPT_ENCODING': accept_encoding, 'REQUEST_METHOD': 'GET'},
+                      start_response))
+    return captured, b''.join(chunks), chunks
+
+
+class TestChooseEncoding:
+    """Tests for Accept-Encoding negotiation"""
+    
+    def test_preferences(self):
+        """Test gzip is preferred, deflate is a fallback and q=0 refuses"""
+        assert choose_encoding('gzip, deflate, br') == 'gzip'
+        assert choose_encoding('deflate') == 'deflate'
+        assert choose_encoding('gzip;q=0, deflate;q=0.5') == 'deflate'
+        assert choose_encoding('*') == 'gzip'
+        assert choose_encoding('br') is None
+        assert choose_encoding('') is None
+
+
+class TestCompressionMiddleware:
+    """Tests for response compression"""
+    
+    JSON = [('Content-Type', 'application/json'), ('Content-Length', '2000'),
+            ('ETag', '"abc"')]
+    
+    def test_large_json_is_gzipped(self):
+        """Test large JSON is compressed with length dropped and ETag weakened"""
+        body = b'{"quotes": [' + b'"x",' * 500 + b'"x"]}'
+        middleware = CompressionMiddleware(wsgi_app([body], self.JSON))
+        
+        headers, compressed, _ = call(middleware)
+        
+        assert headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in headers
+        assert headers['ETag'] == 'W/"abc"'
+        assert headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(compressed) == body
+        counters = middleware.get_counters()
+        assert counters['bytes_in'] == len(body)
+        assert counters['ratio'] > 10
+    
+    def test_deflate(self):
+        """Test deflate uses the zlib format"""
+        body = b'a' * 5000
+        middleware = CompressionMiddleware(wsgi_app([body], self.JSON))
+        
+        headers, compressed, _ = call(middleware, 'deflate')
+        
+        assert headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(compressed) == body
+    
+    def test_skipped_responses(self):
+        """Test small, encoded, binary and no-transform responses pass through"""
+        cases = [
+            [('Content-Type', 'application/json'), ('Content-Length', '10')],
+            [('Content-Type', 'text/css'), ('Content-Encoding', 'gzip')],
+            [('Content-Type', 'image/png')],
+            [('Content-Type', 'text/plain'), ('Cache-Control', 'no-transform')]
+        ]
+        for headers in cases:
+            middleware = CompressionMiddleware(wsgi_app([b'x' * 4000], headers))
+            response_headers, body, _ = call(middleware)
+            assert body == b'x' * 4000
+            assert middleware.get_counters()['skipped'] == 1
+        
+        middleware = CompressionMiddleware(wsgi_app([b'x' * 4000], self.JSON))
+        assert call(middleware, 'br')[1] == b'x' * 4000
+    
+    def test_streams_are_compressed_incrementally(self):
+        """Test a stream without Content-Length is compressed as it is consumed"""
+        consumed = []
+        
+        def lines():
+            for i in range(2000):
+                consumed.append(i)
+                yield b'{"id": %d, "text": "some quote text"}\n' % i
+        
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+            return lines()
+        
+        middleware = CompressionMiddleware(app)
+        captured = {}
+        body = middleware({'HTTP_ACCEPT_ENCODING': 'gzip'},
+                          lambda status, headers, exc_info=None: captured.update(headers))
+        first = next(iter(body))
+        
+        assert captured['Content-Encoding'] == 'gzip'
+        assert first and len(consumed) < 2000
+        rest = b''.join(body)
+        assert gzip.decompress(first + rest).count(b'\n') == 2000
@@ -0,0 +1,267 @@
+import os
+import threading
+import time
+import pytest
+from app.favorites_store import FavoritesLog, SharedFavorites
+from app.favorites import ClientFavorites, QuoteBitmap, ARRAY_LIMIT
+from app.stats import StatsTracker
+
+
+@pytest.fixture
+def directory(tmp_path):
+    """Data directory for the favorites log"""
+    return str(tmp_path / 'favorites')
+
+
+class TestFavoritesLog:
+    """Tests for the write-behind favorites log"""
+    
+    def test_recover_after_restart(self, directory):
+        """Test favorites written by one instance are recovered by the next"""
+        store = FavoritesLog(directory)
+        store.append_add(3)
+        store.append_add(7)
+        store.flush()
+        
+        assert FavoritesLog(directory).recover() == {'': {3, 7}}
+    
+    def test_group_commit(self, directory):
+        """Test queued records are written with a single commit"""
+        store = FavoritesLog(directory, commit_interval=60)
+        for quote_id in range(1, 51):
+            store.append_add(quote_id)
+        
+        store.flush()
+        
+        counters = store.get_counters()
+        assert counters['commits'] == 1
+        assert counters['committed'] == 50
+        assert counters['pending'] == 0
+    
+    def test_background_writer_commits(self, directory):
+        """Test the writer thread commits without an explicit flush"""
+        store = FavoritesLog(directory, commit_interval=0.01)
+        store.append_add(5)
+        
+        for _ in range(200):
+            if store.get_counters()['committed']:
+                break
+            time.sleep(0.01)
+        
+        assert FavoritesLog(directory).recover() == {'': {5}}
+    
+    def test_concurrent_first_appends_start_one_writer(self, directory):
+        """Test racing first appends start a single writer thread"""
+        store = FavoritesLog(directory, commit_interval=60)
+        write_lock = store._write_lock
+        barrier = threading.Barrier(8)
+        
+        def writers():
+            return sum(1 for thread in threading.enumerate() if thread.name == 'favorites-writer')
+        
+        def append(quote_id):
+            barrier.wait()
+            store.append_add(quote_id)
+        
+        before = writers()
+        threads = [threading.Thread(target=append, args=(i,)) for i in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert writers() == before + 1
+        assert store._write_lock is write_lock
+        store.flush()
+        assert FavoritesLog(directory).recover() == {'': set(range(1, 9))}
+    
+    def test_compaction_folds_log_into_snapshot(self, directory):
+        """Test compaction writes a snapshot and truncates the log"""
+        store = FavoritesLog(directory, compact_threshold=3)
+        for quote_id in (1, 2, 3):
+            store.append_add(quote_id)
+        store.flush()
+        store.append_add(4)
+        store.flush()
+        
+        assert store.get_counters()['compactions'] == 1
+        assert os.path.getsize(store.log_path) == len('+4\n')
+        assert FavoritesLog(directory).recover() == {'': {1, 2, 3, 4}}
+    
+    def test_client_records(self, directory):
+        """Test favorites are recovered per client, including from a snapshot"""
+        store = FavoritesLog(directory, compact_threshold=3)
+        store.append_add(1, 'alice')
+        store.append_add(2, 'alice')
+        store.append_add(2, 'bob')
+        store.flush()
+        store.append_add(3)
+        store.flush()
+        
+        assert FavoritesLog(directory).recover() == {'alice': {1, 2}, 'bob': {2}, '': {3}}
+    
+    def test_clear_record(self, directory):
+        """Test a clear record empties the recovered set"""
+        store = FavoritesLog(directory)
+        store.append_add(1)
+        store.append_clear()
+        store.append_add(2)
+        store.flush()
+        
+        assert FavoritesLog(directory).recover() == {'': {2}}
+    
+    def test_torn_tail_is_discarded(self, directory):
+        """Test a partially written last record is dropped on recovery"""
+        store = FavoritesLog(directory)
+        store.append_add(1)
+        store.flush()
+        with open(store.log_path, 'a') as f:
+            f.write('+12')
+        
+        recovered = FavoritesLog(directory)
+        assert recovered.recover() == {'': {1}}
+        recovered.append_add(2)
+        recovered.flush()
+        assert FavoritesLog(directory).recover() == {'': {1, 2}}
+
+
+class TestSharedFavorites:
+    """Tests for favorites kept in step through a shared log"""
+    
+    def test_workers_see_each_others_adds(self, directory):
+        """Test adds through one log are visible through another without a flush"""
+        first = SharedFavorites(FavoritesLog(directory, commit_interval=60))
+        second = SharedFavorites(FavoritesLog(directory, commit_interval=60))
+        
+        assert first.add('alice', 3) is True
+        assert second.add('alice', 3) is False
+        second.add('bob', 3)
+        
+        with first.current() as favorites:
+            assert favorites.get('alice') == [3]
+            assert favorites.count(3) == 2
+    
+    def test_compaction_and_clear_are_followed(self, directory):
+        """Test followers rebuild after a compaction and apply clears"""
+        log = FavoritesLog(directory, commit_interval=60)
+        writer = SharedFavorites(log)
+        follower = SharedFavorites(FavoritesLog(directory, commit_interval=60))
+        writer.add('alice', 1)
+        log.compact()
+        writer.add('alice', 2)
+        
+        with follower.current() as favorites:
+            assert favorites.get('alice') == [1, 2]
+        assert follower.rebuilds == 1
+        
+        writer.clear()
+        writer.add('bob', 5)
+        with follower.current() as favorites:
+            assert favorites.get('alice') == []
+            assert favorites.get('bob') == [5]
+    
+    def test_changes_from_every_worker(self, directory):
+        """Test take_changes reports counts changed through any log, once"""
+        first = SharedFavorites(FavoritesLog(directory, commit_interval=60))
+        second = SharedFavorites(FavoritesLog(directory, commit_interval=60))
+        first.add('alice', 3)
+        second.add('bob', 3)
+        second.add('bob', 7)
+        
+        assert first.take_changes() == {3: 2, 7: 1}
+        assert first.take_changes() == {}
+        
+        second.clear()
+        assert first.take_changes() == {3: 0, 7: 0}
+    
+    def test_writes_are_durable_after_flush(self, directory):
+        """Test written-through records are fsynced by the next commit"""
+        log = FavoritesLog(directory, commit_interval=60)
+        SharedFavorites(log).add('alice', 4)
+        log.flush()
+        
+        assert log.get_counters()['committed'] == 1
+        assert FavoritesLog(directory).recover() == {'alice': {4}}
+
+
+class TestQuoteBitmap:
+    """Tests for the compressed quote id set"""
+    
+    def test_add_and_contains(self):
+        """Test membership across chunks and duplicate adds"""
+        bitmap = QuoteBitmap([5, 70000, 3])
+        
+        assert bitmap.add(5) is False
+        assert bitmap.add(65536) is True
+        assert 70000 in bitmap
+        assert 6 not in bitmap
+        assert list(bitmap) == [3, 5, 65536, 70000]
+        assert len(bitmap) == 4
+    
+    def test_dense_chunk_becomes_bitmap(self):
+        """Test a chunk switches to a fixed-size bitmap once it is dense"""
+        bitmap = QuoteBitmap(range(0, 2 * (ARRAY_LIMIT + 10), 2))
+        
+        assert bitmap.nbytes() == 8192
+        assert len(bitmap) == ARRAY_LIMIT + 10
+        assert 2 * ARRAY_LIMIT in bitmap
+        assert 2 * ARRAY_LIMIT + 1 not in bitmap
+        assert list(bitmap)[:3] == [0, 2, 4]
+    
+    def test_sparse_chunk_is_compact(self):
+        """Test a few ids cost two bytes each"""
+        assert QuoteBitmap([1, 9, 20]).nbytes() == 6
+
+
+class TestClientFavorites:
+    """Tests for per-client favorites and their aggregates"""
+    
+    def test_counts_and_top(self):
+        """Test per-quote client counts and top-K ordering"""
+        favorites = ClientFavorites()
+        for client_id, quote_id in [('a', 1), ('a', 2), ('b', 2), ('c', 2), ('c', 3), ('b', 3)]:
+            favorites.add(client_id, quote_id)
+        
+        assert favorites.add('a', 1) is False
+        assert favorites.count(2) == 3
+        assert favorites.count(9) == 0
+        assert favorites.get('c') == [2, 3]
+        assert favorites.get('nobody') == []
+        assert favorites.top(2) == [(2, 3), (3, 2)]
+        assert favorites.client_count() == 3
+
+
+class TestStatsTrackerPersistence:
+    """Tests for StatsTracker with a durable favorites store"""
+    
+    def test_favorites_survive_restart(self, directory):
+        """Test a new tracker starts with the persisted favorites"""
+        tracker = StatsTracker(favorites_store=FavoritesLog(directory))
+        tracker.add_favorite(4)
+        tracker.add_favorite(9)
+        tracker.favorites_store.flush()
+        
+        restarted = StatsTracker(favorites_store=FavoritesLog(directory))
+        
+        assert restarted.get_favorites() == [4, 9]
+    
+    def test_reset_is_persisted(self, directory):
+        """Test reset_stats clears the persisted favorites"""
+        tracker = StatsTracker(favorites_store=FavoritesLog(directory))
+        tracker.add_favorite(4)
+        tracker.reset_stats()
+        tracker.favorites_store.flush()
+        
+        assert StatsTracker(favorites_store=FavoritesLog(directory)).get_favorites() == []
+    
+    def test_client_favorites_survive_restart(self, directory):
+        """Test per-client favorites and counts are rebuilt on restart"""
+        tracker = StatsTracker(favorites_store=FavoritesLog(directory))
+        tracker.add_favorite(4, 'alice')
+        tracker.add_favorite(4, 'bob')
+        tracker.favorites_store.flush()
+        
+        restarted = StatsTracker(favorites_store=FavoritesLog(directory))
+        
+        assert restarted.get_favorites('alice') == [4]
+        assert restarted.favorite_count(4) == 2
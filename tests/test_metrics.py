@@ -0,0 +1,103 @@
+import threading
+from app.metrics import UPPER_BOUNDS, LatencyHistogram, RequestMetrics
+
+
+class FakeClock:
+    """Clock that returns queued timestamps"""
+    
+    def __init__(self, *times):
+        self.times = list(times)
+    
+    def __call__(self):
+        return self.times.pop(0)
+
+
+class TestLatencyHistogram:
+    """Tests for the log-linear latency histogram"""
+    
+    def test_bucket_bounds_contain_value(self):
+        """Test every duration lands in a bucket whose bounds contain it"""
+        for seconds in (0.0001, 0.0013, 0.02, 0.5, 3.3, 50.0):
+            index = LatencyHistogram.bucket_index(seconds)
+            assert UPPER_BOUNDS[index - 1] <= seconds < UPPER_BOUNDS[index]
+    
+    def test_out_of_range_values(self):
+        """Test tiny and huge durations go to the edge buckets"""
+        assert LatencyHistogram.bucket_index(0) == 0
+        assert LatencyHistogram.bucket_index(1e-9) == 0
+        assert LatencyHistogram.bucket_index(1000) == len(UPPER_BOUNDS) - 1
+    
+    def test_quantiles_within_a_quarter_octave(self):
+        """Test quantile estimates stay close to the true values"""
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        
+        for q, actual in ((0.5, 0.5), (0.9, 0.9), (0.99, 0.99)):
+            estimate = histogram.quantile(q)
+            assert actual <= estimate <= actual * 1.25
+        assert histogram.count == 1000
+    
+    def test_cumulative_buckets_end_with_inf(self):
+        """Test exported buckets are cumulative and end at +Inf"""
+        histogram = LatencyHistogram()
+        histogram.record(0.01)
+        histogram.record(100)
+        
+        buckets = histogram.cumulative_buckets()
+        counts = [count for _, count in buckets]
+        
+        assert counts == sorted(counts)
+        assert buckets[-1] == (float('inf'), 2)
+
+
+class TestRequestMetrics:
+    """Tests for per-route request instrumentation"""
+    
+    def test_in_flight_and_latency(self):
+        """Test start/finish track in-flight requests and latency"""
+        metrics = RequestMetrics(clock=FakeClock(10.0, 10.003))
+        
+        started = metrics.start('/api/quote')
+        assert metrics.in_flight['/api/quote'] == 1
+        metrics.finish('/api/quote', 'GET', 200, started)
+        
+        assert metrics.in_flight['/api/quote'] == 0
+        assert 0.003 <= metrics.quantiles('/api/quote')['p99'] <= 0.004
+    
+    def test_render_prometheus_text(self):
+        """Test the exposition includes histograms, quantiles and extras"""
+        metrics = RequestMetrics(clock=FakeClock(0.0, 0.002))
+        metrics.finish('/api/quote', 'GET', 200, metrics.start('/api/quote'))
+        
+        text = metrics.render({'quotes_fetched_total': ('counter', 'Quotes served.', 7)})
+        
+        assert '# TYPE http_request_duration_seconds histogram' in text
+        assert 'http_request_duration_seconds_count{route="/api/quote",method="GET",status="200"} 1' in text
+        assert 'quantile="0.99"' in text
+        assert 'quotes_fetched_total 7' in text
+    
+    def test_unknown_methods_share_one_series(self):
+        """Test non-standard methods are labelled 'other'"""
+        metrics = RequestMetrics(clock=FakeClock(0.0, 0.001, 0.0, 0.001))
+        metrics.finish('/api/quote', 'FOO', 405, metrics.start('/api/quote'))
+        metrics.finish('/api/quote', 'BAR"', 405, metrics.start('/api/quote'))
+        
+        assert list(metrics.histograms) == [('/api/quote', 'other', 405)]
+    
+    def test_concurrent_requests_keep_gauges_exact(self):
+        """Test in-flight gauges and counts stay exact under concurrent requests"""
+        metrics = RequestMetrics()
+        
+        def serve():
+            for _ in range(2000):
+                metrics.finish('/api/quote', 'GET', 200, metrics.start('/api/quote'))
+        
+        threads = [threading.Thread(target=serve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert metrics.in_flight['/api/quote'] == 0
+        assert metrics.histograms[('/api/quote', 'GET', 200)].count == 16000
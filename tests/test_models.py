@@ -0,0 +1,432 @@
+import json
+import os
+import threading
+import pytest
+from app.corpus import MappedCorpus, write_corpus
+from app.models import DEFAULT_QUOTES, QuoteManager
+from app.quote_table import QuoteTable
+from app.reload import CorpusReloader
+from app.shuffle import SharedShuffleBags, ShuffleBags, permute, shuffle_key
+
+
+@pytest.fixture
+def manager():
+    """Create a fresh QuoteManager"""
+    return QuoteManager()
+
+
+class TestQuoteManager:
+    """Tests for QuoteManager lookups"""
+    
+    def test_get_quote_by_id(self, manager):
+        """Test lookup by id returns the matching quote"""
+        quote = manager.get_quote_by_id(8)
+        
+        assert quote['id'] == 8
+        assert quote['author'] == 'Socrates'
+    
+    def test_get_quote_by_unknown_id(self, manager):
+        """Test lookup by unknown id returns None"""
+        assert manager.get_quote_by_id(999) is None
+    
+    def test_get_quote_by_category_is_case_insensitive(self, manager):
+        """Test category lookup ignores case"""
+        for _ in range(10):
+            quote = manager.get_quote_by_category('WiSdOm')
+            assert quote['category'] == 'wisdom'
+    
+    def test_get_quote_by_unknown_category(self, manager):
+        """Test unknown category returns None"""
+        assert manager.get_quote_by_category('nonexistent') is None
+    
+    def test_get_categories_sorted(self, manager):
+        """Test categories are unique and sorted"""
+        assert manager.get_categories() == ['humor', 'motivational', 'wisdom']
+    
+    def test_get_quotes_by_author_substring(self, manager):
+        """Test author search matches substrings in corpus order"""
+        quotes = manager.get_quotes_by_author('roosevelt')
+        expected = [q for q in manager.quotes if 'roosevelt' in q['author'].lower()]
+        
+        assert quotes == expected
+        assert [q['id'] for q in quotes] == [3, 5, 13]
+    
+    def test_random_entry_body_and_etag(self, manager):
+        """Test entries carry the encoded quote and a stable ETag"""
+        entry = manager.get_random_entry('humor')
+        again = manager.get_quote_by_id(entry.quote['id'])
+        
+        assert json.loads(entry.body) == again
+        assert len(entry.etag) == 16
+        assert manager.get_random_entry('nonexistent') is None
+    
+    def test_load_corpus_rebuilds_responses(self, manager, tmp_path):
+        """Test reloading the corpus replaces the cached bodies"""
+        path = tmp_path / 'quotes.jsonl'
+        path.write_text('{"id": 1, "text": "a", "author": "b", "category": "fresh"}\n')
+        _, old_etag = manager.get_categories_response()
+        
+        manager.load_corpus(str(path))
+        body, etag = manager.get_categories_response()
+        
+        assert manager.generation == 2
+        assert json.loads(body) == {'categories': ['fresh']}
+        assert etag != old_etag
+    
+    def test_sample_entries_without_replacement(self, manager):
+        """Test unique sampling never repeats a quote"""
+        entries = manager.sample_entries(20)
+        
+        assert sorted(e.quote['id'] for e in entries) == list(range(1, 21))
+        assert manager.sample_entries(3, 'nonexistent') is None
+    
+    def test_iter_bodies(self, manager):
+        """Test the export generator yields one JSON line per quote"""
+        lines = list(manager.iter_bodies('motivational'))
+        
+        assert len(lines) == 7
+        assert all(line.endswith(b'\n') for line in lines)
+        assert json.loads(lines[0])['id'] == 1
+    
+    def test_get_quotes_by_unknown_author(self, manager):
+        """Test unknown author returns an empty list"""
+        assert manager.get_quotes_by_author('Nobody') == []
+
+
+class TestShuffleBags:
+    """Tests for per-client no-repeat shuffles"""
+    
+    def test_permute_is_a_bijection(self):
+        """Test every seeded permutation covers its range exactly once"""
+        for size in (1, 2, 3, 7, 16, 100, 1000):
+            for seed in (0, 1, 0xDEADBEEF):
+                assert sorted(permute(i, size, seed) for i in range(size)) == list(range(size))
+    
+    def test_seeds_shuffle_differently(self):
+        """Test different seeds give different orders"""
+        orders = {tuple(permute(i, 20, seed) for i in range(20)) for seed in range(10)}
+        
+        assert len(orders) == 10
+    
+    def test_each_pass_covers_pool_without_back_to_back_repeats(self):
+        """Test a client sees every index once per pass and never the same twice in a row"""
+        bags = ShuffleBags()
+        draws = [bags.next_index('a', None, 5) for _ in range(50)]
+        
+        for start in range(0, 50, 5):
+            assert sorted(draws[start:start + 5]) == [0, 1, 2, 3, 4]
+        assert all(first != second for first, second in zip(draws, draws[1:]))
+        assert bags.get_counters()['passes'] == 9
+    
+    def test_clients_and_pools_are_independent(self):
+        """Test each client and pool keeps its own cursor"""
+        bags = ShuffleBags()
+        first = [bags.next_index('a', 'humor', 6) for _ in range(3)]
+        other = [bags.next_index('b', 'humor', 6) for _ in range(3)]
+        fresh = ShuffleBags()
+        
+        assert [fresh.next_index('b', 'humor', 6) for _ in range(3)] == other
+        assert sorted(first + [bags.next_index('a', 'humor', 6) for _ in range(3)]) == list(range(6))
+        assert bags.get_counters()['bags'] == 2
+    
+    def test_no_back_to_back_repeats_in_small_pools(self):
+        """Test pass boundaries never repeat the last draw, even for two or three quotes"""
+        bags = ShuffleBags()
+        for size in (2, 3):
+            for client in range(20):
+                draws = [bags.next_index(client, None, size) for _ in range(10 * size)]
+                assert all(first != second for first, second in zip(draws, draws[1:]))
+    
+    def test_pool_change_restarts_pass(self):
+        """Test a reloaded corpus (new generation or size) starts a new pass"""
+        bags = ShuffleBags()
+        bags.next_index('a', None, 5, generation=1)
+        
+        assert bags.next_index('a', None, 3, generation=2) < 3
+        assert bags._states[('a', None)][3] == 1
+    
+    def test_bounded_and_idle_eviction(self):
+        """Test least recently used and idle clients are evicted"""
+        now = [0.0]
+        bags = ShuffleBags(max_clients=2, idle_seconds=60, clock=lambda: now[0])
+        bags.next_index('a', None, 5)
+        bags.next_index('b', None, 5)
+        bags.next_index('a', None, 5)
+        bags.next_index('c', None, 5)
+        
+        assert {client for client, _ in bags._states} == {'a', 'c'}
+        now[0] = 30
+        bags.next_index('c', None, 5)
+        now[0] = 70
+        bags.next_index('d', None, 5)
+        
+        assert {client for client, _ in bags._states} == {'c', 'd'}
+        now[0] = 200
+        bags.next_index('e', None, 5)
+        assert {client for client, _ in bags._states} == {'e'}
+        assert bags.get_counters()['evicted'] == 4
+    
+    def test_shared_bags_follow_the_client_across_workers(self, tmp_path):
+        """Test a client alternating between workers walks one shuffle"""
+        path = str(tmp_path / 'shuffle')
+        workers = [SharedShuffleBags(path), SharedShuffleBags(path)]
+        draws = [workers[draw % 2].next_index('a', None, 5) for draw in range(20)]
+        
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if SharedShuffleBags(path).next_index('a', None, 5) in range(5) else 1)
+        assert os.waitpid(pid, 0)[1] == 0
+        
+        for start in range(0, 20, 5):
+            assert sorted(draws[start:start + 5]) == [0, 1, 2, 3, 4]
+        assert all(first != second for first, second in zip(draws, draws[1:]))
+        assert workers[0].get_counters()['bags'] == 1
+    
+    def test_shared_bags_replace_least_recently_used(self, tmp_path):
+        """Test a full set of slots gives up its least recently used state"""
+        now = [1000]
+        bags = SharedShuffleBags(str(tmp_path / 'shuffle'), max_clients=4, idle_seconds=60,
+                                 clock=lambda: now[0])
+        for client in 'abcd':
+            bags.next_index(client, None, 5)
+            now[0] += 1
+        bags.next_index('a', None, 5)
+        bags.next_index('e', None, 5)
+        
+        assert bags.get_counters() == {'bags': 4, 'passes': 0, 'evicted': 1}
+        assert bags._find(shuffle_key('b', None), now[0])[1] is None
+        assert bags._find(shuffle_key('a', None), now[0])[1][3] == 2
+        now[0] += 100
+        assert bags.get_counters()['bags'] == 0
+    
+    def test_quote_manager_shuffled_entries(self, manager):
+        """Test shuffled draws from a category return each of its quotes once per pass"""
+        bags = ShuffleBags()
+        humor = [quote for quote in manager.quotes if quote['category'] == 'humor']
+        
+        drawn = [manager.get_shuffled_entry(bags, 'a', 'Humor').quote['id']
+                 for _ in range(len(humor))]
+        
+        assert sorted(drawn) == sorted(quote['id'] for quote in humor)
+        assert manager.get_shuffled_entry(bags, 'a', 'nope') is None
+
+
+class TestMappedCorpus:
+    """Tests for loading quotes from a JSONL corpus file"""
+    
+    def test_manager_loads_corpus_file(self, tmp_path):
+        """Test QuoteManager serves quotes from a corpus file"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(path, DEFAULT_QUOTES)
+        
+        manager = QuoteManager(str(path))
+        
+        assert isinstance(manager.quotes, MappedCorpus)
+        assert len(manager.quotes) == len(DEFAULT_QUOTES)
+        assert manager.get_quote_by_id(12) == DEFAULT_QUOTES[11]
+        assert manager.get_categories() == ['humor', 'motivational', 'wisdom']
+        assert manager.get_quote_by_category('humor')['category'] == 'humor'
+        entry = manager.get_random_entry('wisdom')
+        assert json.loads(entry.body) == entry.quote
+        manager.quotes.close()
+    
+    def test_corpus_skips_blank_lines(self, tmp_path):
+        """Test blank lines in the corpus are ignored"""
+        path = tmp_path / 'quotes.jsonl'
+        path.write_text(
+            '{"id": 1, "text": "a", "author": "b", "category": "c"}\n'
+            '\n'
+            '{"id": 2, "text": "d", "author": "e", "category": "c"}'
+        )
+        
+        corpus = MappedCorpus(str(path))
+        
+        assert len(corpus) == 2
+        assert corpus[1]['id'] == 2
+        corpus.close()
+    
+    def test_empty_corpus(self, tmp_path):
+        """Test an empty corpus file loads with no quotes"""
+        path = tmp_path / 'quotes.jsonl'
+        path.write_text('')
+        
+        corpus = MappedCorpus(str(path))
+        
+        assert len(corpus) == 0
+        corpus.close()
+    
+    def test_invalid_record_rejected(self, tmp_path):
+        """Test records missing fields fail at load time"""
+        path = tmp_path / 'quotes.jsonl'
+        path.write_text('{"id": 1, "text": "a"}\n')
+        
+        with pytest.raises(ValueError, match='missing fields'):
+            MappedCorpus(str(path))
+
+
+
+class TestQuoteTable:
+    """Tests for the columnar quote table"""
+    
+    def test_rows_round_trip(self):
+        """Test every row reads back exactly as given"""
+        table = QuoteTable(DEFAULT_QUOTES)
+        
+        assert len(table) == len(DEFAULT_QUOTES)
+        assert list(table) == DEFAULT_QUOTES
+        assert table[-1] == DEFAULT_QUOTES[-1]
+    
+    def test_strings_are_interned(self):
+        """Test repeated authors and categories are stored once"""
+        table = QuoteTable(DEFAULT_QUOTES)
+        
+        assert table.categories == ['motivational', 'wisdom', 'humor']
+        assert table.authors.count('Anonymous') == 1
+        assert table[15]['author'] is table[16]['author']
+    
+    def test_extra_fields_and_unicode(self):
+        """Test non-column fields and non-ASCII text survive"""
+        quotes = [{"id": 7, "text": "Ça va — très bien", "author": "A", "category": "c", "year": 1900},
+                  {"id": 8, "text": "", "author": "A", "category": "c"}]
+        
+        assert list(QuoteTable(quotes)) == quotes
+    
+    def test_smaller_than_dicts(self):
+        """Test the table holds a large corpus in far less memory than dicts"""
+        import tracemalloc
+        
+        def build(factory):
+            tracemalloc.start()
+            value = factory()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            return value, size
+        
+        rows = lambda: ({"id": i, "text": f"quote number {i} says something",
+                         "author": f"author {i % 100}", "category": f"cat {i % 5}"}
+                        for i in range(20000))
+        _, dict_bytes = build(lambda: list(rows()))
+        table, table_bytes = build(lambda: QuoteTable(rows()))
+        
+        assert table_bytes < dict_bytes / 3
+        assert table[12345]['author'] == 'author 45'
+
+
+class TestCorpusReloader:
+    """Tests for atomic corpus reloads"""
+    
+    def test_reload_publishes_new_snapshot(self, tmp_path):
+        """Test a reload swaps the corpus and reports its generation"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), DEFAULT_QUOTES)
+        manager = QuoteManager(str(path))
+        reloader = CorpusReloader(manager)
+        
+        write_corpus(str(path), [{"id": 99, "text": "new", "author": "x", "category": "fresh"}])
+        
+        assert reloader.reload() is True
+        assert manager.get_categories() == ['fresh']
+        status = reloader.get_status()
+        assert status['generation'] == 2
+        assert status['reloads'] == 1
+        assert status['last_duration_seconds'] >= 0
+    
+    def test_in_flight_reads_keep_old_snapshot(self, tmp_path):
+        """Test a stream started before a reload finishes on the old corpus"""
+        manager = QuoteManager()
+        bodies = manager.iter_bodies()
+        first = next(bodies)
+        
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), [{"id": 99, "text": "new", "author": "x", "category": "fresh"}])
+        manager.load_corpus(str(path))
+        
+        assert len([first, *bodies]) == len(DEFAULT_QUOTES)
+    
+    def test_failed_reload_keeps_current_snapshot(self, tmp_path):
+        """Test an invalid corpus is rejected and the old one keeps serving"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), DEFAULT_QUOTES)
+        manager = QuoteManager(str(path))
+        reloader = CorpusReloader(manager)
+        
+        replacement = tmp_path / 'replacement.jsonl'
+        replacement.write_text('{"id": 1}\n')
+        os.replace(replacement, path)
+        
+        assert reloader.reload() is False
+        assert manager.generation == 1
+        assert 'missing fields' in reloader.get_status()['last_error']
+        assert len(manager.quotes) == len(DEFAULT_QUOTES)
+    
+    def test_mistyped_fields_fail_reload(self, tmp_path):
+        """Test records with non-string fields or non-integer ids are rejected, not raised"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), DEFAULT_QUOTES)
+        manager = QuoteManager(str(path))
+        reloader = CorpusReloader(manager)
+        
+        write_corpus(str(path), [{"id": 1, "text": "a", "author": None, "category": ["c"]}])
+        assert reloader.reload() is False
+        assert 'author, category must be strings' in reloader.get_status()['last_error']
+        
+        write_corpus(str(path), [{"id": [1], "text": "a", "author": "b", "category": "c"}])
+        assert reloader.reload() is False
+        assert 'id must be an integer' in reloader.get_status()['last_error']
+        assert reloader.get_status()['failures'] == 2
+    
+    def test_in_place_rewrite_is_refused(self, tmp_path):
+        """Test a corpus rewritten in place under the live mapping is not reloaded"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), DEFAULT_QUOTES)
+        manager = QuoteManager(str(path))
+        reloader = CorpusReloader(manager)
+        
+        with open(path, 'a') as f:
+            f.write('{"id": 99, "text": "new", "author": "x", "category": "fresh"}\n')
+        
+        assert reloader.reload() is False
+        assert 'modified in place' in reloader.get_status()['last_error']
+        assert manager.generation == 1
+    
+    def test_watcher_survives_failed_check(self, tmp_path):
+        """Test an unexpected error in one check does not stop the watcher"""
+        reloader = CorpusReloader(QuoteManager())
+        checked = threading.Event()
+        calls = []
+        
+        def check_for_changes():
+            calls.append(1)
+            if len(calls) == 1:
+                raise TypeError('boom')
+            checked.set()
+        
+        reloader.check_for_changes = check_for_changes
+        reloader.watch(interval=0.01)
+        
+        assert checked.wait(5)
+        assert reloader.get_status()['failures'] == 1
+        assert reloader.get_status()['last_error'] == 'boom'
+    
+    def test_reload_seeds_popularity(self):
+        """Test a reloaded snapshot starts from the current popularity counts"""
+        manager = QuoteManager()
+        reloader = CorpusReloader(manager, popularity=lambda: {'favorites': {15: 10_000}})
+        
+        reloader.reload()
+        
+        ids = [manager.get_random_entry('humor', 'favorites').quote['id'] for _ in range(50)]
+        assert ids.count(15) > 45
+    
+    def test_watch_reloads_changed_file(self, tmp_path):
+        """Test the file watcher only reloads when the file changes"""
+        path = tmp_path / 'quotes.jsonl'
+        write_corpus(str(path), DEFAULT_QUOTES)
+        manager = QuoteManager(str(path))
+        reloader = CorpusReloader(manager)
+        reloader.watch(interval=3600)
+        
+        assert reloader.check_for_changes() is False
+        write_corpus(str(path), DEFAULT_QUOTES[:3])
+        assert reloader.check_for_changes() is True
+        assert len(manager.quotes) == 3
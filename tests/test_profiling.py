@@ -0,0 +1,125 @@
+import threading
+from app.profiling import RequestProfiler, SpanTimer, StackSampler, TimedProxy
+
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self, now=0.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+
+class TestSpanTimer:
+    """Tests for named span timings"""
+    
+    def test_span_and_wrap(self):
+        """Test spans count calls and accumulate total and max time"""
+        clock = FakeClock()
+        spans = SpanTimer(clock=clock)
+        
+        def slow(seconds):
+            clock.now += seconds
+            return seconds
+        
+        timed = spans.wrap('slow', slow)
+        assert timed(0.5) == 0.5
+        timed(1.5)
+        with spans.span('block'):
+            clock.now += 0.25
+        
+        summary = spans.summary()
+        assert summary['slow'] == {'calls': 2, 'total_seconds': 2.0,
+                                   'mean_seconds': 1.0, 'max_seconds': 1.5}
+        assert list(summary) == ['slow', 'block']
+    
+    def test_proxy_times_public_methods(self):
+        """Test a TimedProxy forwards attributes and times method calls"""
+        class Service:
+            value = 3
+            
+            def double(self, x):
+                return 2 * x
+        
+        spans = SpanTimer()
+        proxy = TimedProxy(Service(), 'service', spans)
+        
+        assert proxy.double(4) == 8
+        assert proxy.value == 3
+        proxy.value = 5
+        assert proxy._target.value == 5
+        assert spans.summary()['service.double']['calls'] == 1
+
+
+class TestStackSampler:
+    """Tests for the collapsed-stack sampler"""
+    
+    def test_sample_collapses_thread_stacks(self):
+        """Test a blocked thread's stack is recorded root first with its name"""
+        release = threading.Event()
+        
+        def waiting_worker():
+            release.wait()
+        
+        thread = threading.Thread(target=waiting_worker, name='worker')
+        thread.start()
+        try:
+            sampler = StackSampler()
+            sampler.sample()
+            sampler.sample()
+        finally:
+            release.set()
+            thread.join()
+        
+        lines = sampler.collapsed().splitlines()
+        worker = [line for line in lines if line.startswith('worker;')]
+        assert len(worker) == 1
+        assert 'waiting_worker (test_profiling.py:' in worker[0]
+        assert worker[0].endswith(' 2')
+        assert sampler.get_status()['samples'] == 2
+    
+    def test_distinct_stacks_are_bounded(self):
+        """Test stacks beyond max_stacks are counted as dropped"""
+        sampler = StackSampler(max_stacks=0)
+        sampler.sample()
+        
+        assert sampler.counts == {}
+        assert sampler.dropped >= 1
+    
+    def test_timed_session(self):
+        """Test a session with a duration stops on its own"""
+        sampler = StackSampler(interval=0.001)
+        
+        assert sampler.start(duration=0.05) is True
+        assert sampler.start() is False
+        sampler._thread.join(timeout=5)
+        
+        assert sampler.running is False
+        assert sampler.samples > 0
+
+
+class TestRequestProfiler:
+    """Tests for sampled per-request cProfile captures"""
+    
+    def test_sampling_decision(self):
+        """Test the sample rate is applied unless profiling is forced"""
+        profiler = RequestProfiler(sample_rate=0.5, rng=lambda: 0.7)
+        
+        assert profiler.should_profile() is False
+        assert profiler.should_profile(forced=True) is True
+        assert RequestProfiler(sample_rate=0.5, rng=lambda: 0.2).should_profile() is True
+        assert RequestProfiler().should_profile() is False
+    
+    def test_captures_are_bounded(self):
+        """Test only the latest captures are kept and reports name the profiled code"""
+        profiler = RequestProfiler(max_captures=2)
+        for _ in range(3):
+            profile = profiler.start()
+            sorted(range(1000), key=lambda x: -x)
+            profiler.finish(profile, 'GET', '/api/quote', 200, 0.01)
+        
+        assert [capture['id'] for capture in profiler.list()] == [3, 2]
+        assert profiler.report(1) is None
+        assert 'sorted' in profiler.report(3)
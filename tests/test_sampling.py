@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+from app.models import QuoteIndex, QuoteManager
+from app.sampling import FenwickTree, WeightedSampler
+
+
+class TestFenwickTree:
+    """Tests for the binary indexed tree"""
+    
+    def test_prefix_sums_after_updates(self):
+        """Test prefix sums follow point updates"""
+        tree = FenwickTree(6, initial=1)
+        tree.add(2, 4)
+        tree.add(5, 2)
+        
+        assert tree.total() == 12
+        assert tree.prefix_sum(3) == 7
+        assert tree.get(2) == 5
+        assert tree.get(5) == 3
+    
+    def test_find_maps_targets_to_indexes(self):
+        """Test find returns the index owning each unit of weight"""
+        tree = FenwickTree(4)
+        for index, weight in enumerate([2, 0, 3, 1]):
+            tree.add(index, weight)
+        
+        owners = [tree.find(target) for target in range(tree.total())]
+        
+        assert owners == [0, 0, 2, 2, 2, 3]
+
+
+class TestWeightedSampler:
+    """Tests for popularity-weighted draws"""
+    
+    def test_draws_follow_weights(self):
+        """Test a heavily weighted quote dominates the draws"""
+        manager = QuoteManager()
+        index = QuoteIndex(manager.quotes)
+        sampler = WeightedSampler(index)
+        sampler.set_count(index.by_id[8], 999)
+        
+        rng = random.Random(7)
+        draws = Counter(sampler.sample(rng=rng) for _ in range(2000))
+        
+        assert draws[index.by_id[8]] > 1800
+        assert sum(draws.values()) == 2000
+    
+    def test_category_draws_stay_in_category(self):
+        """Test draws restricted to a category only return its quotes"""
+        manager = QuoteManager()
+        index = QuoteIndex(manager.quotes)
+        sampler = WeightedSampler(index)
+        code = index.category_code_by_key['humor']
+        
+        positions = {sampler.sample(code) for _ in range(200)}
+        
+        assert positions <= set(index.by_category['humor'])
+    
+    def test_counts_can_decrease(self):
+        """Test lowering a count restores the base weight"""
+        index = QuoteIndex(QuoteManager().quotes)
+        sampler = WeightedSampler(index)
+        sampler.set_count(0, 50)
+        sampler.set_count(0, 0)
+        
+        assert sampler._categories.total() == len(index.category_codes)
+    
+    def test_manager_weighted_entry(self):
+        """Test QuoteManager routes weighted draws through the sampler"""
+        manager = QuoteManager()
+        manager.set_popularity('favorites', 15, 10_000)
+        
+        ids = Counter(manager.get_random_entry('humor', 'favorites').quote['id']
+                      for _ in range(200))
+        
+        assert ids.most_common(1)[0][0] == 15
+        assert manager.get_random_entry('nonexistent', 'favorites') is None
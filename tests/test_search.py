@@ -0,0 +1,50 @@
+from app.search import SearchIndex, tokenize
+
+
+QUOTES = [
+    {'id': 1, 'text': 'Keep going, keep growing.', 'author': 'Ann Lee', 'category': 'a'},
+    {'id': 2, 'text': 'Going nowhere fast.', 'author': 'Bob Keeper', 'category': 'a'},
+    {'id': 3, 'text': 'Silence is golden.', 'author': 'Anonymous', 'category': 'b'},
+]
+
+
+class TestSearchIndex:
+    """Tests for the inverted index and BM25 ranking"""
+    
+    def test_tokenize(self):
+        """Test tokens are lowercased words without punctuation"""
+        assert tokenize("Don't STOP, now!") == ['don', 't', 'stop', 'now']
+    
+    def test_term_frequency_ranks_higher(self):
+        """Test a quote repeating the term ranks first"""
+        total, page = SearchIndex(QUOTES).search('keep')
+        
+        assert total == 1
+        assert page[0][0] == 0
+    
+    def test_prefix_matching(self):
+        """Test tokens ending in * match every term with that prefix"""
+        index = SearchIndex(QUOTES)
+        
+        total, page = index.search('go*', field='text')
+        
+        assert total == 3
+        assert index.search('go', field='text')[0] == 0
+    
+    def test_field_restriction(self):
+        """Test searching a single field"""
+        index = SearchIndex(QUOTES)
+        
+        assert index.search('keeper', field='text')[0] == 0
+        assert index.search('keeper', field='author')[1][0][0] == 1
+    
+    def test_pagination(self):
+        """Test offset and limit slice the ranked results"""
+        index = SearchIndex(QUOTES)
+        total, first = index.search('go*', limit=2)
+        _, rest = index.search('go*', offset=2, limit=2)
+        
+        assert total == 3
+        assert len(first) == 2
+        assert len(rest) == 1
+        assert {p for p, _ in first}.isdisjoint(p for p, _ in rest)
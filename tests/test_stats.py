@@ -0,0 +1,574 @@
+import os
+import sys
+import threading
+import pytest
+from app.history import RECORD, StatsHistory
+from app.favorites_store import FavoritesLog
+from app.shared_stats import SharedStatsTracker
+from app.stats import RollingCounter, StatsTracker, TopCounter
+
+
+class FakeClock:
+    """Manually advanced clock for time-based stats"""
+    
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """Create a fake clock"""
+    return FakeClock()
+
+
+@pytest.fixture
+def tracker(clock):
+    """Create a StatsTracker driven by the fake clock"""
+    return StatsTracker(clock=clock)
+
+
+class TestRollingCounter:
+    """Tests for the fixed-size bucket ring"""
+    
+    def test_counts_within_window(self):
+        """Test events inside the window are counted"""
+        counter = RollingCounter(slots=10, resolution=1)
+        counter.add(100.2)
+        counter.add(100.7)
+        counter.add(105.0)
+        
+        assert counter.total(105.5, 10) == 3
+        assert counter.total(105.5, 3) == 1
+    
+    def test_stale_slots_are_recycled(self):
+        """Test slots from an older lap of the ring are ignored and reused"""
+        counter = RollingCounter(slots=10, resolution=1)
+        counter.add(100)
+        counter.add(110)
+        
+        assert counter.total(110, 10) == 1
+    
+    def test_memory_is_fixed(self):
+        """Test the ring does not grow with the number of events"""
+        counter = RollingCounter(slots=10, resolution=1)
+        for second in range(1000):
+            counter.add(second)
+        
+        assert len(counter._counts) == 10
+        assert counter.total(999, 10) == 10
+
+
+class TestTopCounter:
+    """Tests for the incrementally maintained top-K"""
+    
+    def test_matches_full_sort(self):
+        """Test the kept leaders equal a full sort of the counts"""
+        counter = TopCounter(k=3)
+        for key in 'abacbdddeeeeeca':
+            counter.add(key)
+        
+        expected = sorted(counter.values(), reverse=True)[:3]
+        assert [count for _, count in counter.most_common()] == expected
+        assert counter.leader() == 'e'
+    
+    def test_new_key_overtakes_last(self):
+        """Test a key outside the top K enters once it passes the K-th count"""
+        counter = TopCounter(k=2)
+        counter.add('a', 5)
+        counter.add('b', 3)
+        counter.add('c', 3)
+        
+        assert counter.most_common() == [('a', 5), ('b', 3)]
+        counter.add('c')
+        assert counter.most_common() == [('a', 5), ('c', 4)]
+    
+    def test_is_a_dict_of_counts(self):
+        """Test the counter still reads like a plain dict of counts"""
+        counter = TopCounter(k=1)
+        counter.add('x')
+        counter.add('y', 2)
+        
+        assert dict(counter) == {'x': 1, 'y': 2}
+        assert counter.most_common(5) == [('y', 2)]
+        assert TopCounter().leader() is None
+
+
+class TestStatsTrackerRates:
+    """Tests for windowed request rates"""
+    
+    def test_qps_windows(self, tracker, clock):
+        """Test overall QPS over 1m, 5m and 1h windows"""
+        for _ in range(60):
+            tracker.record_quote_fetch('wisdom')
+        clock.now += 120
+        for _ in range(60):
+            tracker.record_quote_fetch('humor')
+        
+        qps = tracker.get_stats()['qps']
+        
+        assert qps['1m'] == 1.0
+        assert qps['5m'] == 0.4
+        assert qps['1h'] == round(120 / 3600, 4)
+    
+    def test_category_qps(self, tracker, clock):
+        """Test per-category QPS is reported"""
+        for _ in range(30):
+            tracker.record_quote_fetch('wisdom')
+        
+        stats = tracker.get_stats()
+        
+        assert stats['category_qps']['wisdom']['1m'] == 0.5
+        assert 'humor' not in stats['category_qps']
+    
+    def test_rates_expire(self, tracker, clock):
+        """Test old fetches drop out of every window"""
+        tracker.record_quote_fetch('wisdom')
+        clock.now += 7200
+        
+        stats = tracker.get_stats()
+        
+        assert stats['qps'] == {'1m': 0.0, '5m': 0.0, '1h': 0.0}
+        assert stats['total_quotes_fetched'] == 1
+    
+    def test_reset_clears_rates(self, tracker):
+        """Test reset_stats clears the rate rings"""
+        tracker.record_quote_fetch('wisdom')
+        tracker.reset_stats()
+        
+        stats = tracker.get_stats()
+        
+        assert stats['qps']['1m'] == 0.0
+        assert stats['category_qps'] == {}
+
+
+class TestStatsTrackerLeaders:
+    """Tests for the category, quote and author leaderboards"""
+    
+    def test_top_lists(self, tracker):
+        """Test get_stats reports leaders without scanning every count"""
+        tracker.record_quote_fetch('wisdom', 1, 'Confucius')
+        tracker.record_quote_fetch('humor', 2, 'Mark Twain')
+        tracker.record_quote_fetch('humor', 2, 'Mark Twain')
+        
+        stats = tracker.get_stats()
+        
+        assert stats['most_popular_category'] == 'humor'
+        assert stats['top_categories'] == [{'category': 'humor', 'count': 2},
+                                           {'category': 'wisdom', 'count': 1}]
+        assert stats['top_quotes'][0] == {'quote_id': 2, 'count': 2}
+        assert stats['top_authors'][0] == {'author': 'Mark Twain', 'count': 2}
+    
+    def test_reset_clears_leaders(self, tracker):
+        """Test reset_stats empties the leaderboards"""
+        tracker.record_quote_fetch('humor', 2, 'Mark Twain')
+        tracker.reset_stats()
+        
+        stats = tracker.get_stats()
+        
+        assert stats['most_popular_category'] is None
+        assert stats['top_quotes'] == []
+
+
+class TestStatsTrackerConcurrency:
+    """Stress tests for recording from many threads at once"""
+    
+    THREADS = 8
+    FETCHES = 3000
+    CATEGORIES = ('wisdom', 'humor', 'life')
+    
+    @pytest.fixture(autouse=True)
+    def frequent_switches(self):
+        """Switch threads as often as possible to surface lost updates"""
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        yield
+        sys.setswitchinterval(interval)
+    
+    def hammer(self, tracker, reader=None):
+        """Record fetches from several threads, optionally while reading stats"""
+        start = threading.Barrier(self.THREADS + (reader is not None))
+        done = threading.Event()
+        
+        def writer(index):
+            start.wait()
+            for i in range(self.FETCHES):
+                tracker.record_quote_fetch(self.CATEGORIES[i % 3], i % 50 + 1, f'author{i % 7}')
+                if i % 100 == 0:
+                    tracker.add_favorite(i // 100 + 1, f'client{index}')
+        
+        def read_continuously():
+            start.wait()
+            while not done.is_set():
+                reader()
+        
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(self.THREADS)]
+        if reader is not None:
+            threads.append(threading.Thread(target=read_continuously))
+        for thread in threads:
+            thread.start()
+        for thread in threads[:self.THREADS]:
+            thread.join()
+        done.set()
+        for thread in threads[self.THREADS:]:
+            thread.join()
+    
+    def test_no_lost_fetches(self, tracker):
+        """Test every fetch from every thread is counted while stats are read"""
+        self.hammer(tracker, reader=tracker.get_stats)
+        stats = tracker.get_stats()
+        total = self.THREADS * self.FETCHES
+        
+        assert stats['total_quotes_fetched'] == total
+        assert sum(stats['categories_accessed'].values()) == total
+        assert stats['categories_accessed']['wisdom'] == total // 3
+        assert sum(tracker.quote_fetch_count(quote_id) for quote_id in range(1, 51)) == total
+        assert sum(tracker.popularity_counts()['fetches'].values()) == total
+        assert sum(entry['count'] for entry in stats['top_authors']) == total
+        assert stats['top_quotes'][0]['count'] == tracker.quote_fetch_count(
+            stats['top_quotes'][0]['quote_id'])
+        assert stats['favorite_clients'] == self.THREADS
+        assert tracker.rollup_totals()['favorites'] == self.THREADS * (self.FETCHES // 100)
+    
+    def test_exited_threads_are_retired(self, tracker):
+        """Test shards of finished threads fold into one without losing counts"""
+        for _ in range(20):
+            thread = threading.Thread(target=tracker.record_quote_fetch, args=('wisdom', 1))
+            thread.start()
+            thread.join()
+        tracker.record_quote_fetch('humor', 2)
+        
+        assert len(tracker._shards) <= 2
+        assert tracker.quote_fetch_count(1) == 20
+        stats = tracker.get_stats()
+        assert stats['categories_accessed'] == {'wisdom': 20, 'humor': 1}
+        assert stats['category_qps']['wisdom']['1m'] == round(20 / 60, 4)
+    
+    def test_reset_while_recording(self, tracker):
+        """Test a reset leaves the tracker consistent for later fetches"""
+        self.hammer(tracker, reader=tracker.reset_stats)
+        tracker.reset_stats()
+        tracker.record_quote_fetch('wisdom', 1)
+        
+        assert tracker.get_stats()['total_quotes_fetched'] == 1
+    
+    def run_together(self, *targets):
+        """Run callables on their own threads at once; returns the errors they raised"""
+        start = threading.Barrier(len(targets))
+        errors = []
+        
+        def run(target):
+            start.wait()
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+    
+    def test_concurrent_readers_see_new_categories(self, tracker):
+        """Test readers draining at once never iterate a growing leaderboard"""
+        def write():
+            for i in range(400):
+                tracker.record_quote_fetch(f'category{i}', i % 50 + 1)
+        
+        def read():
+            for _ in range(30):
+                tracker.get_stats()
+        
+        assert self.run_together(write, write, read, read) == []
+        assert tracker.get_stats()['unique_categories_used'] == 400
+    
+    def test_total_never_drops_while_threads_retire(self, tracker):
+        """Test totals read while exited threads are retired only ever go up"""
+        seen = []
+        
+        def spawn():
+            for _ in range(200):
+                thread = threading.Thread(target=tracker.record_quote_fetch, args=('wisdom', 1))
+                thread.start()
+                thread.join()
+        
+        def read():
+            for _ in range(2000):
+                seen.append(tracker.total_fetches)
+        
+        assert self.run_together(spawn, spawn, read) == []
+        assert seen == sorted(seen)
+        assert tracker.total_fetches == 400
+    
+    def test_shared_tracker_threads(self, tmp_path, clock):
+        """Test threads of one worker do not lose updates to its shared shard"""
+        shared = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                    max_categories=4, max_quote_id=100, clock=clock)
+        self.hammer(shared)
+        
+        stats = shared.get_stats()
+        assert stats['total_quotes_fetched'] == self.THREADS * self.FETCHES
+        assert sum(stats['categories_accessed'].values()) == self.THREADS * self.FETCHES
+    
+    def test_shared_categories_registered_concurrently(self, tmp_path, clock):
+        """Test threads registering different categories at once each get a slot"""
+        shared = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                    max_categories=9, max_quote_id=100, clock=clock)
+        
+        errors = self.run_together(*(lambda i=i: shared.record_quote_fetch(f'category{i}')
+                                     for i in range(8)))
+        
+        assert errors == []
+        assert shared.get_stats()['categories_accessed'] == {f'category{i}': 1 for i in range(8)}
+    
+    def test_shared_file_lock_excludes_threads(self, tmp_path, clock):
+        """Test the segment lock also excludes other threads of the same process"""
+        shared = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                    max_categories=4, max_quote_id=100, clock=clock)
+        entered = threading.Event()
+        
+        def lock():
+            with shared._locked():
+                entered.set()
+        
+        thread = threading.Thread(target=lock)
+        with shared._locked():
+            thread.start()
+            assert not entered.wait(0.2)
+        thread.join()
+        assert entered.is_set()
+    
+    def test_shared_favorites_read_while_added(self, tmp_path, clock):
+        """Test favorites can be ranked while other threads add them"""
+        shared = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                    max_categories=4, max_quote_id=5000, clock=clock)
+        
+        def add(offset):
+            return lambda: [shared.add_favorite(quote_id, 'client') for quote_id in
+                            range(offset + 1, 5000, 2)]
+        
+        def read():
+            for _ in range(100):
+                shared.top_favorites()
+                shared.popularity_counts()
+                shared.get_favorites('client')
+        
+        assert self.run_together(add(0), add(1), read) == []
+        assert len(shared.get_favorites('client')) == 4999
+
+
+class TestStatsHistory:
+    """Tests for on-disk stats rollups"""
+    
+    @pytest.fixture
+    def totals(self):
+        """Running totals the history reads at each rollup"""
+        return {'fetches': 0, 'favorites': 0}
+    
+    @pytest.fixture
+    def history(self, tmp_path, totals, clock):
+        """Create a history with minute buckets"""
+        return StatsHistory(str(tmp_path / 'history' / 'stats.bin'), lambda: dict(totals),
+                            clock=clock)
+    
+    def test_rollups_record_deltas(self, history, totals):
+        """Test each bucket holds what was added since the previous one"""
+        totals.update(fetches=5, favorites=1)
+        history.roll_up(now=6030)
+        totals.update(fetches=12, favorites=1)
+        history.roll_up(now=6090)
+        
+        assert history.query(0, 10000) == [
+            {'start': 5940, 'end': 6000, 'fetches': 5, 'favorites': 1},
+            {'start': 6000, 'end': 6060, 'fetches': 7, 'favorites': 0}
+        ]
+    
+    def test_bucket_written_once(self, history, tmp_path, totals, clock):
+        """Test a second rollup of the same bucket, e.g. by another worker, is skipped"""
+        other = StatsHistory(history.path, lambda: dict(totals), clock=clock)
+        totals['fetches'] = 3
+        
+        assert history.roll_up(now=6030) is True
+        assert other.roll_up(now=6045) is False
+        assert history.get_status()['records'] == 1
+    
+    def test_counter_reset_counts_as_new(self, history, totals):
+        """Test a running total that went down starts a new series"""
+        totals['fetches'] = 10
+        history.roll_up(now=6030)
+        totals['fetches'] = 4
+        history.roll_up(now=6090)
+        
+        assert [bucket['fetches'] for bucket in history.query(0, 10000)] == [10, 4]
+    
+    def test_query_granularity_and_range(self, history, totals):
+        """Test buckets are summed to the requested granularity within range"""
+        for minute in range(1, 6):
+            totals['fetches'] = minute * 2
+            history.roll_up(now=minute * 60 + 1)
+        
+        assert history.query(0, 10000, 300) == [
+            {'start': 0, 'end': 300, 'fetches': 10, 'favorites': 0}
+        ]
+        assert [bucket['start'] for bucket in history.query(120, 240)] == [120, 180]
+    
+    def test_compact_downsamples_old_buckets(self, history, totals):
+        """Test minute buckets older than a day merge into hours and keep totals"""
+        for minute in range(1, 121):
+            totals['fetches'] = minute
+            history.roll_up(now=minute * 60 + 1)
+        
+        removed = history.compact(now=3 * 86400)
+        
+        assert removed == 118
+        assert history.query(0, 10000) == [
+            {'start': 0, 'end': 3600, 'fetches': 60, 'favorites': 0},
+            {'start': 3600, 'end': 7200, 'fetches': 60, 'favorites': 0}
+        ]
+    
+    def test_torn_record_is_dropped(self, history, totals):
+        """Test a partial record left by a crash is ignored and overwritten"""
+        totals['fetches'] = 2
+        history.roll_up(now=6030)
+        with open(history.path, 'ab') as f:
+            f.write(b'\x01' * (RECORD.size // 2))
+        
+        totals['fetches'] = 5
+        history.roll_up(now=6090)
+        
+        assert [bucket['fetches'] for bucket in history.query(0, 10000)] == [2, 3]
+
+
+class TestSharedStatsTracker:
+    """Tests for stats shared between worker processes"""
+    
+    @pytest.fixture
+    def shared(self, tmp_path, clock):
+        """Create a small shared stats segment"""
+        return SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                  max_categories=4, max_quote_id=100, clock=clock)
+    
+    def test_counts_and_favorites(self, shared):
+        """Test the shared tracker matches the in-process stats shape"""
+        shared.record_quote_fetch('wisdom')
+        shared.record_quote_fetch('wisdom')
+        shared.record_quote_fetch('humor')
+        shared.add_favorite(3)
+        shared.add_favorite(3)
+        
+        stats = shared.get_stats()
+        
+        assert stats['total_quotes_fetched'] == 3
+        assert stats['categories_accessed'] == {'wisdom': 2, 'humor': 1}
+        assert stats['most_popular_category'] == 'wisdom'
+        assert stats['total_favorites'] == 1
+        assert stats['qps']['1m'] == 0.05
+        assert shared.get_favorites() == [3]
+    
+    def test_categories_overflow(self, shared):
+        """Test categories beyond the table are counted under 'other'"""
+        for category in ('wisdom', 'humor', 'life', 'love', 'x' * 100, 'wisdom'):
+            shared.record_quote_fetch(category)
+        
+        stats = shared.get_stats()
+        
+        assert stats['categories_accessed'] == {'wisdom': 2, 'humor': 1, 'life': 1, 'other': 2}
+        assert stats['total_quotes_fetched'] == 6
+    
+    def test_invalid_favorites_rejected(self, shared):
+        """Test ids outside the bitmap are rejected"""
+        assert shared.add_favorite(0) is False
+        assert shared.add_favorite(101) is False
+        assert shared.add_favorite('1') is False
+    
+    def test_totals_across_processes(self, shared, tmp_path, clock):
+        """Test fetches recorded in a forked worker appear in the totals"""
+        shared.record_quote_fetch('wisdom')
+        shared.add_favorite(1)
+        
+        pid = os.fork()
+        if pid == 0:
+            shared.record_quote_fetch('humor')
+            shared.add_favorite(7)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        
+        reader = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4,
+                                    max_categories=4, max_quote_id=100, clock=clock)
+        stats = reader.get_stats()
+        
+        assert stats['total_quotes_fetched'] == 2
+        assert stats['categories_accessed'] == {'wisdom': 1, 'humor': 1}
+        assert reader.get_favorites() == [1, 7]
+        assert reader.rollup_totals() == {'fetches': 2, 'favorites': 2}
+    
+    def test_leaders_across_processes(self, shared, tmp_path, clock):
+        """Test top quotes and authors sum every worker's fetches"""
+        shared.record_quote_fetch('wisdom', 1, 'Seneca')
+        shared.record_quote_fetch('wisdom', 2, 'Seneca')
+        
+        pid = os.fork()
+        if pid == 0:
+            shared.record_quote_fetch('humor', 2, 'Twain')
+            shared.record_quote_fetch('humor', 2, 'Twain')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        
+        stats = SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4, max_categories=4,
+                                   max_quote_id=100, clock=clock).get_stats()
+        
+        assert stats['top_quotes'] == [{'quote_id': 2, 'count': 3}, {'quote_id': 1, 'count': 1}]
+        assert stats['top_authors'] == [{'author': 'Seneca', 'count': 2},
+                                        {'author': 'Twain', 'count': 2}]
+    
+    def test_leaders_kept_when_shard_taken_over(self, shared, tmp_path, clock):
+        """Test a worker reusing an exited worker's shard keeps its published leaders"""
+        pid = os.fork()
+        if pid == 0:
+            shared.record_quote_fetch('humor', 4, 'Twain')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        
+        pid = os.fork()
+        if pid == 0:
+            shared.record_quote_fetch('humor', 4, 'Twain')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        
+        assert shared.get_stats()['top_quotes'] == [{'quote_id': 4, 'count': 2}]
+    
+    def test_client_favorites_across_processes(self, tmp_path, clock):
+        """Test a client's favorites added in one worker are served by another"""
+        def worker():
+            return SharedStatsTracker(str(tmp_path / 'stats'), max_workers=4, max_categories=4,
+                                      max_quote_id=100, clock=clock,
+                                      favorites_store=FavoritesLog(str(tmp_path / 'favorites')))
+        
+        first = worker()
+        pid = os.fork()
+        if pid == 0:
+            worker().add_favorite(7, 'alice')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        
+        assert first.get_favorites('alice') == [7]
+        assert first.add_favorite(7, 'alice') is True
+        assert first.favorite_count(7) == 1
+        assert first.rollup_totals()['favorites'] == 1
+        assert first.get_stats()['favorite_clients'] == 1
+    
+    def test_reset_stats(self, shared):
+        """Test reset clears counters, categories and favorites"""
+        shared.record_quote_fetch('wisdom')
+        shared.add_favorite(5)
+        shared.reset_stats()
+        shared.record_quote_fetch('humor')
+        
+        stats = shared.get_stats()
+        
+        assert stats['categories_accessed'] == {'humor': 1}
+        assert stats['total_favorites'] == 0
@@ -0,0 +1,87 @@
+import time
+from app.telemetry import TelemetryPipeline, parse_sample_rates
+
+
+class RecordingExporter:
+    """Exporter that keeps every batch it receives"""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def __call__(self, batch):
+        self.batches.append(list(batch))
+    
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+class TestTelemetryPipeline:
+    """Tests for the batched telemetry pipeline"""
+    
+    def test_events_are_flushed_in_batches(self):
+        """Test flush exports queued events in batch_size chunks"""
+        exporter = RecordingExporter()
+        pipeline = TelemetryPipeline(exporter, batch_size=2, flush_interval=60)
+        for i in range(5):
+            pipeline.log_event('quote_fetched', {'quote_id': i})
+        
+        pipeline.flush()
+        
+        assert [len(batch) for batch in exporter.batches] == [2, 2, 1]
+        assert exporter.events[0] == ('quote_fetched', {'quote_id': 0})
+        assert pipeline.get_counters()['flushed'] == 5
+    
+    def test_background_flusher(self):
+        """Test the flusher thread exports without an explicit flush"""
+        exporter = RecordingExporter()
+        pipeline = TelemetryPipeline(exporter, flush_interval=0.01)
+        pipeline.log_event('health_check')
+        
+        deadline = time.time() + 2
+        while not exporter.events and time.time() < deadline:
+            time.sleep(0.01)
+        
+        assert exporter.events == [('health_check', None)]
+    
+    def test_drop_oldest_when_full(self):
+        """Test a full queue drops the oldest events"""
+        exporter = RecordingExporter()
+        pipeline = TelemetryPipeline(exporter, max_queue=3, batch_size=10, flush_interval=60)
+        for i in range(5):
+            pipeline.log_event('event', {'n': i})
+        
+        pipeline.flush()
+        
+        assert [props['n'] for _, props in exporter.events] == [2, 3, 4]
+        assert pipeline.get_counters()['dropped'] == 2
+    
+    def test_sampling_per_event_type(self):
+        """Test events are sampled by their configured rate"""
+        exporter = RecordingExporter()
+        pipeline = TelemetryPipeline(exporter, flush_interval=60,
+                                     sample_rates={'health_check': 0.0})
+        pipeline.log_event('health_check')
+        pipeline.log_event('quote_fetched')
+        
+        pipeline.flush()
+        
+        assert exporter.events == [('quote_fetched', None)]
+        assert pipeline.get_counters()['sampled_out'] == 1
+    
+    def test_exporter_errors_are_counted(self):
+        """Test a failing exporter does not raise"""
+        def failing(batch):
+            raise RuntimeError('exporter down')
+        
+        pipeline = TelemetryPipeline(failing, flush_interval=60)
+        pipeline.log_event('event')
+        pipeline.flush()
+        
+        assert pipeline.get_counters()['export_errors'] == 1
+    
+    def test_parse_sample_rates(self):
+        """Test sample rate parsing clamps and skips bad entries"""
+        rates = parse_sample_rates('health_check=0.1, quote_fetched=2,bad=x,')
+        
+        assert rates == {'health_check': 0.1, 'quote_fetched': 1.0}